@@ -6,7 +6,11 @@ from memory_profiler import profile
 from stochastic_service_composition.declare_utils import *
 from stochastic_service_composition.composition_mdp import composition_mdp
 from stochastic_service_composition.composition_mdp import comp_mdp
-from mdp_dp_rl.algorithms.dp.dp_analytic import DPAnalytic
+from stochastic_service_composition.batched_composition import comp_mdp_batched
+from stochastic_service_composition.checkpoint import Checkpoint
+from stochastic_service_composition.progress import ProgressMonitor
+from stochastic_service_composition.state_space import COMP_MDP, EXPLICIT, CompositionBudget, admit, estimate_state_space
+from src.experiment import GammaSweep
 from src.ceramic.utils import print_policy_data
 from src.ceramic.setup import *
 import os
@@ -20,48 +24,58 @@ if not os.path.exists('experimental_results'):
 config_json = json.load(open('config.json', 'r'))
 mode = config_json['mode']
 size = config_json['size']
-gamma = config_json['gamma']
 serialize = config_json['serialize']
+# optional memory budget (LTLf mode): the composition falls back to comp_mdp_batched if the
+# estimate of comp_mdp exceeds it, and is refused if the one of comp_mdp_batched exceeds it too
+max_memory_mb = config_json.get('max_memory_mb')
+# optional checkpoint interval (in seconds): the composition and the policy computations (with the
+# value_iteration solver) resume from their latest checkpoint (one file per computation, deleted
+# when the run completes)
+checkpoint_interval = config_json.get('checkpoint_interval')
+checkpoint = Checkpoint(f'checkpoint_{mode}_{size}.pkl', checkpoint_interval) if checkpoint_interval is not None else None
+# progress report every progress_interval seconds; optional wall-clock budget (in seconds) of the
+# whole run (composition and policies): the computation in progress is stopped when it is exhausted
+monitor = ProgressMonitor(print, config_json.get('progress_interval', 60), config_json.get('time_budget'))
 
 now = datetime.now().strftime("%d_%m_%Y-%H_%M_%S")
 
 directory = f"experimental_results"
-file_name = f"{directory}/{now}_time_profiler_{mode}_{size}_{gamma}.txt"
+# either a single discount factor or a list of them (gamma sweep): the
+# composition MDP is computed once and solved for every discount factor
+sweep = GammaSweep(config_json, mode, size, now, monitor, directory)
+gammas = sweep.gammas
+gamma = gammas[0]
+file_name = sweep.time_profilers[gamma]
 fp_compMDP = f"{directory}/{now}_memory_profiler_composition_{mode}_{size}_{gamma}.log"
-fp_DPAnalytic = f"{directory}/{now}_memory_profiler_policy_{mode}_{size}_{gamma}.log"
 
 # AUTOMATA
 @profile(stream=open(fp_compMDP, "w+"))
 def execute_composition_automata(target, services):
-    mdp = composition_mdp(target, *services, gamma=gamma)
+    mdp = composition_mdp(target, *services, gamma=gamma, checkpoint=checkpoint, monitor=monitor)
     return mdp
 
 # LTLf
 @profile(stream=open(fp_compMDP, "w+"))
-def execute_composition_ltlf(declare_automaton, services):
-    mdp = comp_mdp(declare_automaton, services, gamma=gamma)
+def execute_composition_ltlf(declare_automaton, services, strategy=COMP_MDP):
+    if strategy == EXPLICIT:
+        # the same MDP, without the system service (but without checkpoints)
+        mdp = comp_mdp_batched(declare_automaton, services, gamma=gamma, monitor=monitor)
+    else:
+        mdp = comp_mdp(declare_automaton, services, gamma=gamma, checkpoint=checkpoint, monitor=monitor)
     return mdp
 
-# POLICY
-@profile(stream=open(fp_DPAnalytic, "w+"))
-def execute_policy(mdp):
-    mdp.gamma = gamma
-    opn = DPAnalytic(mdp, 1e-4)
-    opt_policy = opn.get_optimal_policy_vi()
-    return opt_policy
-    
 def main():
-    to_write = f"Mode: {mode}\nSize: {size}\nGamma: {gamma}\nSerialize: {serialize}"
-    with open(file_name, "w+") as f:
-        f.write(f"{to_write}\n")
-    print(to_write)
+    for g in gammas:
+        to_write = f"Mode: {mode}\nSize: {size}\nGamma: {g}\nSerialize: {serialize}\nSolver: {sweep.solver}"
+        with open(sweep.time_profilers[g], "w+") as f:
+            f.write(f"{to_write}\n")
+    print(f"Mode: {mode}\nSize: {size}\nGamma: {gammas}\nSerialize: {serialize}\nSolver: {sweep.solver}")
 
     all_services = process_services(size)
     target = target_service_automata() if mode == "automata" else target_service_ltlf()
 
     to_write = f"Tot_services: {len(all_services)}"
-    with open(file_name, "a") as f:
-        f.write(f"{to_write}\n")
+    sweep.write(to_write)
     print(to_write)
     
     print("Services created.\nStarting composition...")
@@ -80,25 +94,14 @@ def main():
             now = time.time_ns()
             mdp = execute_composition_automata(target, all_services)
             elapsed1 = (time.time_ns() - now) / 10 ** 9
-            if serialize:
+            if serialize and mdp is not None:
                 #save mdp into a pickle file
                 try:
                     with open(f'mdp_{mode}_{size}.pkl', 'wb') as f:
                         pickle.dump(mdp, f, pickle.HIGHEST_PROTOCOL)
                 except Exception as e:
                     print(e)
-        states = len(mdp.all_states)
-        with open(file_name, "a") as f:
-            to_write = f"MDP states: {states}\nComposition elapsed time: {elapsed1} s\n"
-            f.write(to_write)
-        print("Number of states: ", states)
-        print("Composition MDP computed.\nStarting computing policy...")
-        now = time.time_ns()
-        opt_policy = execute_policy(mdp)
-        elapsed2 = (time.time_ns() - now) / 10 ** 9
-        with open(file_name, "a") as f:
-            to_write = f"Policy elapsed time: {elapsed2} s\n"
-            f.write(to_write)
+        opt_policies = sweep.run(mdp, elapsed1)
     # LTLf
     elif mode == "ltlf":
         # check if the pickle file exists and has size > 0
@@ -109,34 +112,40 @@ def main():
                 mdp = pickle.load(f)
             elapsed1 = 0
         else:
+            strategy = COMP_MDP
+            if max_memory_mb is not None:
+                estimate = estimate_state_space(target, all_services)
+                # only the strategies that build the explicit MDP: the policies are computed (and
+                # profiled) on it, while the kronecker and lazy compositions do not give one
+                decision = admit(estimate, CompositionBudget(max_bytes=max_memory_mb * 2 ** 20), [COMP_MDP, EXPLICIT])
+                print(f"Estimate: {estimate.summary()}")
+                print(f"Composition {decision.reason}")
+                if not decision.admitted:
+                    sweep.write(f"Execution refused: {decision.reason}")
+                    return
+                strategy = decision.strategy
             print("MDP not computed yet. Computing...")
             now = time.time_ns()
-            mdp = execute_composition_ltlf(target, all_services)
+            mdp = execute_composition_ltlf(target, all_services, strategy)
             elapsed1 = (time.time_ns() - now) / 10 ** 9
-            if serialize:
+            if serialize and mdp is not None:
                 #save mdp into a pickle file
                 try:
                     with open(f'mdp_{mode}_{size}.pkl', 'wb') as f:
                         pickle.dump(mdp, f, pickle.HIGHEST_PROTOCOL)
                 except Exception as e:
                     print(e)
-        states = len(mdp.all_states)
-        with open(file_name, "a") as f:
-            to_write = f"MDP states: {states}\nComposition elapsed time: {elapsed1} s\n"
-            f.write(to_write)
-        print("Number of states: ", states)
-        print("Composition MDP computed.\nStarting computing policy...")
-        now = time.time_ns()
-        opt_policy = execute_policy(mdp)
-        elapsed2 = (time.time_ns() - now) / 10 ** 9
-        with open(file_name, "a") as f:
-            to_write = f"Policy elapsed time: {elapsed2} s\n"
-            f.write(to_write)
+        opt_policies = sweep.run(mdp, elapsed1)
     
     print("Policy computed.")
+    # the run is over (unless it was stopped): the checkpoints are not needed anymore
+    if not monitor.stopped:
+        if checkpoint is not None:
+            checkpoint.clear()
+        sweep.clear_checkpoints()
 
     #print("Writing policy...")
-    #print_policy_data(opt_policy, file_name=file_name)
+    #print_policy_data(opt_policies[gamma].det_policy(), file_name=file_name)
 
     print("Done.")
             
@@ -1,4 +1,5 @@
 import glob
+import os
 import pandas as pd
 
 if __name__ == "__main__":
@@ -16,9 +17,14 @@ if __name__ == "__main__":
                 n_services = 0
                 n_states = 0
                 for gamma in gammas:
-                    fn_comp = glob.glob(f"../{case_study}/experimental_results/*memory_profiler_composition_{mode}_{dimension}_{gamma}.log")[0]
-                    fn_policy = glob.glob(f"../{case_study}/experimental_results/*memory_profiler_policy_{mode}_{dimension}_{gamma}.log")[0]
-                    fn_time = glob.glob(f"../{case_study}/experimental_results/*time_profiler_{mode}_{dimension}_{gamma}.txt")[0]
+                    # the latest run for this gamma; its "{now}" prefix identifies the
+                    # other logs of the same run
+                    fn_time = max(glob.glob(f"../{case_study}/experimental_results/*_time_profiler_{mode}_{dimension}_{gamma}.txt"),
+                                  key=os.path.getmtime)
+                    prefix = fn_time[:fn_time.rindex("_time_profiler_")]
+                    # a gamma sweep computes (and profiles) the composition only for its first gamma
+                    fn_comp = glob.glob(f"{prefix}_memory_profiler_composition_{mode}_{dimension}_*.log")[0]
+                    fn_policy = f"{prefix}_memory_profiler_policy_{mode}_{dimension}_{gamma}.log"
                     with open(fn_comp, 'r') as file:
                         file_lines = file.readlines()
                     if mem_comp == 0:
@@ -0,0 +1,61 @@
+"""
+Replay benchmark of the orchestration policy of a case study (LTLf mode).
+
+Run from the root of the repository, e.g.:
+
+    python -m src.eval_utils.replay_benchmark --case-study motor --size small --rate 10000
+"""
+import argparse
+import importlib
+import json
+
+from mdp_dp_rl.algorithms.dp.dp_analytic import DPAnalytic
+
+from stochastic_service_composition.composition_mdp import comp_mdp
+from stochastic_service_composition.policy_compression import CompressedPolicy
+from stochastic_service_composition.policy_runtime import PolicyRuntime
+from stochastic_service_composition.replay_benchmark import (
+    DictPolicy,
+    generate_trace,
+    load_trace,
+    replay,
+    save_trace,
+)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--case-study", choices=["ceramic", "chip", "motor"], default="motor")
+    parser.add_argument("--size", choices=["xsmall", "small", "medium", "large"], default="xsmall")
+    parser.add_argument("--gamma", type=float, default=0.9)
+    parser.add_argument("--events", type=int, default=100000, help="length of the generated trace")
+    parser.add_argument("--rate", type=float, nargs="*", default=[None],
+                        help="event rates (events/s) to replay at; none for as fast as possible")
+    parser.add_argument("--trace", help="replay this trace instead of generating one")
+    parser.add_argument("--save-trace", help="save the generated trace to this file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    setup = importlib.import_module(f"src.{args.case_study}.setup")
+    services = setup.process_services(args.size)
+    dfa = setup.target_service_ltlf()
+    mdp = comp_mdp(dfa, services, gamma=args.gamma)
+    det_policy = DPAnalytic(mdp, 1e-4).get_optimal_policy_vi()
+
+    policies = {
+        "dict": DictPolicy(det_policy.policy_data),
+        "runtime": PolicyRuntime.from_policy(det_policy, services),
+        "tree": CompressedPolicy.from_policy(det_policy, services),
+    }
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = generate_trace(policies["runtime"], services, dfa, args.events, args.seed)
+        if args.save_trace:
+            save_trace(trace, args.save_trace)
+
+    print(f"Case study: {args.case_study}\nSize: {args.size}\nMDP states: {len(mdp.all_states)}")
+    print(f"Trace events: {len(trace)}")
+    for rate in args.rate:
+        for name, policy in policies.items():
+            report = replay(policy, trace, rate)
+            print(json.dumps({"policy": name, **report.summary()}))
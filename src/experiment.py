@@ -0,0 +1,116 @@
+"""
+Driver shared by the case-study scripts: the policies of a composition MDP,
+computed and profiled for every discount factor of the configuration.
+
+The policies are computed with DPAnalytic (as in the paper) unless the
+configuration sets ``solver`` to ``value_iteration``: the vectorized value
+iteration of this package, with the same stopping rule, which can be
+checkpointed and stopped by the progress monitor. The MDP is converted to an
+ArrayMDP once, before (and outside of) the profiled policy computations.
+"""
+import time
+
+from mdp_dp_rl.algorithms.dp.dp_analytic import DPAnalytic
+from memory_profiler import profile
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.checkpoint import Checkpoint
+from stochastic_service_composition.solvers import value_iteration
+
+DP_ANALYTIC = "DPAnalytic"
+VALUE_ITERATION = "value_iteration"
+SOLVERS = (DP_ANALYTIC, VALUE_ITERATION)
+# the tolerance on successive differences, for both solvers
+TOLERANCE = 1e-4
+
+
+class GammaSweep:
+    """The policy computations of a run, one per discount factor, with their profilers."""
+
+    def __init__(self, config, mode, size, now, monitor, directory="experimental_results"):
+        """
+        Initialize the sweep.
+
+        :param config: the configuration of the run (the content of config.json).
+        :param mode: the mode of the run (automata or ltlf).
+        :param size: the size of the run.
+        :param now: the timestamp of the run, prefix of the profiler files.
+        :param monitor: the progress monitor of the run.
+        :param directory: the directory of the profiler files.
+        """
+        gamma = config["gamma"]
+        # either a single discount factor or a list of them
+        self.gammas = gamma if isinstance(gamma, list) else [gamma]
+        self.solver = config.get("solver", DP_ANALYTIC)
+        assert self.solver in SOLVERS, f"unknown solver {self.solver}"
+        self.monitor = monitor
+        self.time_profilers = {
+            g: f"{directory}/{now}_time_profiler_{mode}_{size}_{g}.txt" for g in self.gammas
+        }
+        self.memory_profilers = {
+            g: f"{directory}/{now}_memory_profiler_policy_{mode}_{size}_{g}.log" for g in self.gammas
+        }
+        # only value_iteration can resume from a checkpoint
+        interval = config.get("checkpoint_interval")
+        self.checkpoints = {}
+        if interval is not None and self.solver == VALUE_ITERATION:
+            self.checkpoints = {
+                g: Checkpoint(f"checkpoint_{mode}_{size}_{g}.pkl", interval) for g in self.gammas
+            }
+
+    def write(self, text):
+        """Append a line to the time profiler of every discount factor."""
+        for file_name in self.time_profilers.values():
+            with open(file_name, "a") as f:
+                f.write(f"{text}\n")
+
+    def solve(self, mdp, gamma):
+        """Compute the policy for a discount factor (mdp is an ArrayMDP for value_iteration)."""
+        if self.solver == VALUE_ITERATION:
+            return value_iteration(
+                mdp, gamma, TOLERANCE, checkpoint=self.checkpoints.get(gamma), monitor=self.monitor
+            )
+        mdp.gamma = gamma
+        return DPAnalytic(mdp, TOLERANCE).get_optimal_policy_vi()
+
+    def run(self, mdp, composition_time):
+        """
+        Compute and profile the policies of a composition MDP, for every discount factor.
+
+        :param mdp: the composition MDP, or None if the composition has been stopped.
+        :param composition_time: the time of the composition, in seconds.
+        :return: the policy of every discount factor, until the first stopped one.
+        """
+        if mdp is None:
+            self.write(f"Execution stopped: {self.monitor.stop_reason}")
+            print(f"Composition stopped: {self.monitor.stop_reason}")
+            return {}
+        states = len(mdp.all_states)
+        self.write(f"MDP states: {states}\nComposition elapsed time: {composition_time} s")
+        print("Number of states: ", states)
+        if self.solver == VALUE_ITERATION:
+            now = time.time_ns()
+            mdp = ArrayMDP.from_mdp(mdp)
+            self.write(f"Conversion elapsed time: {(time.time_ns() - now) / 10 ** 9} s")
+        print("Composition MDP computed.\nStarting computing policy...")
+        opt_policies = {}
+        for g in self.gammas:
+            print(f"Gamma: {g}")
+            with open(self.memory_profilers[g], "w+") as stream:
+                now = time.time_ns()
+                opt_policies[g] = profile(self.solve, stream=stream)(mdp, g)
+                elapsed = (time.time_ns() - now) / 10 ** 9
+            with open(self.time_profilers[g], "a") as f:
+                f.write(f"Policy elapsed time: {elapsed} s\n")
+                if self.monitor.stopped:
+                    f.write(f"Execution stopped: {self.monitor.stop_reason}\n")
+            if self.monitor.stopped:
+                # the policy has not converged, and the next ones would be stopped at once
+                print(f"Policy stopped: {self.monitor.stop_reason}")
+                break
+        return opt_policies
+
+    def clear_checkpoints(self):
+        """Delete the checkpoints of the policies."""
+        for checkpoint in self.checkpoints.values():
+            checkpoint.clear()
@@ -0,0 +1,300 @@
+"""This module implements an array-backed (CSR) representation of MDPs."""
+from typing import Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+from mdp_dp_rl.processes.det_policy import DetPolicy
+from mdp_dp_rl.processes.mdp import MDP
+
+from stochastic_service_composition.types import Action, MDPDynamics, State
+
+NO_ACTION = -1
+
+
+class ArrayMDP:
+    """
+    An MDP stored in compressed sparse row format.
+
+    States are indexed from 0 to nb_states - 1. The state-action pairs of state
+    s are the indices in range(state_action_ptr[s], state_action_ptr[s + 1]),
+    and the transitions of the state-action pair k are the indices in
+    range(transition_ptr[k], transition_ptr[k + 1]).
+    """
+
+    def __init__(
+        self,
+        states: Sequence[State],
+        actions: Sequence[Action],
+        state_action_ptr: np.ndarray,
+        sa_actions: np.ndarray,
+        sa_rewards: np.ndarray,
+        transition_ptr: np.ndarray,
+        next_states: np.ndarray,
+        probs: np.ndarray,
+        gamma: float,
+        initial_state: Optional[State] = None,
+    ):
+        """
+        Initialize the MDP.
+
+        :param states: the states, in index order.
+        :param actions: the action labels; state-action pairs refer to them by index.
+        :param state_action_ptr: the offsets of the state-action pairs of each state.
+        :param sa_actions: the action (index) of each state-action pair.
+        :param sa_rewards: the reward of each state-action pair.
+        :param transition_ptr: the offsets of the transitions of each state-action pair.
+        :param next_states: the next state (index) of each transition.
+        :param probs: the probability of each transition.
+        :param gamma: the discount factor.
+        :param initial_state: the initial state, if any.
+        """
+        self.states: List[State] = list(states)
+        self.state_index: Dict[State, int] = {
+            state: idx for idx, state in enumerate(self.states)
+        }
+        self.actions: List[Action] = list(actions)
+        self.state_action_ptr = np.asarray(state_action_ptr, dtype=np.int64)
+        self.sa_actions = np.asarray(sa_actions, dtype=np.int64)
+        self.sa_rewards = np.asarray(sa_rewards, dtype=np.float64)
+        self.transition_ptr = np.asarray(transition_ptr, dtype=np.int64)
+        self.next_states = np.asarray(next_states, dtype=np.int64)
+        self.probs = np.asarray(probs, dtype=np.float64)
+        self.gamma = gamma
+        self.initial_state = initial_state
+
+        # inverse maps, used by the vectorized backups
+        self.sa_states = np.repeat(
+            np.arange(self.nb_states, dtype=np.int64), np.diff(self.state_action_ptr)
+        )
+        self.transition_sas = np.repeat(
+            np.arange(self.nb_state_actions, dtype=np.int64),
+            np.diff(self.transition_ptr),
+        )
+
+    @property
+    def nb_states(self) -> int:
+        """Get the number of states."""
+        return len(self.states)
+
+    @property
+    def nb_state_actions(self) -> int:
+        """Get the number of state-action pairs."""
+        return len(self.sa_actions)
+
+    @property
+    def nb_transitions(self) -> int:
+        """Get the number of transitions."""
+        return len(self.next_states)
+
+    @classmethod
+    def from_dynamics(
+        cls,
+        dynamics: MDPDynamics,
+        gamma: float,
+        initial_state: Optional[State] = None,
+    ) -> "ArrayMDP":
+        """
+        Build the MDP from its dynamics.
+
+        :param dynamics: the transition function, as accepted by mdp_dp_rl.MDP.
+        :param gamma: the discount factor.
+        :param initial_state: the initial state, if any.
+        :return: the array-backed MDP.
+        """
+        states = list(dynamics.keys())
+        state_index = {state: idx for idx, state in enumerate(states)}
+        action_index: Dict[Action, int] = {}
+        state_action_ptr = [0]
+        sa_actions: List[int] = []
+        sa_rewards: List[float] = []
+        transition_ptr = [0]
+        next_states: List[int] = []
+        probs: List[float] = []
+        for state in states:
+            for action, (next_state_dist, reward) in dynamics[state].items():
+                sa_actions.append(action_index.setdefault(action, len(action_index)))
+                sa_rewards.append(reward)
+                for next_state, prob in next_state_dist.items():
+                    next_states.append(state_index[next_state])
+                    probs.append(prob)
+                transition_ptr.append(len(next_states))
+            state_action_ptr.append(len(sa_actions))
+        return ArrayMDP(
+            states,
+            list(action_index.keys()),
+            np.array(state_action_ptr),
+            np.array(sa_actions),
+            np.array(sa_rewards, dtype=np.float64),
+            np.array(transition_ptr),
+            np.array(next_states),
+            np.array(probs, dtype=np.float64),
+            gamma,
+            initial_state,
+        )
+
+    @classmethod
+    def from_mdp(cls, mdp: MDP) -> "ArrayMDP":
+        """
+        Build the array-backed version of an mdp_dp_rl MDP.
+
+        :param mdp: the MDP, e.g. the output of comp_mdp or composition_mdp.
+        :return: the array-backed MDP.
+        """
+        dynamics: MDPDynamics = {
+            state: {
+                action: (next_states, mdp.rewards[state][action])
+                for action, next_states in mdp.transitions.get(state, {}).items()
+            }
+            for state in mdp.all_states
+        }
+        return cls.from_dynamics(dynamics, mdp.gamma, getattr(mdp, "initial_state", None))
+
+    def restrict(self, sa_mask: np.ndarray) -> "ArrayMDP":
+        """
+        Get the MDP with only some of the state-action pairs.
+
+        :param sa_mask: whether each state-action pair is kept.
+        :return: the restricted MDP, with the same states and action labels.
+        """
+        counts = np.bincount(self.sa_states[sa_mask], minlength=self.nb_states)
+        transition_mask = sa_mask[self.transition_sas]
+        transition_counts = np.diff(self.transition_ptr)[sa_mask]
+        return ArrayMDP(
+            self.states,
+            self.actions,
+            np.concatenate([[0], np.cumsum(counts)]),
+            self.sa_actions[sa_mask],
+            self.sa_rewards[sa_mask],
+            np.concatenate([[0], np.cumsum(transition_counts)]),
+            self.next_states[transition_mask],
+            self.probs[transition_mask],
+            self.gamma,
+            self.initial_state,
+        )
+
+    def to_dynamics(self) -> MDPDynamics:
+        """Get the transition function, as accepted by mdp_dp_rl.MDP."""
+        dynamics: MDPDynamics = {}
+        for s, state in enumerate(self.states):
+            dynamics[state] = {}
+            for k in range(self.state_action_ptr[s], self.state_action_ptr[s + 1]):
+                start, end = self.transition_ptr[k], self.transition_ptr[k + 1]
+                dynamics[state][self.actions[self.sa_actions[k]]] = (
+                    {
+                        self.states[next_state]: prob
+                        for next_state, prob in zip(
+                            self.next_states[start:end].tolist(),
+                            self.probs[start:end].tolist(),
+                        )
+                    },
+                    float(self.sa_rewards[k]),
+                )
+        return dynamics
+
+    def q_values(self, values: np.ndarray, gamma: Optional[float] = None) -> np.ndarray:
+        """
+        Compute the Q-value of every state-action pair.
+
+        :param values: the value of every state.
+        :param gamma: the discount factor (default: the one of the MDP).
+        :return: the Q-values, one per state-action pair.
+        """
+        gamma = self.gamma if gamma is None else gamma
+        expected = np.bincount(
+            self.transition_sas,
+            weights=self.probs * values[self.next_states],
+            minlength=self.nb_state_actions,
+        )
+        return self.sa_rewards + gamma * expected
+
+    def greedy(self, q_values: np.ndarray) -> np.ndarray:
+        """
+        Compute the greedy policy with respect to some Q-values.
+
+        :param q_values: the Q-value of every state-action pair (one column
+          per scenario, if it is a matrix).
+        :return: the chosen state-action pair of every state (NO_ACTION if none).
+        """
+        best = segment_max(q_values, self.state_action_ptr, empty=-np.inf)
+        indices = np.arange(self.nb_state_actions).reshape(
+            (-1,) + (1,) * (q_values.ndim - 1)
+        )
+        candidates = np.where(
+            q_values >= best[self.sa_states], indices, self.nb_state_actions
+        )
+        policy = segment_min(candidates, self.state_action_ptr, empty=NO_ACTION)
+        return policy.astype(np.int64)
+
+    def value_function(self, values: np.ndarray) -> Dict[State, float]:
+        """Get the value function as a dictionary from states to values."""
+        return dict(zip(self.states, values.tolist()))
+
+    def policy_actions(self, policy: np.ndarray) -> Dict[State, Action]:
+        """Get the action chosen by a policy (given as state-action pairs) in every state."""
+        return {
+            state: self.actions[self.sa_actions[k]]
+            for state, k in zip(self.states, policy.tolist())
+            if k != NO_ACTION
+        }
+
+    def value_vector(self, values: Mapping[State, float], default: float = 0.0) -> np.ndarray:
+        """
+        Get a value function, given as a dictionary, as a vector.
+
+        :param values: the value of (some of) the states.
+        :param default: the value of the states missing from the dictionary.
+        :return: the value of every state.
+        """
+        return np.array(
+            [values.get(state, default) for state in self.states], dtype=np.float64
+        )
+
+    def policy_vector(self, policy: Mapping[State, Action]) -> np.ndarray:
+        """
+        Get the state-action pairs chosen by a policy, given as a dictionary.
+
+        :param policy: the action chosen in (some of) the states.
+        :return: the chosen state-action pair of every state (NO_ACTION if the
+          state is missing from the policy, or the action is not available).
+        """
+        result = np.full(self.nb_states, NO_ACTION, dtype=np.int64)
+        for s, state in enumerate(self.states):
+            if state not in policy:
+                continue
+            for k in range(self.state_action_ptr[s], self.state_action_ptr[s + 1]):
+                if self.actions[self.sa_actions[k]] == policy[state]:
+                    result[s] = k
+                    break
+        return result
+
+    def det_policy(self, policy: np.ndarray) -> DetPolicy:
+        """Get a policy (given as state-action pairs) as a DetPolicy object."""
+        return DetPolicy(self.policy_actions(policy))
+
+
+def segment_max(values: np.ndarray, ptr: np.ndarray, empty: float = 0.0) -> np.ndarray:
+    """
+    Compute the maximum of each segment values[ptr[i]:ptr[i + 1]].
+
+    :param values: the values.
+    :param ptr: the segment offsets (length: number of segments + 1).
+    :param empty: the result for empty segments.
+    :return: the maximum of each segment.
+    """
+    return _segment_reduce(np.maximum, values, ptr, empty)
+
+
+def segment_min(values: np.ndarray, ptr: np.ndarray, empty: float = 0.0) -> np.ndarray:
+    """Compute the minimum of each segment values[ptr[i]:ptr[i + 1]]."""
+    return _segment_reduce(np.minimum, values, ptr, empty)
+
+
+def _segment_reduce(ufunc, values: np.ndarray, ptr: np.ndarray, empty) -> np.ndarray:
+    # segments are taken along the first axis, so values can be a matrix
+    nb_segments = len(ptr) - 1
+    result = np.full(
+        (nb_segments,) + values.shape[1:], empty, dtype=np.result_type(values, type(empty))
+    )
+    non_empty = ptr[1:] > ptr[:-1]
+    if non_empty.any():
+        result[non_empty] = ufunc.reduceat(values, ptr[:-1][non_empty], axis=0)
+    return result
@@ -0,0 +1,315 @@
+"""
+This module implements asynchronous value iteration on array-backed MDPs.
+
+- Gauss-Seidel value iteration: the states are ordered by a backward
+  breadth-first search from the goal states (see goal_states), and the
+  values are updated in place, one BFS layer at a time (layers are backed up
+  with vectorized Jacobi updates, reading the values already updated in the
+  previous layers). Rewards collected near the goal thus propagate back
+  through a whole target chain in a single sweep.
+- Prioritized sweeping: single states are backed up in order of priority,
+  where the priority of a state is an upper bound on its Bellman residual,
+  maintained from the value changes of its successors.
+"""
+import heapq
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from stochastic_service_composition.array_mdp import ArrayMDP, segment_max
+from stochastic_service_composition.solvers import (
+    DEFAULT_TOLERANCE,
+    SolverResult,
+    bellman_backup,
+)
+from stochastic_service_composition.types import State
+
+
+def goal_states(mdp: ArrayMDP) -> np.ndarray:
+    """
+    Get the default roots of the backward search, when the target is unknown.
+
+    This is a heuristic: these are the states with a positive-reward action
+    if any, otherwise the absorbing states (without actions, or only with
+    self-loops). In the composition MDPs of comp_mdp, goal rewards are
+    usually offset by the service costs, and the absorbing states are the
+    sink and the dead-ends: their values are fixed, and every other value
+    is computed from them.
+
+    :param mdp: the MDP.
+    :return: the indices of the root states.
+    """
+    positive = np.unique(mdp.sa_states[mdp.sa_rewards > 0.0])
+    if len(positive) > 0:
+        return positive
+    return absorbing_states(mdp)
+
+
+def absorbing_states(mdp: ArrayMDP) -> np.ndarray:
+    """
+    Get the states that cannot be left (without actions, or only with self-loops).
+
+    :param mdp: the MDP.
+    :return: the indices of the absorbing states.
+    """
+    sources = mdp.sa_states[mdp.transition_sas]
+    leaving = np.bincount(sources[mdp.next_states != sources], minlength=mdp.nb_states)
+    return np.flatnonzero(leaving == 0)
+
+
+def accepting_states(mdp: ArrayMDP, accepting: Iterable[State]) -> List[State]:
+    """
+    Get the states of a comp_mdp composition whose DFA state is accepting.
+
+    :param mdp: the composition MDP, with states ((s_1, ..., s_n), q).
+    :param accepting: the accepting states of the DFA.
+    :return: the composition states (to be used as roots of the backward search).
+    """
+    accepting = set(accepting)
+    return [
+        state
+        for state in mdp.states
+        if isinstance(state, tuple) and len(state) == 2 and state[1] in accepting
+    ]
+
+
+def backward_bfs_layers(
+    mdp: ArrayMDP, roots: Optional[Iterable[State]] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Order the states by a backward breadth-first search from some roots.
+
+    :param mdp: the MDP.
+    :param roots: the root states (default: goal_states).
+    :return: the state indices in BFS order, and the offsets of the layers in
+      it; states that cannot reach the roots form the last layer.
+    """
+    if roots is None:
+        root_indices = goal_states(mdp)
+    else:
+        root_indices = np.array([mdp.state_index[state] for state in roots], dtype=np.int64)
+    sources = mdp.sa_states[mdp.transition_sas]
+    targets = mdp.next_states
+
+    visited = np.zeros(mdp.nb_states, dtype=bool)
+    visited[root_indices] = True
+    frontier = np.zeros(mdp.nb_states, dtype=bool)
+    frontier[root_indices] = True
+    layers: List[np.ndarray] = [np.unique(root_indices)]
+    while True:
+        predecessors = np.unique(sources[frontier[targets]])
+        predecessors = predecessors[~visited[predecessors]]
+        if len(predecessors) == 0:
+            break
+        layers.append(predecessors)
+        visited[predecessors] = True
+        frontier[:] = False
+        frontier[predecessors] = True
+    unreached = np.flatnonzero(~visited)
+    if len(unreached) > 0:
+        layers.append(unreached)
+    layers = [layer for layer in layers if len(layer) > 0]
+    layer_ptr = np.concatenate([[0], np.cumsum([len(layer) for layer in layers])])
+    order = np.concatenate(layers) if layers else np.zeros(0, dtype=np.int64)
+    return order, layer_ptr.astype(np.int64)
+
+
+def permute_states(mdp: ArrayMDP, order: np.ndarray) -> ArrayMDP:
+    """
+    Get the same MDP with the states in a different order.
+
+    :param mdp: the MDP.
+    :param order: the old index of every new state.
+    :return: the permuted MDP.
+    """
+    new_index = np.empty(mdp.nb_states, dtype=np.int64)
+    new_index[order] = np.arange(mdp.nb_states)
+
+    sa_counts = np.diff(mdp.state_action_ptr)[order]
+    state_action_ptr = np.concatenate([[0], np.cumsum(sa_counts)])
+    old_sas = np.repeat(mdp.state_action_ptr[order] - state_action_ptr[:-1], sa_counts)
+    old_sas += np.arange(state_action_ptr[-1])
+
+    transition_counts = np.diff(mdp.transition_ptr)[old_sas]
+    transition_ptr = np.concatenate([[0], np.cumsum(transition_counts)])
+    old_transitions = np.repeat(
+        mdp.transition_ptr[old_sas] - transition_ptr[:-1], transition_counts
+    )
+    old_transitions += np.arange(transition_ptr[-1])
+
+    return ArrayMDP(
+        [mdp.states[i] for i in order.tolist()],
+        mdp.actions,
+        state_action_ptr,
+        mdp.sa_actions[old_sas],
+        mdp.sa_rewards[old_sas],
+        transition_ptr,
+        new_index[mdp.next_states[old_transitions]],
+        mdp.probs[old_transitions],
+        mdp.gamma,
+        mdp.initial_state,
+    )
+
+
+def _backup_range(
+    mdp: ArrayMDP, values: np.ndarray, start: int, end: int, gamma: float
+) -> np.ndarray:
+    """Compute the Bellman backup of the states in range(start, end)."""
+    sa_start, sa_end = mdp.state_action_ptr[start], mdp.state_action_ptr[end]
+    tr_start, tr_end = mdp.transition_ptr[sa_start], mdp.transition_ptr[sa_end]
+    expected = np.bincount(
+        mdp.transition_sas[tr_start:tr_end] - sa_start,
+        weights=mdp.probs[tr_start:tr_end] * values[mdp.next_states[tr_start:tr_end]],
+        minlength=sa_end - sa_start,
+    )
+    q_values = mdp.sa_rewards[sa_start:sa_end] + gamma * expected
+    return segment_max(
+        q_values, mdp.state_action_ptr[start : end + 1] - sa_start, empty=0.0
+    )
+
+
+def gauss_seidel_value_iteration(
+    mdp: ArrayMDP,
+    gamma: Optional[float] = None,
+    tol: float = DEFAULT_TOLERANCE,
+    max_iterations: Optional[int] = None,
+    roots: Optional[Iterable[State]] = None,
+    accepting: Optional[Iterable[State]] = None,
+) -> SolverResult:
+    """
+    Run in-place value iteration, in backward BFS order from the goal states.
+
+    Iteration stops when the maximum change of a value in a sweep is below
+    the tolerance.
+
+    By default the search starts from goal_states, not from the accepting
+    states of the target: in a comp_mdp composition the accepting states
+    still have actions (the target can go on), so their values are not
+    known first, and all of them end up in a single Jacobi layer. On motor
+    small with a branching target (929 states, 400 of them accepting), the
+    accepting roots need as many sweeps as value iteration (89), against 49
+    from the default roots. The accepting roots can still be chosen with
+    the accepting argument, e.g. for targets whose accepting states are
+    final.
+
+    :param mdp: the MDP.
+    :param gamma: the discount factor (default: the one of the MDP).
+    :param tol: the tolerance on successive differences.
+    :param max_iterations: the maximum number of sweeps, if any.
+    :param roots: the roots of the backward search (default: the
+      accepting_states of the composition if accepting is given, otherwise
+      goal_states).
+    :param accepting: the accepting states of the target DFA, if known.
+    :return: the values and the greedy policy.
+    """
+    gamma = mdp.gamma if gamma is None else gamma
+    if roots is None and accepting is not None:
+        roots = accepting_states(mdp, accepting)
+    order, layer_ptr = backward_bfs_layers(mdp, roots)
+    permuted = permute_states(mdp, order)
+    layers = list(zip(layer_ptr[:-1].tolist(), layer_ptr[1:].tolist()))
+
+    values = np.zeros(mdp.nb_states)
+    residual = np.inf
+    iterations = 0
+    while max_iterations is None or iterations < max_iterations:
+        residual = 0.0
+        for start, end in layers:
+            layer_values = _backup_range(permuted, values, start, end, gamma)
+            layer_residual = np.max(np.abs(layer_values - values[start:end]), initial=0.0)
+            residual = max(residual, float(layer_residual))
+            values[start:end] = layer_values
+        iterations += 1
+        if residual < tol:
+            break
+
+    original_values = np.empty(mdp.nb_states)
+    original_values[order] = values
+    policy = mdp.greedy(mdp.q_values(original_values, gamma))
+    return SolverResult(
+        mdp,
+        original_values,
+        policy,
+        iterations,
+        iterations * mdp.nb_states,
+        residual,
+        gamma,
+    )
+
+
+def prioritized_sweeping(
+    mdp: ArrayMDP,
+    gamma: Optional[float] = None,
+    tol: float = DEFAULT_TOLERANCE,
+    max_backups: Optional[int] = None,
+) -> SolverResult:
+    """
+    Run prioritized sweeping.
+
+    The priority of a state is an upper bound on its Bellman residual: it is
+    reset to 0 when the state is backed up, and increased by gamma * p * |dv|
+    when a successor (reached with probability p) changes its value by dv.
+    The states are backed up in order of priority until all the priorities
+    are below the tolerance, hence on termination every Bellman residual is
+    below the tolerance, as with value iteration.
+
+    :param mdp: the MDP.
+    :param gamma: the discount factor (default: the one of the MDP).
+    :param tol: the tolerance on the Bellman residuals.
+    :param max_backups: the maximum number of single-state backups, if any.
+    :return: the values and the greedy policy; iterations counts the
+      equivalent number of full sweeps.
+    """
+    gamma = mdp.gamma if gamma is None else gamma
+    state_action_ptr = mdp.state_action_ptr.tolist()
+    transition_ptr = mdp.transition_ptr.tolist()
+    next_states = mdp.next_states.tolist()
+    probs = mdp.probs.tolist()
+    sa_rewards = mdp.sa_rewards.tolist()
+
+    # predecessors of every state, with the probability of the transition
+    sources = mdp.sa_states[mdp.transition_sas]
+    by_target = np.argsort(mdp.next_states, kind="stable")
+    predecessor_ptr = np.concatenate(
+        [[0], np.cumsum(np.bincount(mdp.next_states, minlength=mdp.nb_states))]
+    ).tolist()
+    predecessors = sources[by_target].tolist()
+    predecessor_probs = mdp.probs[by_target].tolist()
+
+    # the first priorities are the residuals of the zero value function
+    values_array = np.zeros(mdp.nb_states)
+    priorities = np.abs(bellman_backup(mdp, values_array, gamma)).tolist()
+    values = values_array.tolist()
+    backups = mdp.nb_states
+    queue = [(-priority, s) for s, priority in enumerate(priorities) if priority >= tol]
+    heapq.heapify(queue)
+
+    while queue and (max_backups is None or backups < max_backups):
+        negative_priority, s = heapq.heappop(queue)
+        if -negative_priority != priorities[s]:
+            continue  # stale entry
+        best = None
+        for k in range(state_action_ptr[s], state_action_ptr[s + 1]):
+            q_value = sa_rewards[k]
+            for t in range(transition_ptr[k], transition_ptr[k + 1]):
+                q_value += gamma * probs[t] * values[next_states[t]]
+            if best is None or q_value > best:
+                best = q_value
+        new_value = 0.0 if best is None else best
+        backups += 1
+        change = abs(new_value - values[s])
+        values[s] = new_value
+        priorities[s] = 0.0
+        if change == 0.0:
+            continue
+        for j in range(predecessor_ptr[s], predecessor_ptr[s + 1]):
+            predecessor = predecessors[j]
+            priorities[predecessor] += gamma * predecessor_probs[j] * change
+            if priorities[predecessor] >= tol:
+                heapq.heappush(queue, (-priorities[predecessor], predecessor))
+
+    values_array = np.array(values)
+    residual = max(priorities, default=0.0)
+    policy = mdp.greedy(mdp.q_values(values_array, gamma))
+    iterations = -(-backups // max(mdp.nb_states, 1))
+    return SolverResult(mdp, values_array, policy, iterations, backups, residual, gamma)
@@ -0,0 +1,316 @@
+"""
+This module implements backward induction over the strongly connected components of an MDP.
+
+The optimal value of a state only depends on the values of its successors.
+Hence, the strongly connected components (SCCs) of the transition graph can be
+solved one at a time, in reverse topological order, once the values of all
+their successor components are known:
+
+- a single state whose only cycles are self-loops is solved exactly, with the
+  closed form Q(a) = (r(a) + gamma * sum_{s' != s} p(s' | a) V(s')) / (1 - gamma * p(s | a));
+- a cyclic component is solved by value iteration restricted to its states,
+  the transitions leaving it contributing a constant expected value.
+
+Components with the same depth in the condensation DAG are independent: the
+single-state ones are solved together with vectorized operations, and the
+cyclic ones with a single value iteration over their union. For
+an acyclic MDP (e.g. the composition of an automata target without loops),
+the result is exact and computed in a single reverse-topological pass.
+"""
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from stochastic_service_composition.array_mdp import ArrayMDP, segment_max
+from stochastic_service_composition.asynchronous_solvers import permute_states
+from stochastic_service_composition.solvers import (
+    DEFAULT_TOLERANCE,
+    SolverResult,
+    value_iteration,
+)
+
+
+class BackwardInductionResult(SolverResult):
+    """The output of backward induction, with statistics on the components."""
+
+    def __init__(
+        self,
+        mdp: ArrayMDP,
+        values: np.ndarray,
+        policy: np.ndarray,
+        iterations: int,
+        backups: int,
+        residual: float,
+        gamma: float,
+        nb_components: int,
+        nb_cyclic_components: int,
+        largest_component: int,
+    ):
+        """
+        Initialize the result.
+
+        :param mdp: the solved MDP.
+        :param values: the value of every state.
+        :param policy: the chosen state-action pair of every state.
+        :param iterations: the number of levels of the condensation DAG.
+        :param backups: the number of state backups performed.
+        :param residual: the largest final residual of the cyclic components (0 if none).
+        :param gamma: the discount factor.
+        :param nb_components: the number of strongly connected components.
+        :param nb_cyclic_components: the number of components solved iteratively.
+        :param largest_component: the number of states of the largest component.
+        """
+        super().__init__(mdp, values, policy, iterations, backups, residual, gamma)
+        self.nb_components = nb_components
+        self.nb_cyclic_components = nb_cyclic_components
+        self.largest_component = largest_component
+
+    @property
+    def is_acyclic(self) -> bool:
+        """Check whether the MDP has no cycles other than self-loops."""
+        return self.nb_cyclic_components == 0
+
+
+def _successor_graph(mdp: ArrayMDP) -> Tuple[List[int], List[int]]:
+    """Get the successor lists of the states (without duplicates and self-loops), in CSR."""
+    sources = mdp.sa_states[mdp.transition_sas]
+    targets = mdp.next_states
+    proper = sources != targets
+    edges = np.unique(sources[proper] * mdp.nb_states + targets[proper])
+    edge_sources, edge_targets = np.divmod(edges, mdp.nb_states)
+    ptr = np.concatenate(
+        [[0], np.cumsum(np.bincount(edge_sources, minlength=mdp.nb_states))]
+    )
+    return ptr.tolist(), edge_targets.tolist()
+
+
+class _TarjanSearch:
+    """The state of Tarjan's algorithm, with an iterative depth-first search."""
+
+    def __init__(self, mdp: ArrayMDP):
+        """Initialize the search on the transition graph of an MDP."""
+        self.ptr, self.successors = _successor_graph(mdp)
+        self.index = [-1] * mdp.nb_states
+        self.lowlink = [0] * mdp.nb_states
+        self.on_stack = [False] * mdp.nb_states
+        self.component = [-1] * mdp.nb_states
+        self.stack: List[int] = []
+        self.counter = 0
+        self.nb_components = 0
+
+    def _discover(self, state: int) -> None:
+        """Number a newly visited state and push it on the stack."""
+        self.index[state] = self.lowlink[state] = self.counter
+        self.counter += 1
+        self.stack.append(state)
+        self.on_stack[state] = True
+
+    def _pop_component(self, state: int) -> None:
+        """Pop the component rooted at a state from the stack."""
+        while True:
+            member = self.stack.pop()
+            self.on_stack[member] = False
+            self.component[member] = self.nb_components
+            if member == state:
+                break
+        self.nb_components += 1
+
+    def visit(self, root: int) -> None:
+        """Find the components of the states reachable from a root."""
+        if self.index[root] != -1:
+            return
+        # iterative DFS: (state, position of the next successor to visit)
+        work = [(root, self.ptr[root])]
+        self._discover(root)
+        while work:
+            state, position = work[-1]
+            if position < self.ptr[state + 1]:
+                work[-1] = (state, position + 1)
+                successor = self.successors[position]
+                if self.index[successor] == -1:
+                    self._discover(successor)
+                    work.append((successor, self.ptr[successor]))
+                elif self.on_stack[successor]:
+                    self.lowlink[state] = min(self.lowlink[state], self.index[successor])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                self.lowlink[parent] = min(self.lowlink[parent], self.lowlink[state])
+            if self.lowlink[state] == self.index[state]:
+                self._pop_component(state)
+
+
+def strongly_connected_components(mdp: ArrayMDP) -> Tuple[np.ndarray, int]:
+    """
+    Compute the strongly connected components of the transition graph (Tarjan).
+
+    :param mdp: the MDP.
+    :return: the component of every state, and the number of components;
+      components are numbered in reverse topological order (a component only
+      reaches components with a smaller number).
+    """
+    search = _TarjanSearch(mdp)
+    for root in range(mdp.nb_states):
+        search.visit(root)
+    return np.array(search.component, dtype=np.int64), search.nb_components
+
+
+def _component_levels(
+    mdp: ArrayMDP, component: np.ndarray, nb_components: int
+) -> np.ndarray:
+    """Get the depth of every component in the condensation DAG (0 for the bottom ones)."""
+    sources = component[mdp.sa_states[mdp.transition_sas]]
+    targets = component[mdp.next_states]
+    proper = sources != targets
+    edges = np.unique(sources[proper] * nb_components + targets[proper])
+    edge_sources, edge_targets = np.divmod(edges, nb_components)
+    ptr = np.concatenate(
+        [[0], np.cumsum(np.bincount(edge_sources, minlength=nb_components))]
+    ).tolist()
+    edge_targets = edge_targets.tolist()
+    levels = [0] * nb_components
+    # successors of a component have smaller numbers
+    for c in range(nb_components):
+        for j in range(ptr[c], ptr[c + 1]):
+            levels[c] = max(levels[c], levels[edge_targets[j]] + 1)
+    return np.array(levels, dtype=np.int64)
+
+
+def _solve_singletons(
+    mdp: ArrayMDP, values: np.ndarray, start: int, end: int, gamma: float
+) -> np.ndarray:
+    """Solve exactly the states in range(start, end), whose only cycles are self-loops."""
+    sa_start, sa_end = mdp.state_action_ptr[start], mdp.state_action_ptr[end]
+    tr_start, tr_end = mdp.transition_ptr[sa_start], mdp.transition_ptr[sa_end]
+    transition_sas = mdp.transition_sas[tr_start:tr_end]
+    next_states = mdp.next_states[tr_start:tr_end]
+    probs = mdp.probs[tr_start:tr_end]
+    self_loop = next_states == mdp.sa_states[transition_sas]
+    minlength = sa_end - sa_start
+    self_probs = np.bincount(
+        transition_sas[self_loop] - sa_start,
+        weights=probs[self_loop],
+        minlength=minlength,
+    )
+    expected = np.bincount(
+        transition_sas[~self_loop] - sa_start,
+        weights=probs[~self_loop] * values[next_states[~self_loop]],
+        minlength=minlength,
+    )
+    q_values = (mdp.sa_rewards[sa_start:sa_end] + gamma * expected) / (
+        1.0 - gamma * self_probs
+    )
+    return segment_max(
+        q_values, mdp.state_action_ptr[start : end + 1] - sa_start, empty=0.0
+    )
+
+
+def _solve_components(
+    mdp: ArrayMDP,
+    values: np.ndarray,
+    start: int,
+    end: int,
+    gamma: float,
+    tol: float,
+    max_iterations: Optional[int],
+) -> SolverResult:
+    """Solve the independent cyclic components in range(start, end) by value iteration."""
+    sa_start, sa_end = mdp.state_action_ptr[start], mdp.state_action_ptr[end]
+    tr_start, tr_end = mdp.transition_ptr[sa_start], mdp.transition_ptr[sa_end]
+    transition_sas = mdp.transition_sas[tr_start:tr_end] - sa_start
+    next_states = mdp.next_states[tr_start:tr_end]
+    probs = mdp.probs[tr_start:tr_end]
+    internal = (next_states >= start) & (next_states < end)
+    # the transitions leaving the components give a constant expected value
+    external = np.bincount(
+        transition_sas[~internal],
+        weights=probs[~internal] * values[next_states[~internal]],
+        minlength=sa_end - sa_start,
+    )
+    transition_counts = np.bincount(transition_sas[internal], minlength=sa_end - sa_start)
+    component = ArrayMDP(
+        range(end - start),
+        mdp.actions,
+        mdp.state_action_ptr[start : end + 1] - sa_start,
+        mdp.sa_actions[sa_start:sa_end],
+        mdp.sa_rewards[sa_start:sa_end] + gamma * external,
+        np.concatenate([[0], np.cumsum(transition_counts)]),
+        next_states[internal] - start,
+        probs[internal],
+        gamma,
+    )
+    return value_iteration(component, gamma, tol, max_iterations)
+
+
+def backward_induction(
+    mdp: ArrayMDP,
+    gamma: Optional[float] = None,
+    tol: float = DEFAULT_TOLERANCE,
+    max_iterations: Optional[int] = None,
+) -> BackwardInductionResult:
+    """
+    Solve an MDP by backward induction over its strongly connected components.
+
+    :param mdp: the MDP.
+    :param gamma: the discount factor (default: the one of the MDP).
+    :param tol: the tolerance of value iteration on the cyclic components.
+    :param max_iterations: the maximum number of sweeps on a cyclic component, if any.
+    :return: the values and the greedy policy.
+    """
+    gamma = mdp.gamma if gamma is None else gamma
+    assert 0.0 <= gamma < 1.0, "backward induction needs a discount factor less than 1"
+    component, nb_components = strongly_connected_components(mdp)
+    levels = _component_levels(mdp, component, nb_components)
+    sizes = np.bincount(component, minlength=nb_components)
+
+    # states sorted by level, then single-state components first, then by
+    # component: the cyclic components of a level form a contiguous range,
+    # and they are independent (a component only reaches lower levels)
+    cyclic = sizes[component] > 1
+    order = np.lexsort((component, cyclic, levels[component]))
+    permuted = permute_states(mdp, order)
+    nb_levels = int(levels.max(initial=-1)) + 1
+    sorted_levels = levels[component[order]]
+    level_ptr = np.concatenate(
+        [[0], np.cumsum(np.bincount(sorted_levels, minlength=nb_levels))]
+    )
+    cyclic_ptr = level_ptr[1:] - np.bincount(
+        sorted_levels[cyclic[order]], minlength=nb_levels
+    )
+
+    values = np.zeros(mdp.nb_states)
+    residual = 0.0
+    backups = 0
+    for level in range(nb_levels):
+        start, cyclic_start, end = (
+            int(level_ptr[level]), int(cyclic_ptr[level]), int(level_ptr[level + 1])
+        )
+        if cyclic_start > start:
+            values[start:cyclic_start] = _solve_singletons(
+                permuted, values, start, cyclic_start, gamma
+            )
+            backups += cyclic_start - start
+        if end > cyclic_start:
+            result = _solve_components(
+                permuted, values, cyclic_start, end, gamma, tol, max_iterations
+            )
+            values[cyclic_start:end] = result.values
+            residual = max(residual, result.residual)
+            backups += result.backups
+
+    original_values = np.empty(mdp.nb_states)
+    original_values[order] = values
+    policy = mdp.greedy(mdp.q_values(original_values, gamma))
+    return BackwardInductionResult(
+        mdp,
+        original_values,
+        policy,
+        nb_levels,
+        backups,
+        residual,
+        gamma,
+        nb_components,
+        int(np.count_nonzero(sizes > 1)),
+        int(sizes.max(initial=0)),
+    )
@@ -0,0 +1,343 @@
+"""
+This module implements a layer-synchronous, vectorized version of comp_mdp.
+
+Composition states are encoded as integers (see encoding.StateEncoder), and a
+whole BFS layer is expanded at once with NumPy arithmetic on the mixed-radix
+digits, instead of popping one state at a time from a queue.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from mdp_dp_rl.processes.mdp import MDP
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.composition_mdp import (
+    COMPOSITION_MDP_SINK_STATE,
+    COMPOSITION_MDP_UNDEFINED_ACTION,
+    DEFAULT_GAMMA,
+)
+from stochastic_service_composition.encoding import StateEncoder
+from stochastic_service_composition.progress import ProgressMonitor
+from stochastic_service_composition.services import Service, reachable_states
+from stochastic_service_composition.types import Action, MDPDynamics, State
+
+# local states that can be used as initial state of the system (see comp_mdp)
+INITIAL_LOCAL_STATES = {"re", "av", "br"}
+
+
+class LocalTransition:
+    """A transition of a single service, with local states as indices."""
+
+    def __init__(
+        self,
+        service_id: int,
+        state: int,
+        symbol: int,
+        action_id: int,
+        reward: float,
+        next_states: np.ndarray,
+        probs: np.ndarray,
+    ):
+        """
+        Initialize the local transition.
+
+        :param service_id: the index of the service.
+        :param state: the index of the local start state.
+        :param symbol: the index of the symbol in CompositionTables.symbols.
+        :param action_id: the index of the action (symbol, service_id) in CompositionTables.actions.
+        :param reward: the reward of the service action.
+        :param next_states: the indices of the local next states.
+        :param probs: the probabilities of the local next states.
+        """
+        self.service_id = service_id
+        self.state = state
+        self.symbol = symbol
+        self.action_id = action_id
+        self.reward = reward
+        self.next_states = next_states
+        self.probs = probs
+
+
+class CompositionTables:
+    """Integer lookup tables that drive the vectorized expansion of comp_mdp."""
+
+    def __init__(self, dfa: SimpleDFA, services: Sequence[Service]):
+        """
+        Compile the tables.
+
+        :param dfa: the (trimmed) target DFA.
+        :param services: the community of services.
+        """
+        self.encoder = StateEncoder(services, list(dfa.states))
+        encoder = self.encoder
+        nb_dfa_states = encoder.nb_dfa_states
+
+        self.symbols: List[Action] = sorted(
+            set().union(*(service.actions for service in services)), key=str
+        )
+        symbol_index = {symbol: idx for idx, symbol in enumerate(self.symbols)}
+        self.tau_symbols = np.array(
+            [symbol not in dfa.alphabet for symbol in self.symbols], dtype=bool
+        )
+
+        # next DFA state for each (DFA state, symbol); -1 if undefined.
+        # tau symbols do not progress the DFA.
+        self.next_dfa = np.full((nb_dfa_states, len(self.symbols)), -1, dtype=np.int64)
+        for q, q_idx in encoder.dfa_state_index.items():
+            for symbol_idx in np.flatnonzero(self.tau_symbols):
+                self.next_dfa[q_idx, symbol_idx] = q_idx
+            for symbol, next_q in dfa.transition_function.get(q, {}).items():
+                if symbol in symbol_index:
+                    self.next_dfa[q_idx, symbol_index[symbol]] = encoder.dfa_state_index[
+                        next_q
+                    ]
+        self.accepting = np.array(
+            [dfa.is_accepting(q) for q in encoder.dfa_states], dtype=np.float64
+        )
+
+        # allowed[q, i] is True iff service i can do one of the next DFA actions from q
+        self.allowed = np.zeros((nb_dfa_states, len(services)), dtype=bool)
+        for q, q_idx in encoder.dfa_state_index.items():
+            next_dfa_actions = set(dfa.transition_function.get(q, {}).keys())
+            for service_id, service in enumerate(services):
+                self.allowed[q_idx, service_id] = (
+                    len(next_dfa_actions.intersection(service.actions)) > 0
+                )
+        self.sink = np.logical_not(self.allowed.any(axis=1))
+
+        self.actions: List[Action] = []
+        self.local_transitions: List[LocalTransition] = []
+        for service_id, service in enumerate(services):
+            state_index = encoder.service_state_index[service_id]
+            for state, transitions in service.transition_function.items():
+                for symbol, (next_states, reward) in transitions.items():
+                    next_state_ids = np.array(
+                        [state_index[s] for s in next_states.keys()], dtype=np.int64
+                    )
+                    probs = np.array(list(next_states.values()), dtype=np.float64)
+                    assert (probs > 0.0).all()
+                    self.local_transitions.append(
+                        LocalTransition(
+                            service_id,
+                            state_index[state],
+                            symbol_index[symbol],
+                            len(self.actions),
+                            float(reward),
+                            next_state_ids,
+                            probs,
+                        )
+                    )
+                    self.actions.append((symbol, service_id))
+        self.undefined_action_id = len(self.actions)
+        self.actions.append(COMPOSITION_MDP_UNDEFINED_ACTION)
+
+    def initial_codes(self, dfa: SimpleDFA, services: Sequence[Service]) -> np.ndarray:
+        """
+        Compute the codes of the initial states, as in comp_mdp.
+
+        These are the reachable system states whose components are all
+        ready/available/broken, paired with the initial DFA state.
+
+        :param dfa: the (trimmed) target DFA.
+        :param services: the community of services.
+        :return: the sorted array of initial codes.
+        """
+        encoder = self.encoder
+        initial_dfa_code = encoder.dfa_state_index[dfa.initial_state]
+        system_initial_state = tuple(service.initial_state for service in services)
+        codes = np.array([initial_dfa_code], dtype=np.int64)
+        for service_id, service in enumerate(services):
+            state_index = encoder.service_state_index[service_id]
+            choices = np.array(
+                sorted(
+                    state_index[s]
+                    for s in reachable_states(service)
+                    if s in INITIAL_LOCAL_STATES
+                ),
+                dtype=np.int64,
+            )
+            codes = (
+                codes[:, None] + choices[None, :] * encoder.strides[service_id]
+            ).ravel()
+        initial_code = encoder.encode(system_initial_state, dfa.initial_state)
+        return np.union1d(codes, [initial_code])
+
+    def expand(
+        self, frontier: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Expand a batch of states.
+
+        :param frontier: the codes of the states to expand.
+        :return: the arrays (source, action id, destination, probability, reward),
+          one entry per MDP transition. Sink transitions have destination
+          COMPOSITION_MDP_SINK_STATE.
+        """
+        encoder = self.encoder
+        dfa_idx = encoder.dfa_digits(frontier)
+        sources, action_ids, destinations, probs, rewards = [], [], [], [], []
+
+        sink_sources = frontier[self.sink[dfa_idx]]
+        if len(sink_sources) > 0:
+            sources.append(sink_sources)
+            action_ids.append(np.full(len(sink_sources), self.undefined_action_id))
+            destinations.append(np.full(len(sink_sources), COMPOSITION_MDP_SINK_STATE))
+            probs.append(np.ones(len(sink_sources)))
+            rewards.append(np.zeros(len(sink_sources)))
+
+        digits_cache: Dict[int, np.ndarray] = {}
+        for local in self.local_transitions:
+            i = local.service_id
+            if i not in digits_cache:
+                digits_cache[i] = encoder.service_digits(frontier, i)
+            selected = (digits_cache[i] == local.state) & self.allowed[dfa_idx, i]
+            if not selected.any():
+                continue
+            cur_dfa = dfa_idx[selected]
+            next_dfa = self.next_dfa[cur_dfa, local.symbol]
+            valid = next_dfa >= 0
+            if not valid.any():
+                continue
+            src = frontier[selected][valid]
+            cur_dfa = cur_dfa[valid]
+            next_dfa = next_dfa[valid]
+            goal_reward = (
+                np.zeros(len(src))
+                if self.tau_symbols[local.symbol]
+                else self.accepting[next_dfa]
+            )
+            reward = goal_reward + local.reward
+            base = src + (next_dfa - cur_dfa) - local.state * encoder.strides[i]
+            for next_state, prob in zip(local.next_states.tolist(), local.probs.tolist()):
+                sources.append(src)
+                action_ids.append(np.full(len(src), local.action_id))
+                destinations.append(base + next_state * encoder.strides[i])
+                probs.append(np.full(len(src), prob))
+                rewards.append(reward)
+
+        if len(sources) == 0:
+            empty_int = np.zeros(0, dtype=np.int64)
+            empty_float = np.zeros(0, dtype=np.float64)
+            return empty_int, empty_int, empty_int, empty_float, empty_float
+        return (
+            np.concatenate(sources).astype(np.int64),
+            np.concatenate(action_ids).astype(np.int64),
+            np.concatenate(destinations).astype(np.int64),
+            np.concatenate(probs),
+            np.concatenate(rewards),
+        )
+
+
+def _is_in_sorted(sorted_array: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Check membership of values in a sorted array."""
+    if len(sorted_array) == 0:
+        return np.zeros(len(values), dtype=bool)
+    positions = np.searchsorted(sorted_array, values)
+    positions[positions == len(sorted_array)] = 0
+    return sorted_array[positions] == values
+
+
+def build_transition_function(
+    tables: CompositionTables,
+    sources: np.ndarray,
+    action_ids: np.ndarray,
+    destinations: np.ndarray,
+    probs: np.ndarray,
+    rewards: np.ndarray,
+) -> MDPDynamics:
+    """
+    Build the MDP dynamics, with decoded states, from the transition arrays.
+
+    :param tables: the composition tables.
+    :param sources: the source codes.
+    :param action_ids: the action ids.
+    :param destinations: the destination codes.
+    :param probs: the transition probabilities.
+    :param rewards: the rewards.
+    :return: the MDP dynamics, as returned by comp_mdp.
+    """
+    order = np.lexsort((action_ids, sources))
+    sources, action_ids, destinations = sources[order], action_ids[order], destinations[order]
+    probs, rewards = probs[order], rewards[order]
+
+    all_codes = np.unique(np.concatenate([sources, destinations]))
+    all_codes = all_codes[all_codes != COMPOSITION_MDP_SINK_STATE]
+    decoded: Dict[int, State] = dict(
+        zip(all_codes.tolist(), tables.encoder.decode_many(all_codes))
+    )
+    decoded[COMPOSITION_MDP_SINK_STATE] = COMPOSITION_MDP_SINK_STATE
+
+    transition_function: MDPDynamics = {}
+    for src, action_id, dst, prob, reward in zip(
+        sources.tolist(),
+        action_ids.tolist(),
+        destinations.tolist(),
+        probs.tolist(),
+        rewards.tolist(),
+    ):
+        trans_dist = transition_function.setdefault(decoded[src], {})
+        trans_dist.setdefault(tables.actions[action_id], ({}, reward))[0][
+            decoded[dst]
+        ] = prob
+    return transition_function
+
+
+def comp_mdp_batched(
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    gamma: float = DEFAULT_GAMMA,
+    monitor: Optional[ProgressMonitor] = None,
+) -> Optional[MDP]:
+    """
+    Compute the composition MDP, expanding one BFS layer at a time.
+
+    The result is the same MDP computed by comp_mdp.
+
+    :param dfa: the target DFA.
+    :param services: the community of services.
+    :param gamma: the discount factor.
+    :param monitor: if given, the progress is reported to it after every
+      layer, and the BFS stops when it is cancelled.
+    :return: the composition MDP, or None if the monitor stopped the BFS.
+    """
+    dfa = dfa.trim()
+    tables = CompositionTables(dfa, services)
+
+    frontier = tables.initial_codes(dfa, services)
+    visited = frontier
+    layers: List[Tuple[np.ndarray, ...]] = []
+    nb_expanded, nb_transitions = 0, 0
+    while len(frontier) > 0:
+        if monitor is not None and not monitor.update(
+            "comp_mdp_batched", nb_expanded, len(frontier), nb_transitions
+        ):
+            return None
+        layer = tables.expand(frontier)
+        layers.append(layer)
+        nb_expanded += len(frontier)
+        nb_transitions += len(layer[0])
+        destinations = np.unique(layer[2])
+        destinations = destinations[destinations != COMPOSITION_MDP_SINK_STATE]
+        frontier = destinations[~_is_in_sorted(visited, destinations)]
+        visited = np.union1d(visited, frontier)
+
+    if monitor is not None:
+        monitor.update("comp_mdp_batched", nb_expanded, 0, nb_transitions, final=True)
+    sources, action_ids, destinations, probs, rewards = (
+        np.concatenate([layer[k] for layer in layers]) for k in range(5)
+    )
+    transition_function = build_transition_function(
+        tables, sources, action_ids, destinations, probs, rewards
+    )
+    # states without any applicable action have an empty transition distribution
+    for state in tables.encoder.decode_many(visited):
+        transition_function.setdefault(state, {})
+    if (destinations == COMPOSITION_MDP_SINK_STATE).any():
+        transition_function[COMPOSITION_MDP_SINK_STATE] = {
+            COMPOSITION_MDP_UNDEFINED_ACTION: ({COMPOSITION_MDP_SINK_STATE: 1.0}, 0.0)
+        }
+
+    result = MDP(transition_function, gamma)
+    system_initial_state = tuple(service.initial_state for service in services)
+    result.initial_state = (system_initial_state, dfa.initial_state)  # type: ignore
+    return result
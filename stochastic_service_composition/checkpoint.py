@@ -0,0 +1,131 @@
+"""
+This module implements the checkpoints of long-running compositions and solves.
+
+A checkpoint is a file holding the latest snapshot of a computation (e.g. the
+BFS queue, the visited states and the transitions emitted so far by comp_mdp,
+or the value vector and the number of sweeps of value_iteration). The
+computation saves a snapshot when the checkpoint is due, i.e. when the
+interval has elapsed since the last save, and once more when it completes.
+When started again with the same checkpoint, it resumes from the snapshot, or
+directly returns the result of a completed one.
+
+Snapshots are pickled with the highest protocol, which stores numpy arrays
+as raw buffers, and are written to a temporary file that atomically replaces
+the previous one, so that a process killed while saving leaves the last
+complete snapshot. Every snapshot is tagged with the kind of computation and
+a signature of its inputs, including a digest of their content (see
+content_digest), so that a checkpoint is never resumed by a different
+computation, nor by the same computation on different numbers.
+"""
+import hashlib
+import os
+import pickle
+import time
+from typing import Any, Dict, Hashable, Mapping, Optional
+
+import numpy as np
+
+DEFAULT_CHECKPOINT_INTERVAL = 60.0
+
+
+def _canonical(obj: Any) -> str:
+    """Get a representation of a nested object that does not depend on the order of sets."""
+    if isinstance(obj, Mapping):
+        items = sorted(f"{_canonical(key)}:{_canonical(value)}" for key, value in obj.items())
+        return "{" + ",".join(items) + "}"
+    if isinstance(obj, (set, frozenset)):
+        return "{" + ",".join(sorted(_canonical(element) for element in obj)) + "}"
+    if isinstance(obj, (list, tuple)):
+        return "(" + ",".join(_canonical(element) for element in obj) + ")"
+    return repr(obj)
+
+
+def content_digest(*parts: Any) -> str:
+    """
+    Compute a digest of the content of the inputs of a computation.
+
+    :param parts: numpy arrays (hashed with their dtype and shape), or nested
+      dicts, sets, lists and tuples of values with a deterministic repr (e.g.
+      the transition functions of services).
+    :return: the hexadecimal SHA-256 digest.
+    """
+    hasher = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            hasher.update(f"{part.dtype.str}{part.shape}".encode())
+            hasher.update(np.ascontiguousarray(part).tobytes())
+        else:
+            hasher.update(_canonical(part).encode())
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class Checkpoint:
+    """A file holding the latest snapshot of a computation, saved periodically."""
+
+    def __init__(self, path: str, interval: float = DEFAULT_CHECKPOINT_INTERVAL):
+        """
+        Initialize the checkpoint.
+
+        :param path: the path of the checkpoint file.
+        :param interval: the minimum time between two snapshots, in seconds.
+        """
+        assert interval >= 0.0, "the interval must be non-negative"
+        self.path = path
+        self.interval = interval
+        self.nb_saves = 0
+        self._last_save = time.monotonic()
+
+    @property
+    def exists(self) -> bool:
+        """Check whether a snapshot has been saved."""
+        return os.path.isfile(self.path)
+
+    def due(self) -> bool:
+        """Check whether the interval has elapsed since the last snapshot."""
+        return time.monotonic() - self._last_save >= self.interval
+
+    def save(self, kind: str, signature: Hashable, data: Dict[str, Any]) -> None:
+        """
+        Save a snapshot, replacing the previous one.
+
+        :param kind: the kind of computation, e.g. "comp_mdp".
+        :param signature: a signature of the inputs of the computation.
+        :param data: the state of the computation.
+        """
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(
+                {"kind": kind, "signature": signature, "data": data},
+                f,
+                pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, self.path)
+        self.nb_saves += 1
+        self._last_save = time.monotonic()
+
+    def load(self, kind: str, signature: Hashable) -> Optional[Dict[str, Any]]:
+        """
+        Load the latest snapshot, if any.
+
+        :param kind: the kind of computation.
+        :param signature: the signature of the inputs of the computation.
+        :return: the state of the computation, or None if there is no snapshot.
+        """
+        if not self.exists:
+            return None
+        with open(self.path, "rb") as f:
+            snapshot = pickle.load(f)
+        assert snapshot["kind"] == kind, (
+            f"{self.path} is a checkpoint of {snapshot['kind']}, not of {kind}"
+        )
+        assert snapshot["signature"] == signature, (
+            f"{self.path} is a checkpoint of {kind} on different inputs"
+        )
+        self._last_save = time.monotonic()
+        return snapshot["data"]
+
+    def clear(self) -> None:
+        """Delete the snapshot, if any."""
+        if self.exists:
+            os.remove(self.path)
@@ -1,11 +1,13 @@
 """This module implements the algorithm to compute the system-target MDP."""
 import time
 from collections import deque
-from typing import Deque, Dict, List, Set, Tuple
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple
 
 from mdp_dp_rl.processes.mdp import MDP
 from pythomata import SimpleDFA
 
+from stochastic_service_composition.checkpoint import Checkpoint, content_digest
+from stochastic_service_composition.progress import ProgressMonitor
 from stochastic_service_composition.services import Service, build_system_service
 from stochastic_service_composition.target import Target
 from stochastic_service_composition.types import Action, State, MDPDynamics
@@ -18,19 +20,175 @@ DEFAULT_GAMMA = 0.9
 COMPOSITION_MDP_SINK_STATE = -1
 
 
+def _nb_transitions(transition_function: MDPDynamics) -> int:
+    """Get the number of transitions of a transition function."""
+    return sum(
+        len(next_states)
+        for transitions in transition_function.values()
+        for next_states, _reward in transitions.values()
+    )
+
+
+def _services_content(services) -> List:
+    """Get the content of services that determines their composition."""
+    return [
+        (service.initial_state, service.final_states, service.transition_function)
+        for service in services
+    ]
+
+
+class _BFSProgress:
+    """
+    The checkpoint and the progress monitor of the BFS of a composition.
+
+    The containers of the BFS (transition function, visited states, states to
+    be visited and queue) are tracked once resumed, and saved as they are.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        checkpoint: Optional[Checkpoint],
+        monitor: Optional[ProgressMonitor],
+        content: Callable[[], Sequence[Any]],
+    ):
+        """
+        Initialize the progress.
+
+        :param stage: the kind of composition, e.g. "comp_mdp".
+        :param checkpoint: the checkpoint of the BFS, if any.
+        :param monitor: the progress monitor, if any.
+        :param content: a function giving the inputs of the composition (only
+          called to compute the signature of the checkpoint).
+        """
+        self.stage = stage
+        self.checkpoint = checkpoint
+        self.monitor = monitor
+        self.signature = None if checkpoint is None else content_digest(*content())
+        self.saved = None if checkpoint is None else checkpoint.load(stage, self.signature)
+        self._transition_function: MDPDynamics = {}
+        self._visited: Set = set()
+        self._to_be_visited: Set = set()
+        self._queue: Deque = deque()
+
+    def completed_mdp(self, gamma: float) -> Optional[MDP]:
+        """Get the MDP of the completed composition saved in the checkpoint, if any."""
+        if self.saved is None or not self.saved["complete"]:
+            return None
+        result = MDP(self.saved["transition_function"], gamma)
+        if "initial_state" in self.saved:
+            result.initial_state = self.saved["initial_state"]  # type: ignore
+        return result
+
+    def resume(
+        self, transition_function: MDPDynamics, visited: Set, to_be_visited: Set, queue: Deque
+    ) -> None:
+        """
+        Track the containers of a new BFS, and restore them from the snapshot, if any.
+
+        :param transition_function: the transitions emitted so far.
+        :param visited: the states expanded.
+        :param to_be_visited: the states in the queue.
+        :param queue: the states waiting to be expanded.
+        """
+        if self.saved is not None:
+            transition_function.clear()
+            transition_function.update(self.saved["transition_function"])
+            visited.clear()
+            visited.update(self.saved["visited"])
+            to_be_visited.clear()
+            to_be_visited.update(self.saved["to_be_visited"])
+            queue.clear()
+            queue.extend(self.saved["queue"])
+            self.saved = None
+        self._transition_function = transition_function
+        self._visited, self._to_be_visited, self._queue = visited, to_be_visited, queue
+
+    def _save(self, data: Dict) -> None:
+        """Save a snapshot, if there is a checkpoint."""
+        if self.checkpoint is not None:
+            self.checkpoint.save(self.stage, self.signature, data)
+
+    def _snapshot(self) -> Dict:
+        """Get the state of the BFS."""
+        return {
+            "complete": False,
+            "transition_function": self._transition_function,
+            "visited": self._visited,
+            "to_be_visited": self._to_be_visited,
+            "queue": list(self._queue),
+        }
+
+    def update(self, transitions: int) -> bool:
+        """
+        Save the BFS if the checkpoint is due, and report its progress.
+
+        :param transitions: the number of transitions emitted.
+        :return: whether the BFS can go on (if not, it has been saved).
+        """
+        if self.checkpoint is not None and self.checkpoint.due():
+            self._save(self._snapshot())
+        if self.monitor is None or self.monitor.update(
+            self.stage, len(self._visited), len(self._queue), transitions
+        ):
+            return True
+        self._save(self._snapshot())
+        return False
+
+    def complete(self, transitions: int, result: Dict) -> None:
+        """
+        Save the result of the completed BFS, and report its final progress.
+
+        :param transitions: the number of transitions emitted.
+        :param result: the data of the composition, saved with "complete" set.
+        """
+        self._save({"complete": True, **result})
+        if self.monitor is not None:
+            self.monitor.update(self.stage, len(self._visited), 0, transitions, final=True)
+
+
 def composition_mdp(
-    target: Target, *services: Service, gamma: float = DEFAULT_GAMMA
-) -> MDP:
+    target: Target,
+    *services: Service,
+    gamma: float = DEFAULT_GAMMA,
+    checkpoint: Optional[Checkpoint] = None,
+    monitor: Optional[ProgressMonitor] = None,
+) -> Optional[MDP]:
     """
     Compute the composition MDP.
 
     :param target: the target service.
     :param services: the community of services.
     :param gamma: the discount factor.
-    :return: the composition MDP.
+    :param checkpoint: if given, the BFS state is saved to it periodically
+      and on completion; the BFS resumes from its latest snapshot, and a
+      completed one is returned without building the system service.
+    :param monitor: if given, the progress of the system service and of the
+      BFS is reported to it, and they stop when it is cancelled (after saving
+      the checkpoint of the BFS, if any).
+    :return: the composition MDP, or None if the monitor stopped the computation.
     """
-
-    system_service = build_system_service(*services)
+    progress = _BFSProgress(
+        "composition_mdp",
+        checkpoint,
+        monitor,
+        lambda: (
+            _services_content(services),
+            (
+                target.initial_state,
+                target.transition_function,
+                target.policy,
+                target.reward,
+            ),
+        ),
+    )
+    completed = progress.completed_mdp(gamma)
+    if completed is not None:
+        return completed
+
+    system_service = build_system_service(*services, monitor=monitor)
+    if system_service is None:
+        return None
 
     initial_state = COMPOSITION_MDP_INITIAL_STATE
     # one action per service (1..n) + the initial action (0)
@@ -43,7 +201,7 @@ def composition_mdp(
 
     transition_function: MDPDynamics = {}
 
-    visited = set()
+    visited: Set[State] = set()
     to_be_visited = set()
     queue: Deque = deque()
 
@@ -59,7 +217,11 @@ def composition_mdp(
         to_be_visited.add(next_state)
     transition_function[initial_state][initial_action] = (initial_transition_dist, 0.0)  # type: ignore
 
+    progress.resume(transition_function, visited, to_be_visited, queue)
+    nb_transitions = _nb_transitions(transition_function)
     while len(queue) > 0:
+        if not progress.update(nb_transitions):
+            return None
         current_state = queue.popleft()
         to_be_visited.remove(current_state)
         visited.add(current_state)
@@ -104,6 +266,7 @@ def composition_mdp(
                 next_transitions,  # type: ignore
                 next_reward + next_system_reward,
             )
+            nb_transitions += len(next_transitions)
 
         # states without outgoing transitions are sink states.
         # add loop transitions with
@@ -119,11 +282,12 @@ def composition_mdp(
         # TODO check correctness
         # if next state distribution is empty, add loops
 
+    progress.complete(nb_transitions, {"transition_function": transition_function})
     return MDP(transition_function, gamma)
 
 def comp_mdp2(
-    dfa: SimpleDFA, services: Service, gamma: float = DEFAULT_GAMMA
-) -> MDP:
+    dfa: SimpleDFA, services: Sequence[Service], gamma: float = DEFAULT_GAMMA
+) -> Optional[MDP]:
     """
     Compute the composition MDP.
     :param target: the target service.
@@ -133,6 +297,8 @@ def comp_mdp2(
     """
     dfa = dfa.trim()
     system_service = build_system_service(*services)
+    if system_service is None:
+        return None
 
     transition_function: MDPDynamics = {}
 
@@ -243,22 +409,47 @@ def comp_mdp2(
 
 
 def comp_mdp(
-    dfa: SimpleDFA, services: Service, gamma: float = DEFAULT_GAMMA
-) -> MDP:
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    gamma: float = DEFAULT_GAMMA,
+    checkpoint: Optional[Checkpoint] = None,
+    monitor: Optional[ProgressMonitor] = None,
+) -> Optional[MDP]:
     """
     Compute the composition MDP.
 
     :param target: the target service.
     :param services: the community of services.
     :param gamma: the discount factor.
-    :return: the composition MDP.
+    :param checkpoint: if given, the BFS state is saved to it periodically
+      and on completion; the BFS resumes from its latest snapshot, and a
+      completed one is returned without building the system service.
+    :param monitor: if given, the progress of the system service and of the
+      BFS is reported to it, and they stop when it is cancelled (after saving
+      the checkpoint of the BFS, if any).
+    :return: the composition MDP, or None if the monitor stopped the computation.
     """
     dfa = dfa.trim()
-    system_service = build_system_service(*services)
+    progress = _BFSProgress(
+        "comp_mdp",
+        checkpoint,
+        monitor,
+        lambda: (
+            _services_content(services),
+            (dfa.initial_state, dfa.accepting_states, dfa.transition_function),
+        ),
+    )
+    completed = progress.completed_mdp(gamma)
+    if completed is not None:
+        return completed
+
+    system_service = build_system_service(*services, monitor=monitor)
+    if system_service is None:
+        return None
 
     transition_function: MDPDynamics = {}
 
-    visited = set()
+    visited: Set[State] = set()
     to_be_visited = set()
     queue: Deque = deque()
 
@@ -297,9 +488,17 @@ def comp_mdp(
             target_action_to_service_id.setdefault(supported_action, set()).add(service_id)
     print(target_action_to_service_id)
 
-    mdp_sink_state_used = False
+    progress.resume(transition_function, visited, to_be_visited, queue)
+    # the 'undefined' action always leads to the sink state
+    mdp_sink_state_used = any(
+        COMPOSITION_MDP_UNDEFINED_ACTION in transitions
+        for transitions in transition_function.values()
+    )
+    nb_transitions = _nb_transitions(transition_function)
     # per ogni stato che devo visitare
     while len(queue) > 0:
+        if not progress.update(nb_transitions):
+            return None
         cur_state = queue.popleft()
         to_be_visited.remove(cur_state)
         visited.add(cur_state)
@@ -371,10 +570,16 @@ def comp_mdp(
                         to_be_visited.add(next_state)
 
         transition_function[cur_state] = trans_dist
+        nb_transitions += sum(len(next_states) for next_states, _ in trans_dist.values())
 
     if mdp_sink_state_used:
         transition_function[COMPOSITION_MDP_SINK_STATE] = {COMPOSITION_MDP_UNDEFINED_ACTION: ({COMPOSITION_MDP_SINK_STATE: 1.0}, 0.0)}
 
+    progress.complete(
+        nb_transitions,
+        {"transition_function": transition_function, "initial_state": initial_state},
+    )
+
     print(transition_function)
 
     
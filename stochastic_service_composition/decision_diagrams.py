@@ -0,0 +1,414 @@
+"""
+This module implements a minimal algebraic decision diagram (ADD) package.
+
+An ADD represents a function from boolean variables to real numbers as a
+reduced, ordered, hash-consed DAG. Variables are identified by their level in
+the (fixed) variable order: smaller levels are closer to the root. Nodes are
+integers handled by an ADDManager. Nodes are never freed implicitly: an
+iterative computation calls collect with the diagrams it still needs (e.g.
+after every sweep), which compacts the manager around them.
+"""
+import math
+import operator
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+_BINARY_OPERATORS: Dict[str, Callable[[float, float], float]] = {
+    "+": operator.add,
+    "*": operator.mul,
+    "max": max,
+    "min": min,
+}
+
+
+class ADDManager:
+    """A manager of algebraic decision diagrams over a fixed number of variables."""
+
+    def __init__(self, nb_vars: int):
+        """
+        Initialize the manager.
+
+        :param nb_vars: the number of boolean variables.
+        """
+        self.nb_vars = nb_vars
+        # node attributes; terminals have level nb_vars
+        self._level: List[int] = []
+        self._low: List[int] = []
+        self._high: List[int] = []
+        self._value: List[float] = []
+        self._unique: Dict[Tuple[int, int, int], int] = {}
+        self._terminals: Dict[float, int] = {}
+        self._cache: Dict[Tuple, int] = {}
+
+    @property
+    def nb_nodes(self) -> int:
+        """Get the number of nodes allocated so far."""
+        return len(self._level)
+
+    def clear_cache(self) -> None:
+        """Clear the computed table."""
+        self._cache.clear()
+
+    def collect(self, roots: Sequence[int]) -> List[int]:
+        """
+        Free all the nodes not reachable from some diagrams, and clear the computed table.
+
+        The remaining nodes are renumbered: any diagram not in roots becomes invalid.
+
+        :param roots: the diagrams to keep.
+        :return: the new nodes of the diagrams, in the same order.
+        """
+        # children are allocated before their parents: renumbering in
+        # increasing order keeps that invariant
+        live = sorted(self._nodes(*roots))
+        mapping: Dict[int, int] = {}
+        level: List[int] = []
+        low: List[int] = []
+        high: List[int] = []
+        value: List[float] = []
+        for old in live:
+            mapping[old] = len(level)
+            level.append(self._level[old])
+            value.append(self._value[old])
+            if self.is_terminal(old):
+                low.append(-1)
+                high.append(-1)
+            else:
+                low.append(mapping[self._low[old]])
+                high.append(mapping[self._high[old]])
+        self._level, self._low, self._high, self._value = level, low, high, value
+        self._unique = {}
+        self._terminals = {}
+        for node in range(len(level)):
+            if level[node] == self.nb_vars:
+                self._terminals[value[node]] = node
+            else:
+                self._unique[(level[node], low[node], high[node])] = node
+        self._cache.clear()
+        return [mapping[root] for root in roots]
+
+    def constant(self, value: float) -> int:
+        """Get the terminal node of a value."""
+        value = float(value)
+        if value == 0.0:
+            value = 0.0  # merge -0.0 and 0.0
+        node = self._terminals.get(value)
+        if node is None:
+            node = self._new(self.nb_vars, -1, -1, value)
+            self._terminals[value] = node
+        return node
+
+    def node(self, level: int, low: int, high: int) -> int:
+        """Get the (reduced) node testing a variable, with the given children."""
+        if low == high:
+            return low
+        assert level < self._level[low] and level < self._level[high], "order violation"
+        key = (level, low, high)
+        node = self._unique.get(key)
+        if node is None:
+            node = self._new(level, low, high, math.nan)
+            self._unique[key] = node
+        return node
+
+    def variable(self, level: int) -> int:
+        """Get the 0/1 indicator of a variable."""
+        return self.node(level, self.constant(0.0), self.constant(1.0))
+
+    def is_terminal(self, node: int) -> bool:
+        """Check whether a node is a terminal."""
+        return self._level[node] == self.nb_vars
+
+    def value(self, node: int) -> float:
+        """Get the value of a terminal node."""
+        return self._value[node]
+
+    def level(self, node: int) -> int:
+        """Get the level of the variable tested by a node."""
+        return self._level[node]
+
+    def cofactors(self, node: int, level: int) -> Tuple[int, int]:
+        """Get the cofactors of a node with respect to a variable."""
+        if self._level[node] != level:
+            return node, node
+        return self._low[node], self._high[node]
+
+    def apply(self, op: str, f: int, g: int) -> int:
+        """
+        Combine two diagrams pointwise.
+
+        :param op: one of '+', '*', 'max', 'min'.
+        :param f: the first diagram.
+        :param g: the second diagram.
+        :return: the diagram of op(f, g).
+        """
+        # the recursion is on the hot path of the symbolic solvers: the node
+        # attributes are bound to locals (the lists only grow while it runs)
+        function = _BINARY_OPERATORS[op]
+        cache, node, constant = self._cache, self.node, self.constant
+        level, low, high, value = self._level, self._low, self._high, self._value
+        nb_vars = self.nb_vars
+
+        def recurse(f: int, g: int) -> int:
+            if f > g:
+                f, g = g, f  # all the operators are commutative
+            key = (op, f, g)
+            result = cache.get(key)
+            if result is not None:
+                return result
+            f_level, g_level = level[f], level[g]
+            if f_level == nb_vars and g_level == nb_vars:
+                result = constant(function(value[f], value[g]))
+            elif f_level == g_level:
+                result = node(f_level, recurse(low[f], low[g]), recurse(high[f], high[g]))
+            elif f_level < g_level:
+                result = node(f_level, recurse(low[f], g), recurse(high[f], g))
+            else:
+                result = node(g_level, recurse(f, low[g]), recurse(f, high[g]))
+            cache[key] = result
+            return result
+
+        return recurse(f, g)
+
+    def where(self, condition: int, f: int, default: float) -> int:
+        """Get the diagram equal to f where condition is non-zero, and to default elsewhere."""
+        key = ("where", condition, f, default)
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+        if self.is_terminal(condition):
+            result = f if self._value[condition] != 0.0 else self.constant(default)
+        else:
+            level = min(self._level[condition], self._level[f])
+            c_low, c_high = self.cofactors(condition, level)
+            f_low, f_high = self.cofactors(f, level)
+            result = self.node(
+                level,
+                self.where(c_low, f_low, default),
+                self.where(c_high, f_high, default),
+            )
+        self._cache[key] = result
+        return result
+
+    def map_terminals(self, f: int, function: Callable[[float], float], name: str) -> int:
+        """
+        Apply a function to all the terminals of a diagram.
+
+        :param f: the diagram.
+        :param function: the function on terminal values.
+        :param name: a name identifying the function in the computed table.
+        :return: the new diagram.
+        """
+        key = ("map", name, f)
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+        if self.is_terminal(f):
+            result = self.constant(function(self._value[f]))
+        else:
+            result = self.node(
+                self._level[f],
+                self.map_terminals(self._low[f], function, name),
+                self.map_terminals(self._high[f], function, name),
+            )
+        self._cache[key] = result
+        return result
+
+    def restrict(self, f: int, level: int, value: bool) -> int:
+        """Fix the value of a variable."""
+        key = ("restrict", f, level, value)
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+        if self._level[f] > level:
+            result = f
+        elif self._level[f] == level:
+            result = self._high[f] if value else self._low[f]
+        else:
+            result = self.node(
+                self._level[f],
+                self.restrict(self._low[f], level, value),
+                self.restrict(self._high[f], level, value),
+            )
+        self._cache[key] = result
+        return result
+
+    def sum_abstract(self, f: int, levels: Sequence[int]) -> int:
+        """Sum out some variables: sum over all their assignments."""
+        for level in sorted(levels, reverse=True):
+            f = self.apply(
+                "+", self.restrict(f, level, False), self.restrict(f, level, True)
+            )
+        return f
+
+    def multiply_sum_abstract(
+        self,
+        f: int,
+        g: int,
+        levels: Sequence[int],
+        g_mapping: Optional[Mapping[int, int]] = None,
+        scale: float = 1.0,
+    ) -> int:
+        """
+        Sum out some variables from the (scaled) product of two diagrams.
+
+        The result is scale * sum_abstract(apply('*', f, rename(g, g_mapping)), levels),
+        computed in a single pass: neither the renamed diagram nor the product
+        are built, and the branches where one of the factors is 0 are cut.
+
+        :param f: the first diagram.
+        :param g: the second diagram.
+        :param levels: the variables to sum out.
+        :param g_mapping: a renaming of the variables of g, if any (see rename).
+        :param scale: a constant factor.
+        :return: the diagram of the sum.
+        """
+        # the recursion is on the hot path of the symbolic solvers, as in apply
+        cache, node, apply, constant = self._cache, self.node, self.apply, self.constant
+        level, low, high, value = self._level, self._low, self._high, self._value
+        nb_vars = self.nb_vars
+        sorted_levels = tuple(sorted(levels))
+        nb_levels = len(sorted_levels)
+        mapping = g_mapping if g_mapping is not None else {}
+        zero = constant(0.0)
+        # the mapping is identified by id, as in rename
+        key_prefix = ("multiply_sum", sorted_levels, id(mapping), scale)
+
+        def recurse(f: int, g: int, k: int) -> int:
+            if f == zero or g == zero:
+                return zero
+            key = key_prefix + (f, g, k)
+            result = cache.get(key)
+            if result is not None:
+                return result
+            f_level = level[f]
+            g_level = mapping.get(level[g], level[g])
+            top = min(f_level, g_level)
+            if top == nb_vars:
+                # both terminals, but some variables may be left to sum out
+                result = constant(scale * value[f] * value[g] * 2 ** (nb_levels - k))
+            elif k < nb_levels and sorted_levels[k] < top:
+                # the product does not depend on the variable: both terms are equal
+                partial = recurse(f, g, k + 1)
+                result = apply("+", partial, partial)
+            else:
+                f_low, f_high = (low[f], high[f]) if f_level == top else (f, f)
+                g_low, g_high = (low[g], high[g]) if g_level == top else (g, g)
+                if k < nb_levels and sorted_levels[k] == top:
+                    result = apply(
+                        "+", recurse(f_low, g_low, k + 1), recurse(f_high, g_high, k + 1)
+                    )
+                else:
+                    result = node(top, recurse(f_low, g_low, k), recurse(f_high, g_high, k))
+            cache[key] = result
+            return result
+
+        return recurse(f, g, 0)
+
+    def rename(self, f: int, mapping: Mapping[int, int]) -> int:
+        """
+        Rename variables.
+
+        The renaming must preserve the relative order of the variables in f.
+
+        :param f: the diagram.
+        :param mapping: a map from old levels to new levels.
+        :return: the renamed diagram.
+        """
+        key = ("rename", f, id(mapping))
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+        if self.is_terminal(f):
+            result = f
+        else:
+            level = self._level[f]
+            result = self.node(
+                mapping.get(level, level),
+                self.rename(self._low[f], mapping),
+                self.rename(self._high[f], mapping),
+            )
+        self._cache[key] = result
+        return result
+
+    def max_distance(self, f: int, g: int) -> float:
+        """Get the maximum absolute difference between two diagrams (no node is built)."""
+        level, low, high, value = self._level, self._low, self._high, self._value
+        nb_vars = self.nb_vars
+        seen: Set[Tuple[int, int]] = set()
+        distance = 0.0
+        stack = [(f, g)]
+        while stack:
+            pair = stack.pop()
+            if pair in seen:
+                continue
+            seen.add(pair)
+            f, g = pair
+            f_level, g_level = level[f], level[g]
+            if f_level == nb_vars and g_level == nb_vars:
+                distance = max(distance, abs(value[f] - value[g]))
+                continue
+            top = min(f_level, g_level)
+            f_low, f_high = (low[f], high[f]) if f_level == top else (f, f)
+            g_low, g_high = (low[g], high[g]) if g_level == top else (g, g)
+            stack.append((f_low, g_low))
+            stack.append((f_high, g_high))
+        return distance
+
+    def evaluate(self, f: int, assignment: Mapping[int, bool]) -> float:
+        """Evaluate a diagram on an assignment (missing variables are False)."""
+        while not self.is_terminal(f):
+            f = self._high[f] if assignment.get(self._level[f], False) else self._low[f]
+        return self._value[f]
+
+    def from_function(
+        self, levels: Sequence[int], function: Callable[[Tuple[bool, ...]], float]
+    ) -> int:
+        """
+        Build the diagram of a function of a few variables by Shannon expansion.
+
+        :param levels: the variables the function depends on.
+        :param function: the function, taking the values of the variables (in
+          the same order as levels).
+        :return: the diagram.
+        """
+        order = sorted(range(len(levels)), key=lambda k: levels[k])
+
+        def build(depth: int, bits: Dict[int, bool]) -> int:
+            if depth == len(order):
+                return self.constant(function(tuple(bits[k] for k in range(len(levels)))))
+            k = order[depth]
+            bits[k] = False
+            low = build(depth + 1, bits)
+            bits[k] = True
+            high = build(depth + 1, bits)
+            del bits[k]
+            return self.node(levels[k], low, high)
+
+        return build(0, {})
+
+    def terminal_values(self, f: int) -> List[float]:
+        """Get the values of the terminals reachable from a diagram."""
+        return [self._value[node] for node in self._nodes(f) if self.is_terminal(node)]
+
+    def size(self, f: int) -> int:
+        """Get the number of nodes of a diagram."""
+        return len(self._nodes(f))
+
+    def _nodes(self, *roots: int) -> Set[int]:
+        seen: Set[int] = set()
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            if node in seen:
+                continue
+            seen.add(node)
+            if not self.is_terminal(node):
+                stack.append(self._low[node])
+                stack.append(self._high[node])
+        return seen
+
+    def _new(self, level: int, low: int, high: int, value: float) -> int:
+        self._level.append(level)
+        self._low.append(low)
+        self._high.append(high)
+        self._value.append(value)
+        return len(self._level) - 1
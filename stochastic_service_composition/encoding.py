@@ -0,0 +1,132 @@
+"""This module implements the integer encoding of composition states."""
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.types import State
+
+MAX_ENCODABLE_STATES = 2 ** 63 - 1
+
+
+class StateEncoder:
+    """
+    Mixed-radix encoding of composition states.
+
+    A composition state ((s_1, ..., s_n), q) is mapped to the integer
+
+        idx(q) + |Q| * (idx(s_1) + |S_1| * (idx(s_2) + |S_2| * (...)))
+
+    so that every component can be read (and changed) with integer arithmetic.
+    """
+
+    def __init__(self, services: Sequence[Service], dfa_states: Sequence[State]):
+        """
+        Initialize the encoder.
+
+        :param services: the community of services.
+        :param dfa_states: the states of the target DFA.
+        """
+        self.service_states: List[List[State]] = [
+            sorted(service.states, key=str) for service in services
+        ]
+        self.service_state_index: List[Dict[State, int]] = [
+            {state: idx for idx, state in enumerate(states)}
+            for states in self.service_states
+        ]
+        self.dfa_states: List[State] = sorted(dfa_states, key=str)
+        self.dfa_state_index: Dict[State, int] = {
+            state: idx for idx, state in enumerate(self.dfa_states)
+        }
+
+        self.nb_dfa_states = len(self.dfa_states)
+        self.radices = np.array(
+            [len(states) for states in self.service_states], dtype=np.int64
+        )
+        strides = []
+        size = self.nb_dfa_states
+        for radix in self.radices.tolist():
+            strides.append(size)
+            size *= radix
+        assert (
+            size <= MAX_ENCODABLE_STATES
+        ), f"{size} composition states cannot be encoded with 64-bit integers"
+        self.strides = np.array(strides, dtype=np.int64)
+        self.size: int = size
+
+        # object arrays used for fast vectorized decoding
+        self._service_state_arrays = [
+            np.array(states + [None], dtype=object)[:-1]
+            for states in self.service_states
+        ]
+        self._dfa_state_array = np.array(self.dfa_states + [None], dtype=object)[:-1]
+
+    @property
+    def nb_services(self) -> int:
+        """Get the number of services."""
+        return len(self.service_states)
+
+    def encode(self, system_state: Tuple[State, ...], dfa_state: State) -> int:
+        """
+        Encode a composition state.
+
+        :param system_state: the system service state, one component per service.
+        :param dfa_state: the DFA state.
+        :return: the integer code.
+        """
+        code = self.dfa_state_index[dfa_state]
+        for i, component in enumerate(system_state):
+            code += self.service_state_index[i][component] * int(self.strides[i])
+        return code
+
+    def decode(self, code: int) -> Tuple[Tuple[State, ...], State]:
+        """
+        Decode a composition state.
+
+        :param code: the integer code.
+        :return: the pair (system state, DFA state).
+        """
+        code = int(code)
+        dfa_state = self.dfa_states[code % self.nb_dfa_states]
+        system_state = tuple(
+            self.service_states[i][(code // int(self.strides[i])) % int(self.radices[i])]
+            for i in range(self.nb_services)
+        )
+        return system_state, dfa_state
+
+    def encode_many(
+        self, service_digits: np.ndarray, dfa_digits: np.ndarray
+    ) -> np.ndarray:
+        """
+        Encode many states given as per-component indices.
+
+        :param service_digits: an array of shape (N, nb_services) of local state indices.
+        :param dfa_digits: an array of shape (N,) of DFA state indices.
+        :return: the array of codes.
+        """
+        service_digits = np.asarray(service_digits, dtype=np.int64)
+        return np.asarray(dfa_digits, dtype=np.int64) + service_digits @ self.strides
+
+    def service_digits(self, codes: np.ndarray, service_id: int) -> np.ndarray:
+        """Get the local state indices of one service."""
+        return (codes // self.strides[service_id]) % self.radices[service_id]
+
+    def dfa_digits(self, codes: np.ndarray) -> np.ndarray:
+        """Get the DFA state indices."""
+        return codes % self.nb_dfa_states
+
+    def decode_many(self, codes: np.ndarray) -> List[Tuple[Tuple[State, ...], State]]:
+        """
+        Decode many states at once.
+
+        :param codes: the array of codes.
+        :return: the list of pairs (system state, DFA state), in the same order.
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        columns = [
+            self._service_state_arrays[i][self.service_digits(codes, i)]
+            for i in range(self.nb_services)
+        ]
+        dfa_column = self._dfa_state_array[self.dfa_digits(codes)]
+        system_states = zip(*columns) if columns else iter(() for _ in codes)
+        return list(zip(system_states, dfa_column))
@@ -0,0 +1,403 @@
+"""
+This module implements the incremental update of the composition MDP of comp_mdp.
+
+When the community changes (a service is added, removed or replaced), the
+transitions of the untouched services do not change: an action (symbol, j)
+taken in ((s_1, ..., s_n), q) only depends on (s_j, q). Hence the new
+composition is built by reusing the transitions of the old one, lifted to the
+new state space, and by computing from scratch only the transitions of the
+new service (and of the states that did not exist before). No system service
+is built.
+
+When a service is replaced by one with the same transition structure (e.g. a
+re-estimated broken probability or a new cost), the state space does not change
+and only the transitions of that service are recomputed.
+"""
+import itertools
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Sequence, Set, Tuple, cast
+
+from mdp_dp_rl.processes.mdp import MDP
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.batched_composition import INITIAL_LOCAL_STATES
+from stochastic_service_composition.composition_mdp import (
+    COMPOSITION_MDP_SINK_STATE,
+    COMPOSITION_MDP_UNDEFINED_ACTION,
+)
+from stochastic_service_composition.services import Service, reachable_states
+from stochastic_service_composition.types import (
+    Action,
+    CompositionState,
+    MDPDynamics,
+    Prob,
+    Reward,
+    State,
+)
+
+# the transitions of a state: action -> (next state distribution, reward)
+_Transitions = Dict[Action, Tuple[Dict[State, Prob], Reward]]
+
+_SINK_TRANSITIONS: _Transitions = {
+    COMPOSITION_MDP_UNDEFINED_ACTION: ({COMPOSITION_MDP_SINK_STATE: 1.0}, 0.0)
+}
+
+
+def mdp_dynamics(mdp: MDP) -> MDPDynamics:
+    """
+    Get the transition function of an MDP, as accepted by the MDP constructor.
+
+    The next state distributions of the MDP are reused, not copied.
+
+    :param mdp: the MDP.
+    :return: the transition function.
+    """
+    return {
+        state: {
+            action: (next_states, mdp.rewards[state][action])
+            for action, next_states in mdp.transitions.get(state, {}).items()
+        }
+        for state in mdp.all_states
+    }
+
+
+class _Recomposition:
+    """The update of a comp_mdp composition after a change of the community."""
+
+    def __init__(
+        self,
+        old_dynamics: MDPDynamics,
+        dfa: SimpleDFA,
+        old_services: Sequence[Service],
+        new_services: Sequence[Service],
+        old_service_ids: Sequence[Optional[int]],
+    ):
+        """
+        Initialize the recomposition.
+
+        :param old_dynamics: the transition function of the old composition.
+        :param dfa: the (trimmed) target DFA.
+        :param old_services: the old community.
+        :param new_services: the new community.
+        :param old_service_ids: for each new service, the index of the same
+          (unchanged) service in the old community, or None if it is new.
+        """
+        self.old_dynamics = old_dynamics
+        self.dfa = dfa
+        self.old_services = old_services
+        self.new_services = new_services
+        self.old_service_ids = old_service_ids
+        self.new_service_ids: Dict[int, int] = {
+            old_id: new_id
+            for new_id, old_id in enumerate(old_service_ids)
+            if old_id is not None
+        }
+        # old services whose component is not determined by the new state
+        self.free_old_ids = [
+            old_id
+            for old_id in range(len(old_services))
+            if old_id not in self.new_service_ids
+        ]
+        self.reused_states = 0
+
+    def allowed_services(self, dfa_state: State) -> Set[int]:
+        """Get the services that can do one of the next DFA actions, as in comp_mdp."""
+        next_dfa_actions = set(self.dfa.transition_function.get(dfa_state, {}).keys())
+        return {
+            service_id
+            for service_id, service in enumerate(self.new_services)
+            if len(next_dfa_actions.intersection(service.actions)) > 0
+        }
+
+    def service_transitions(
+        self, state: CompositionState, service_id: int
+    ) -> _Transitions:
+        """Compute the transitions of one service from a composition state, as in comp_mdp."""
+        system_state, dfa_state = state
+        service = self.new_services[service_id]
+        dfa_transitions = self.dfa.transition_function.get(dfa_state, {})
+        result: _Transitions = {}
+        for symbol, (next_service_states, reward) in service.transition_function[
+            system_state[service_id]
+        ].items():
+            if symbol not in self.dfa.alphabet:
+                next_dfa_state = dfa_state
+                goal_reward = 0.0
+            elif symbol in dfa_transitions:
+                next_dfa_state = dfa_transitions[symbol]
+                goal_reward = 1.0 if self.dfa.is_accepting(next_dfa_state) else 0.0
+            else:
+                continue
+            next_states: Dict[State, Prob] = {}
+            for next_service_state, prob in next_service_states.items():
+                assert prob > 0.0
+                next_system_state = list(system_state)
+                next_system_state[service_id] = next_service_state
+                next_states[(tuple(next_system_state), next_dfa_state)] = prob
+            result[(symbol, service_id)] = (next_states, goal_reward + reward)
+        return result
+
+    def _old_states(self, state: CompositionState) -> Iterator[State]:
+        """Enumerate the old composition states that project onto a new state."""
+        system_state, dfa_state = state
+        template: List[State] = [None] * len(self.old_services)
+        for old_id, new_id in self.new_service_ids.items():
+            template[old_id] = system_state[new_id]
+        free_choices = [
+            sorted(self.old_services[old_id].states, key=str) for old_id in self.free_old_ids
+        ]
+        for choice in itertools.product(*free_choices):
+            for old_id, component in zip(self.free_old_ids, choice):
+                template[old_id] = component
+            yield tuple(template), dfa_state
+
+    def _lift(
+        self,
+        state: CompositionState,
+        old_next_states: Dict[State, Prob],
+        new_id: int,
+        old_id: int,
+    ) -> Dict[State, Prob]:
+        """Lift the next state distribution of an unchanged service to the new state space."""
+        system_state, _dfa_state = state
+        result: Dict[State, Prob] = {}
+        for old_next_state, prob in old_next_states.items():
+            old_next_system_state, next_dfa_state = cast(CompositionState, old_next_state)
+            next_system_state = list(system_state)
+            next_system_state[new_id] = old_next_system_state[old_id]
+            result[(tuple(next_system_state), next_dfa_state)] = prob
+        return result
+
+    def transitions(self, state: CompositionState) -> _Transitions:
+        """Compute the transitions of a new composition state, reusing the old ones."""
+        _system_state, dfa_state = state
+        allowed = self.allowed_services(dfa_state)
+        if len(allowed) == 0:
+            return dict(_SINK_TRANSITIONS)
+
+        old_state = next(
+            (s for s in self._old_states(state) if s in self.old_dynamics), None
+        )
+        result: _Transitions = {}
+        to_compute = set(allowed)
+        if old_state is not None:
+            self.reused_states += 1
+            for action, (next_states, reward) in self.old_dynamics[old_state].items():
+                if action == COMPOSITION_MDP_UNDEFINED_ACTION:
+                    continue
+                symbol, old_id = action
+                new_id = self.new_service_ids.get(old_id)
+                if new_id is None:
+                    continue
+                result[(symbol, new_id)] = (
+                    self._lift(state, next_states, new_id, old_id),
+                    reward,
+                )
+            # unchanged services have the same (allowed) transitions as before
+            to_compute = {i for i in allowed if self.old_service_ids[i] is None}
+        for service_id in sorted(to_compute):
+            result.update(self.service_transitions(state, service_id))
+        return result
+
+    def initial_states(self) -> List[CompositionState]:
+        """Compute the initial states of the new composition, as in comp_mdp."""
+        system_initial_state = tuple(service.initial_state for service in self.new_services)
+        initial_states = [(system_initial_state, self.dfa.initial_state)]
+        choices = [
+            sorted(
+                (s for s in reachable_states(service) if s in INITIAL_LOCAL_STATES), key=str
+            )
+            for service in self.new_services
+        ]
+        for system_state in itertools.product(*choices):
+            if system_state != system_initial_state:
+                initial_states.append((system_state, self.dfa.initial_state))
+        return initial_states
+
+    def run(self) -> MDPDynamics:
+        """Build the transition function of the new composition."""
+        transition_function: MDPDynamics = {}
+        queue: Deque = deque(self.initial_states())
+        discovered = set(queue)
+        mdp_sink_state_used = False
+        while len(queue) > 0:
+            current_state = queue.popleft()
+            trans_dist = self.transitions(current_state)
+            transition_function[current_state] = trans_dist
+            for action, (next_states, _reward) in trans_dist.items():
+                if action == COMPOSITION_MDP_UNDEFINED_ACTION:
+                    mdp_sink_state_used = True
+                    continue
+                for next_state in next_states:
+                    if next_state not in discovered:
+                        discovered.add(next_state)
+                        queue.append(next_state)
+        if mdp_sink_state_used:
+            transition_function[COMPOSITION_MDP_SINK_STATE] = dict(_SINK_TRANSITIONS)
+        return transition_function
+
+
+def _same_structure(old_service: Service, new_service: Service) -> bool:
+    """Check whether two services have the same states, actions and transition supports."""
+    if old_service.states != new_service.states:
+        return False
+    if old_service.initial_state != new_service.initial_state:
+        return False
+    if old_service.transition_function.keys() != new_service.transition_function.keys():
+        return False
+    for state, old_transitions in old_service.transition_function.items():
+        new_transitions = new_service.transition_function[state]
+        if old_transitions.keys() != new_transitions.keys():
+            return False
+        for action, (old_next_states, _reward) in old_transitions.items():
+            if old_next_states.keys() != new_transitions[action][0].keys():
+                return False
+    return True
+
+
+def _build_mdp(
+    transition_function: MDPDynamics,
+    services: Sequence[Service],
+    dfa: SimpleDFA,
+    gamma: float,
+) -> MDP:
+    result = MDP(transition_function, gamma)
+    system_initial_state = tuple(service.initial_state for service in services)
+    result.initial_state = (system_initial_state, dfa.initial_state)  # type: ignore
+    return result
+
+
+def update_composition(
+    mdp: MDP,
+    dfa: SimpleDFA,
+    old_services: Sequence[Service],
+    new_services: Sequence[Service],
+    old_service_ids: Sequence[Optional[int]],
+    gamma: Optional[float] = None,
+) -> MDP:
+    """
+    Update a comp_mdp composition after a change of the community.
+
+    The result is the same MDP computed by comp_mdp(dfa, new_services).
+
+    :param mdp: the composition MDP of dfa and old_services, computed by comp_mdp.
+    :param dfa: the target DFA.
+    :param old_services: the old community.
+    :param new_services: the new community.
+    :param old_service_ids: for each new service, the index of the same
+      (unchanged) service in the old community, or None if it is new or changed.
+    :param gamma: the discount factor (default: the one of mdp).
+    :return: the new composition MDP.
+    """
+    assert len(old_service_ids) == len(new_services)
+    gamma = mdp.gamma if gamma is None else gamma
+    dfa = dfa.trim()
+    recomposition = _Recomposition(
+        mdp_dynamics(mdp), dfa, old_services, new_services, old_service_ids
+    )
+    return _build_mdp(recomposition.run(), new_services, dfa, gamma)
+
+
+def add_service(
+    mdp: MDP,
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    new_service: Service,
+    gamma: Optional[float] = None,
+) -> MDP:
+    """
+    Update a comp_mdp composition after adding a service (as the last one).
+
+    :param mdp: the composition MDP of dfa and services.
+    :param dfa: the target DFA.
+    :param services: the current community.
+    :param new_service: the service to add.
+    :param gamma: the discount factor (default: the one of mdp).
+    :return: the composition MDP of dfa and services + [new_service].
+    """
+    new_services = list(services) + [new_service]
+    old_service_ids: List[Optional[int]] = list(range(len(services)))
+    old_service_ids.append(None)
+    return update_composition(mdp, dfa, services, new_services, old_service_ids, gamma)
+
+
+def remove_service(
+    mdp: MDP,
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    service_id: int,
+    gamma: Optional[float] = None,
+) -> MDP:
+    """
+    Update a comp_mdp composition after removing a service.
+
+    The services after the removed one shift their index by one.
+
+    :param mdp: the composition MDP of dfa and services.
+    :param dfa: the target DFA.
+    :param services: the current community.
+    :param service_id: the index of the service to remove.
+    :param gamma: the discount factor (default: the one of mdp).
+    :return: the composition MDP of dfa and the remaining services.
+    """
+    new_services = [s for i, s in enumerate(services) if i != service_id]
+    old_service_ids: List[Optional[int]] = [
+        i for i in range(len(services)) if i != service_id
+    ]
+    return update_composition(mdp, dfa, services, new_services, old_service_ids, gamma)
+
+
+def replace_service(
+    mdp: MDP,
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    service_id: int,
+    new_service: Service,
+    gamma: Optional[float] = None,
+) -> MDP:
+    """
+    Update a comp_mdp composition after replacing a service.
+
+    If the new service has the same transition structure as the old one (only
+    probabilities and rewards changed), the state space is unchanged and only
+    the transitions of that service are recomputed.
+
+    :param mdp: the composition MDP of dfa and services.
+    :param dfa: the target DFA.
+    :param services: the current community.
+    :param service_id: the index of the service to replace.
+    :param new_service: the new service.
+    :param gamma: the discount factor (default: the one of mdp).
+    :return: the composition MDP with the replaced service.
+    """
+    new_services = list(services)
+    new_services[service_id] = new_service
+    old_service_ids: List[Optional[int]] = list(range(len(services)))
+    old_service_ids[service_id] = None
+    if not _same_structure(services[service_id], new_service):
+        return update_composition(mdp, dfa, services, new_services, old_service_ids, gamma)
+
+    gamma = mdp.gamma if gamma is None else gamma
+    dfa = dfa.trim()
+    recomposition = _Recomposition(
+        mdp_dynamics(mdp), dfa, services, new_services, old_service_ids
+    )
+    transition_function: MDPDynamics = {}
+    for state, old_transitions in recomposition.old_dynamics.items():
+        touched = any(
+            action != COMPOSITION_MDP_UNDEFINED_ACTION and action[1] == service_id
+            for action in old_transitions.keys()
+        )
+        if not touched:
+            transition_function[state] = old_transitions
+            continue
+        new_transitions = {
+            action: transition
+            for action, transition in old_transitions.items()
+            if action[1] != service_id
+        }
+        new_transitions.update(
+            recomposition.service_transitions(cast(CompositionState, state), service_id)
+        )
+        transition_function[state] = new_transitions
+    return _build_mdp(transition_function, new_services, dfa, gamma)
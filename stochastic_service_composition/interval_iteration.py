@@ -0,0 +1,297 @@
+"""
+This module implements interval value iteration on array-backed MDPs.
+
+A lower and an upper bound on the optimal value function are iterated with the
+Bellman optimality operator B. Since the bounds start from a sound interval
+(rewards are bounded and states without actions have value 0), and B is
+monotone, they stay sound at every sweep. At every sweep they are also
+tightened with the MacQueen bounds: for any value function V,
+
+    BV + gamma / (1 - gamma) * min(min(BV - V), 0) <= V* <= BV + gamma / (1 - gamma) * max(max(BV - V), 0)
+
+(the clamping to 0 accounts for the states without actions, whose value is
+fixed). Hence the iteration can stop with a guarantee as soon as the gap
+between the bounds is small enough, or as soon as the greedy policy is
+provably optimal, and the gap shrinks as fast as the residual of value
+iteration.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from stochastic_service_composition.array_mdp import NO_ACTION, ArrayMDP, segment_max
+from stochastic_service_composition.solvers import DEFAULT_TOLERANCE, SolverResult
+
+
+class IntervalSolverResult(SolverResult):
+    """The output of interval value iteration: the values are the midpoints of the bounds."""
+
+    def __init__(
+        self,
+        mdp: ArrayMDP,
+        lower: np.ndarray,
+        upper: np.ndarray,
+        policy: np.ndarray,
+        iterations: int,
+        backups: int,
+        residual: float,
+        gamma: float,
+        policy_certified: bool,
+        eliminations: Optional[List[int]] = None,
+        q_backups: int = 0,
+    ):
+        """
+        Initialize the result.
+
+        :param mdp: the solved MDP.
+        :param lower: the lower bound of every state.
+        :param upper: the upper bound of every state.
+        :param policy: the chosen state-action pair of every state.
+        :param iterations: the number of sweeps performed.
+        :param backups: the number of state backups performed (on both bounds).
+        :param residual: the maximum change of the bounds in the last sweep.
+        :param gamma: the discount factor.
+        :param policy_certified: whether the policy is provably optimal.
+        :param eliminations: the number of state-action pairs eliminated at
+          every sweep, if action elimination was enabled.
+        :param q_backups: the number of state-action backups performed (on both bounds).
+        """
+        super().__init__(
+            mdp, (lower + upper) / 2.0, policy, iterations, backups, residual, gamma
+        )
+        self.lower = lower
+        self.upper = upper
+        self.policy_certified = policy_certified
+        self.eliminations = eliminations if eliminations is not None else []
+        self.q_backups = q_backups
+
+    @property
+    def nb_eliminated_actions(self) -> int:
+        """Get the total number of state-action pairs eliminated."""
+        return sum(self.eliminations)
+
+    @property
+    def gap(self) -> float:
+        """Get the certified gap: the maximum difference between the bounds."""
+        return float(np.max(self.upper - self.lower, initial=0.0))
+
+    @property
+    def error_bound(self) -> float:
+        """Get a bound on the distance between the values and the optimal values."""
+        return self.gap / 2.0
+
+
+def initial_bounds(mdp: ArrayMDP, gamma: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute a sound initial interval for the optimal value function.
+
+    Every run collects rewards in [r_min, r_max] until it reaches a state
+    without actions (value 0), hence the optimal value of every state is in
+    [min(r_min, 0) / (1 - gamma), max(r_max, 0) / (1 - gamma)].
+
+    :param mdp: the MDP.
+    :param gamma: the discount factor (strictly less than 1).
+    :return: the lower and the upper bound of every state.
+    """
+    assert 0.0 <= gamma < 1.0, "interval iteration needs a discount factor less than 1"
+    r_min = min(float(np.min(mdp.sa_rewards, initial=0.0)), 0.0)
+    r_max = max(float(np.max(mdp.sa_rewards, initial=0.0)), 0.0)
+    has_action = mdp.state_action_ptr[1:] > mdp.state_action_ptr[:-1]
+    lower = np.where(has_action, r_min / (1.0 - gamma), 0.0)
+    upper = np.where(has_action, r_max / (1.0 - gamma), 0.0)
+    return lower, upper
+
+
+def equivalent_actions(mdp: ArrayMDP) -> np.ndarray:
+    """
+    Find the state-action pairs with the same reward and transitions.
+
+    Such pairs (e.g. the same action of two identical services) have the same
+    Q-value for any value function, hence the bounds can never separate them.
+
+    :param mdp: the MDP.
+    :return: for every state-action pair, the first equivalent pair of the same state.
+    """
+    representative = np.arange(mdp.nb_state_actions)
+    for s in range(mdp.nb_states):
+        start, end = mdp.state_action_ptr[s], mdp.state_action_ptr[s + 1]
+        if end - start < 2:
+            continue
+        seen: Dict[Tuple[float, Tuple[int, ...], Tuple[float, ...]], int] = {}
+        for k in range(start, end):
+            t_start, t_end = mdp.transition_ptr[k], mdp.transition_ptr[k + 1]
+            key = (
+                float(mdp.sa_rewards[k]),
+                tuple(mdp.next_states[t_start:t_end].tolist()),
+                tuple(mdp.probs[t_start:t_end].tolist()),
+            )
+            representative[k] = seen.setdefault(key, k)
+    return representative
+
+
+def is_policy_optimal(
+    mdp: ArrayMDP,
+    policy: np.ndarray,
+    lower_q: np.ndarray,
+    upper_q: np.ndarray,
+    representative: Optional[np.ndarray] = None,
+) -> bool:
+    """
+    Check whether a policy is provably optimal given bounds on the Q-values.
+
+    The policy is optimal if, in every state, the lower bound of the chosen
+    action is at least the upper bound of every other action (except the
+    actions equivalent to the chosen one).
+
+    :param mdp: the MDP.
+    :param policy: the chosen state-action pair of every state.
+    :param lower_q: a lower bound on the optimal Q-values.
+    :param upper_q: an upper bound on the optimal Q-values.
+    :param representative: the output of equivalent_actions, if available.
+    :return: True if the policy is optimal.
+    """
+    if representative is None:
+        representative = np.arange(mdp.nb_state_actions)
+    has_action = policy != NO_ACTION
+    chosen = policy[has_action]
+    chosen_by_sa = np.where(has_action, policy, 0)[mdp.sa_states]
+    others = np.where(
+        representative == representative[chosen_by_sa], -np.inf, upper_q
+    )
+    best_other = segment_max(others, mdp.state_action_ptr, empty=-np.inf)[has_action]
+    return bool(np.all(lower_q[chosen] >= best_other))
+
+
+def suboptimal_actions(
+    mdp: ArrayMDP, lower_q: np.ndarray, upper_q: np.ndarray
+) -> np.ndarray:
+    """
+    Find the state-action pairs that are provably suboptimal.
+
+    A pair is suboptimal if its upper Q-bound is below the lower Q-bound of
+    another action of the same state. The best action of every state is
+    never suboptimal, so every state keeps at least one action.
+
+    :param mdp: the MDP.
+    :param lower_q: a lower bound on the optimal Q-values.
+    :param upper_q: an upper bound on the optimal Q-values.
+    :return: whether each state-action pair is suboptimal.
+    """
+    best_lower = segment_max(lower_q, mdp.state_action_ptr, empty=-np.inf)
+    return upper_q < best_lower[mdp.sa_states]
+
+
+def interval_value_iteration(
+    mdp: ArrayMDP,
+    gamma: Optional[float] = None,
+    tol: float = DEFAULT_TOLERANCE,
+    max_iterations: Optional[int] = None,
+    stop_on_optimal_policy: bool = True,
+    eliminate_actions: bool = False,
+    compaction_threshold: float = 0.1,
+) -> IntervalSolverResult:
+    """
+    Run interval value iteration.
+
+    Iteration stops when the gap between the bounds is below tol, or (if
+    stop_on_optimal_policy) when the greedy policy with respect to the lower
+    bound is provably optimal. In both cases the result is certified: the
+    optimal value of every state is between the returned bounds.
+
+    With action elimination, the provably suboptimal state-action pairs are
+    permanently dropped from the backups. This does not change the optimal
+    values, hence the bounds stay sound. The MDP is compacted as soon as
+    the eliminated pairs are a given fraction of the remaining ones.
+
+    :param mdp: the MDP.
+    :param gamma: the discount factor (default: the one of the MDP).
+    :param tol: the maximum gap between the bounds.
+    :param max_iterations: the maximum number of sweeps, if any.
+    :param stop_on_optimal_policy: whether to stop as soon as the policy is optimal.
+    :param eliminate_actions: whether to eliminate the suboptimal actions.
+    :param compaction_threshold: the fraction of eliminated pairs that triggers a compaction.
+    :return: the bounds and the greedy policy.
+    """
+    gamma = mdp.gamma if gamma is None else gamma
+    lower, upper = initial_bounds(mdp, gamma)
+    has_action = mdp.state_action_ptr[1:] > mdp.state_action_ptr[:-1]
+    factor = gamma / (1.0 - gamma)
+    representative = equivalent_actions(mdp) if stop_on_optimal_policy else None
+    eliminations: List[int] = []
+
+    # the MDP the backups are performed on, and its state-action pairs in mdp
+    current = mdp
+    kept = np.arange(mdp.nb_state_actions)
+    current_representative = representative
+    eliminated = np.zeros(mdp.nb_state_actions, dtype=bool)
+
+    lower_q = current.q_values(lower, gamma)
+    upper_q = current.q_values(upper, gamma)
+    policy = current.greedy(lower_q)
+    certified = False
+    residual = np.inf
+    iterations = 0
+    q_backups = 0
+    while max_iterations is None or iterations < max_iterations:
+        backed_lower = segment_max(lower_q, current.state_action_ptr, empty=0.0)
+        backed_upper = segment_max(upper_q, current.state_action_ptr, empty=0.0)
+        iterations += 1
+        q_backups += 2 * current.nb_state_actions
+        lower_increase = float(np.max(backed_lower - lower, initial=0.0))
+        upper_decrease = float(np.min(backed_upper - upper, initial=0.0))
+        # MacQueen bounds from the iterates of both bounds
+        new_lower = np.maximum(backed_lower, backed_upper + factor * upper_decrease)
+        new_upper = np.minimum(backed_upper, backed_lower + factor * lower_increase)
+        new_lower[~has_action] = 0.0
+        new_upper[~has_action] = 0.0
+        residual = float(
+            max(
+                np.max(new_lower - lower, initial=0.0),
+                np.max(upper - new_upper, initial=0.0),
+            )
+        )
+        lower, upper = new_lower, new_upper
+        lower_q = current.q_values(lower, gamma)
+        upper_q = current.q_values(upper, gamma)
+
+        if eliminate_actions:
+            newly_eliminated = suboptimal_actions(current, lower_q, upper_q) & ~eliminated
+            eliminations.append(int(newly_eliminated.sum()))
+            eliminated |= newly_eliminated
+            nb_eliminated = int(eliminated.sum())
+            if nb_eliminated > 0 and nb_eliminated >= compaction_threshold * len(eliminated):
+                remaining = ~eliminated
+                old_to_new = np.cumsum(remaining) - 1
+                current = current.restrict(remaining)
+                kept = kept[remaining]
+                lower_q, upper_q = lower_q[remaining], upper_q[remaining]
+                if current_representative is not None:
+                    # equivalent pairs have the same bounds, hence are eliminated together
+                    current_representative = old_to_new[current_representative[remaining]]
+                eliminated = np.zeros(current.nb_state_actions, dtype=bool)
+
+        policy = current.greedy(lower_q)
+        if np.max(upper - lower, initial=0.0) < tol:
+            break
+        if stop_on_optimal_policy and is_policy_optimal(
+            current, policy, lower_q, upper_q, current_representative
+        ):
+            certified = True
+            break
+    if not certified:
+        certified = is_policy_optimal(
+            current, policy, lower_q, upper_q, current_representative
+        )
+    return IntervalSolverResult(
+        mdp,
+        lower,
+        upper,
+        np.where(policy == NO_ACTION, NO_ACTION, kept[np.maximum(policy, 0)]),
+        iterations,
+        2 * iterations * mdp.nb_states,
+        residual,
+        gamma,
+        certified,
+        eliminations if eliminate_actions else None,
+        q_backups,
+    )
@@ -0,0 +1,238 @@
+"""
+This module implements matrix-free value iteration on the composition of comp_mdp.
+
+The system service is an interleaving of independent services: every joint
+action (symbol, i) changes only the i-th component (and the DFA state). Hence
+the joint transition matrix never needs to be materialized: the expected next
+value of action (symbol, i) is computed by applying the small local transition
+matrix of service i along the i-th axis of the value function, seen as a tensor
+of shape (|S_1|, ..., |S_n|, |Q|), after moving the DFA axis according to the
+DFA transition of the symbol. The model takes memory proportional to the sum of
+the local transition matrices (times |Q| for the DFA tables), instead of the
+explicit edge list of the product.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple, cast
+
+import numpy as np
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.batched_composition import CompositionTables
+from stochastic_service_composition.composition_mdp import (
+    COMPOSITION_MDP_SINK_STATE,
+    COMPOSITION_MDP_UNDEFINED_ACTION,
+    DEFAULT_GAMMA,
+)
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.solvers import DEFAULT_TOLERANCE
+from stochastic_service_composition.types import Action, CompositionState, State
+
+
+class LocalAction:
+    """A service action (symbol, service_id), with its local transition matrix."""
+
+    def __init__(
+        self,
+        service_id: int,
+        symbol: int,
+        matrix: np.ndarray,
+        rewards: np.ndarray,
+        available: np.ndarray,
+    ):
+        """
+        Initialize the local action.
+
+        :param service_id: the index of the service.
+        :param symbol: the index of the symbol in CompositionTables.symbols.
+        :param matrix: the local transition matrix, of shape (|S_i|, |S_i|).
+        :param rewards: the reward of the action in every local state.
+        :param available: whether the action is available in every local state.
+        """
+        self.service_id = service_id
+        self.symbol = symbol
+        self.matrix = matrix
+        self.rewards = rewards
+        self.available = available
+
+
+class KroneckerSolution:
+    """The value function computed by kronecker_value_iteration, with its greedy policy."""
+
+    def __init__(
+        self,
+        tables: CompositionTables,
+        local_actions: Sequence[LocalAction],
+        values: np.ndarray,
+        gamma: float,
+        iterations: int,
+    ):
+        """
+        Initialize the solution.
+
+        :param tables: the composition tables.
+        :param local_actions: the local actions.
+        :param values: the value tensor, of shape (|S_1|, ..., |S_n|, |Q|).
+        :param gamma: the discount factor.
+        :param iterations: the number of sweeps performed.
+        """
+        self.tables = tables
+        self.local_actions = local_actions
+        self.values = values
+        self.gamma = gamma
+        self.iterations = iterations
+
+    def _indices(self, state: State) -> Tuple[List[int], int]:
+        system_state, dfa_state = cast(CompositionState, state)
+        encoder = self.tables.encoder
+        local_indices = [
+            encoder.service_state_index[i][component]
+            for i, component in enumerate(system_state)
+        ]
+        return local_indices, encoder.dfa_state_index[dfa_state]
+
+    def value(self, state: State) -> float:
+        """Get the value of a composition state ((s_1, ..., s_n), q)."""
+        if state == COMPOSITION_MDP_SINK_STATE:
+            return 0.0
+        local_indices, q = self._indices(state)
+        return float(self.values[tuple(local_indices) + (q,)])
+
+    def q_values(self, state: State) -> Dict[Action, float]:
+        """Get the Q-value of every action available in a composition state."""
+        if state == COMPOSITION_MDP_SINK_STATE:
+            return {COMPOSITION_MDP_UNDEFINED_ACTION: 0.0}
+        local_indices, q = self._indices(state)
+        tables = self.tables
+        if tables.sink[q]:
+            return {COMPOSITION_MDP_UNDEFINED_ACTION: 0.0}
+        result: Dict[Action, float] = {}
+        for local in self.local_actions:
+            i = local.service_id
+            x_i = local_indices[i]
+            next_q = tables.next_dfa[q, local.symbol]
+            if not (local.available[x_i] and tables.allowed[q, i] and next_q >= 0):
+                continue
+            goal = 0.0 if tables.tau_symbols[local.symbol] else tables.accepting[next_q]
+            next_indices = list(local_indices) + [next_q]
+            expected = 0.0
+            for y in np.flatnonzero(local.matrix[x_i]).tolist():
+                next_indices[i] = y
+                expected += local.matrix[x_i, y] * self.values[tuple(next_indices)]
+            symbol = tables.symbols[local.symbol]
+            result[(symbol, i)] = local.rewards[x_i] + goal + self.gamma * expected
+        return result
+
+    def action(self, state: State) -> Optional[Action]:
+        """Get the greedy action in a composition state (None if there is no action)."""
+        q_values = self.q_values(state)
+        if len(q_values) == 0:
+            return None
+        return max(q_values, key=q_values.__getitem__)
+
+
+def build_local_actions(tables: CompositionTables) -> List[LocalAction]:
+    """Group the local transitions by (service, symbol) into local matrices."""
+    radices = tables.encoder.radices.tolist()
+    by_action: Dict[Tuple[int, int], LocalAction] = {}
+    for local in tables.local_transitions:
+        key = (local.service_id, local.symbol)
+        if key not in by_action:
+            n_i = radices[local.service_id]
+            by_action[key] = LocalAction(
+                local.service_id,
+                local.symbol,
+                np.zeros((n_i, n_i)),
+                np.zeros(n_i),
+                np.zeros(n_i, dtype=bool),
+            )
+        action = by_action[key]
+        action.matrix[local.state, local.next_states] = local.probs
+        action.rewards[local.state] = local.reward
+        action.available[local.state] = True
+    return list(by_action.values())
+
+
+def _broadcast_along(vector: np.ndarray, axis: int, ndim: int) -> np.ndarray:
+    """Reshape a vector so that it broadcasts along one axis of an ndim-tensor."""
+    shape = [1] * ndim
+    shape[axis] = len(vector)
+    return vector.reshape(shape)
+
+
+def _bellman_backup(
+    tables: CompositionTables,
+    local_actions: Sequence[LocalAction],
+    values: np.ndarray,
+    gamma: float,
+) -> np.ndarray:
+    """Apply the Bellman optimality operator to the value tensor."""
+    ndim = values.ndim
+    dfa_axis = ndim - 1
+    new_values = np.full(values.shape, -np.inf)
+    # the actions are grouped by symbol, so that a single shifted tensor is alive at a time
+    by_symbol: Dict[int, List[LocalAction]] = {}
+    for local in local_actions:
+        by_symbol.setdefault(local.symbol, []).append(local)
+    for symbol, symbol_actions in by_symbol.items():
+        next_dfa = tables.next_dfa[:, symbol]
+        # value of the DFA successor, for every DFA state
+        shifted = np.take(values, np.maximum(next_dfa, 0), axis=dfa_axis)
+        goal = (
+            np.zeros(len(next_dfa))
+            if tables.tau_symbols[symbol]
+            else np.where(next_dfa >= 0, tables.accepting[np.maximum(next_dfa, 0)], 0.0)
+        )
+        for local in symbol_actions:
+            i = local.service_id
+            expected = np.moveaxis(np.tensordot(local.matrix, shifted, axes=([1], [i])), 0, i)
+            q_values = (
+                _broadcast_along(local.rewards, i, ndim)
+                + _broadcast_along(goal, dfa_axis, ndim)
+                + gamma * expected
+            )
+            valid_dfa = (next_dfa >= 0) & tables.allowed[:, i]
+            valid = _broadcast_along(local.available, i, ndim) & _broadcast_along(
+                valid_dfa, dfa_axis, ndim
+            )
+            np.maximum(new_values, np.where(valid, q_values, -np.inf), out=new_values)
+        del shifted
+    # sink states and states without actions have value 0
+    new_values[np.isneginf(new_values)] = 0.0
+    return new_values
+
+
+def kronecker_value_iteration(
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    gamma: float = DEFAULT_GAMMA,
+    tol: float = DEFAULT_TOLERANCE,
+    max_iterations: Optional[int] = None,
+) -> KroneckerSolution:
+    """
+    Solve the composition MDP of comp_mdp without building it.
+
+    The value tensor covers all the combinations of local states and DFA
+    states; on the states reachable in comp_mdp it coincides with value
+    iteration on the explicit composition MDP.
+
+    :param dfa: the target DFA.
+    :param services: the community of services.
+    :param gamma: the discount factor.
+    :param tol: the tolerance on successive differences.
+    :param max_iterations: the maximum number of sweeps, if any.
+    :return: the solution.
+    """
+    dfa = dfa.trim()
+    tables = CompositionTables(dfa, services)
+    local_actions = build_local_actions(tables)
+    shape = tuple(tables.encoder.radices.tolist()) + (tables.encoder.nb_dfa_states,)
+
+    values = np.zeros(shape)
+    iterations = 0
+    while max_iterations is None or iterations < max_iterations:
+        new_values = _bellman_backup(tables, local_actions, values, gamma)
+        iterations += 1
+        residual = np.max(np.abs(new_values - values), initial=0.0)
+        values = new_values
+        if residual < tol:
+            break
+    return KroneckerSolution(tables, local_actions, values, gamma, iterations)
@@ -0,0 +1,393 @@
+"""
+This module implements a Monte Carlo tree search planner for online orchestration.
+
+The planner does not build the composition MDP: the transition functions of
+the services and the target DFA are used as a generative model, through a
+LazyCompositionMDP (only the states reached by the search are generated).
+The search is UCT with chance nodes:
+
+- a decision node is a composition state ((s_1, ..., s_n), q); its children
+  are chance nodes, one per action (symbol, service_id), selected with the
+  UCB1 rule on the (normalized) mean returns;
+- a chance node samples the next composition state from the distribution
+  of the service that executes the action;
+- a new leaf is evaluated with random rollouts, which are vectorized: a
+  VectorizedRollouts compiles the services and the DFA into padded numpy
+  tables, so that a batch of rollouts advances with a few array operations
+  per step.
+"""
+import math
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, cast
+
+import numpy as np
+
+from stochastic_service_composition.composition_mdp import COMPOSITION_MDP_SINK_STATE
+from stochastic_service_composition.rtdp import LazyCompositionMDP
+from stochastic_service_composition.types import Action, CompositionState, State
+
+
+class VectorizedRollouts:
+    """Random rollouts of a composition, run in batches with numpy."""
+
+    def __init__(self, mdp: LazyCompositionMDP, seed: Optional[int] = None):
+        """
+        Compile the services and the DFA of a lazy composition into arrays.
+
+        For every service i, local state s and DFA state q, the tables list the
+        actions of service i in s that are available in the composition state
+        (as in comp_mdp), with their reward, next DFA state and next local
+        state distribution.
+
+        :param mdp: the lazy composition MDP.
+        :param seed: the seed of the random generator.
+        """
+        self.mdp = mdp
+        self.rng = np.random.default_rng(seed)
+        dfa = mdp.dfa
+        self.dfa_states = sorted(dfa.states, key=str)
+        self.dfa_index = {q: i for i, q in enumerate(self.dfa_states)}
+        self.local_states = [sorted(service.states, key=str) for service in mdp.services]
+        self.local_index = [
+            {s: i for i, s in enumerate(states)} for states in self.local_states
+        ]
+
+        # (service, local state, DFA state) -> (reward, next q, next local states, probs)
+        actions: Dict[Tuple[int, int, int], List[Tuple[float, int, List[int], List[float]]]]
+        actions = {}
+        for service_id, service in enumerate(mdp.services):
+            local_index = self.local_index[service_id]
+            for q in self.dfa_states:
+                if service_id not in mdp.allowed_services(q):
+                    continue
+                dfa_transitions = dfa.transition_function.get(q, {})
+                for s, transitions in service.transition_function.items():
+                    key = (service_id, local_index[s], self.dfa_index[q])
+                    for symbol, (next_states, reward) in transitions.items():
+                        if symbol not in dfa.alphabet:
+                            next_q = q
+                            goal_reward = 0.0
+                        elif symbol in dfa_transitions:
+                            next_q = dfa_transitions[symbol]
+                            goal_reward = 1.0 if dfa.is_accepting(next_q) else 0.0
+                        else:
+                            continue
+                        actions.setdefault(key, []).append(
+                            (
+                                goal_reward + reward,
+                                self.dfa_index[next_q],
+                                [local_index[next_state] for next_state in next_states],
+                                list(next_states.values()),
+                            )
+                        )
+
+        nb_services = len(mdp.services)
+        max_states = max((len(states) for states in self.local_states), default=1)
+        max_actions = max((len(value) for value in actions.values()), default=1)
+        max_successors = max(
+            (len(action[2]) for value in actions.values() for action in value), default=1
+        )
+        shape = (nb_services, max_states, len(self.dfa_states), max_actions)
+        self.action_count = np.zeros(shape[:3], dtype=np.int64)
+        self.action_reward = np.zeros(shape)
+        self.action_next_dfa_state = np.zeros(shape, dtype=np.int64)
+        self.next_local_state = np.zeros(shape + (max_successors,), dtype=np.int64)
+        # padded with 2.0 (and ending with exactly 1.0), so that a padding
+        # successor is never sampled
+        self.cumulative_probs = np.full(shape + (max_successors,), 2.0)
+        for (service_id, s, q), value in actions.items():
+            self.action_count[service_id, s, q] = len(value)
+            for a, (reward, next_q, next_locals, probs) in enumerate(value):
+                self.action_reward[service_id, s, q, a] = reward
+                self.action_next_dfa_state[service_id, s, q, a] = next_q
+                self.next_local_state[service_id, s, q, a, : len(next_locals)] = next_locals
+                self.cumulative_probs[service_id, s, q, a, : len(probs)] = np.cumsum(probs)
+                self.cumulative_probs[service_id, s, q, a, len(probs) - 1] = 1.0
+
+    def encode(self, state: State) -> Tuple[np.ndarray, int]:
+        """
+        Encode a composition state.
+
+        :param state: the composition state ((s_1, ..., s_n), q).
+        :return: the local state indices and the DFA state index.
+        """
+        system_state, dfa_state = cast(CompositionState, state)
+        local = np.array(
+            [index[s] for index, s in zip(self.local_index, system_state)], dtype=np.int64
+        )
+        return local, self.dfa_index[dfa_state]
+
+    def run(self, state: State, nb_rollouts: int, depth: int) -> np.ndarray:
+        """
+        Run random rollouts from a composition state.
+
+        At every step, every rollout picks an available action uniformly at
+        random; a rollout without available actions gets reward 0 from then on.
+
+        :param state: the start state ((s_1, ..., s_n), q).
+        :param nb_rollouts: the number of rollouts.
+        :param depth: the number of steps of every rollout.
+        :return: the discounted return of every rollout.
+        """
+        gamma = self.mdp.gamma
+        start_local, start_q = self.encode(state)
+        local = np.repeat(start_local[None, :], nb_rollouts, axis=0)
+        q = np.full(nb_rollouts, start_q, dtype=np.int64)
+        rows = np.arange(nb_rollouts)
+        service_ids = np.arange(local.shape[1])
+        returns = np.zeros(nb_rollouts)
+        discount = 1.0
+        for _ in range(depth):
+            counts = self.action_count[service_ids[None, :], local, q[:, None]]
+            cumulative_counts = np.cumsum(counts, axis=1)
+            total = cumulative_counts[:, -1]
+            alive = total > 0
+            if not alive.any():
+                break
+            pick = np.floor(self.rng.random(nb_rollouts) * total).astype(np.int64)
+            service = np.minimum(
+                (pick[:, None] >= cumulative_counts).sum(axis=1), local.shape[1] - 1
+            )
+            action = pick - (cumulative_counts[rows, service] - counts[rows, service])
+            s = local[rows, service]
+            reward = self.action_reward[service, s, q, action]
+            successor = (
+                self.rng.random(nb_rollouts)[:, None]
+                >= self.cumulative_probs[service, s, q, action]
+            ).sum(axis=1)
+            next_local = self.next_local_state[service, s, q, action, successor]
+            returns += discount * np.where(alive, reward, 0.0)
+            local[rows[alive], service[alive]] = next_local[alive]
+            q = np.where(alive, self.action_next_dfa_state[service, s, q, action], q)
+            discount *= gamma
+        return returns
+
+
+class _ChanceNode:
+    """A chance node: an action taken in a decision node."""
+
+    def __init__(
+        self,
+        action: Action,
+        reward: float,
+        next_states: Sequence[State],
+        probs: Sequence[float],
+    ):
+        """
+        Initialize the chance node.
+
+        :param action: the action.
+        :param reward: the reward of the action.
+        :param next_states: the possible next states.
+        :param probs: the probabilities of the next states.
+        """
+        self.action = action
+        self.reward = reward
+        self.next_states = next_states
+        self.probs = probs
+        self.visits = 0
+        self.total = 0.0
+        self.children: Dict[State, "_DecisionNode"] = {}
+
+    @property
+    def mean(self) -> float:
+        """Get the mean return of the action."""
+        return self.total / self.visits
+
+
+class _DecisionNode:
+    """A decision node: a composition state."""
+
+    def __init__(self, state: State):
+        """
+        Initialize the decision node.
+
+        :param state: the composition state.
+        """
+        self.state = state
+        self.visits = 0
+        self.children: Optional[List[_ChanceNode]] = None
+
+
+class MCTSResult:
+    """The output of a call to MCTSPlanner.plan."""
+
+    def __init__(
+        self,
+        state: State,
+        action: Optional[Action],
+        value: float,
+        action_values: Dict[Action, Tuple[float, int]],
+        simulations: int,
+        rollouts: int,
+        elapsed: float,
+    ):
+        """
+        Initialize the result.
+
+        :param state: the state the planner was called from.
+        :param action: the most visited action (None if the state has no actions).
+        :param value: the mean return of the chosen action.
+        :param action_values: the mean return and the number of visits of every action.
+        :param simulations: the number of simulations.
+        :param rollouts: the number of rollouts.
+        :param elapsed: the planning time, in seconds.
+        """
+        self.state = state
+        self.action = action
+        self.value = value
+        self.action_values = action_values
+        self.simulations = simulations
+        self.rollouts = rollouts
+        self.elapsed = elapsed
+
+    @property
+    def rollouts_per_second(self) -> float:
+        """Get the simulation throughput."""
+        return self.rollouts / self.elapsed if self.elapsed > 0.0 else math.inf
+
+
+class MCTSPlanner:
+    """A UCT planner with chance nodes, over a lazily generated composition."""
+
+    def __init__(
+        self,
+        mdp: LazyCompositionMDP,
+        exploration: float = math.sqrt(2.0),
+        max_depth: int = 50,
+        rollouts_per_leaf: int = 16,
+        seed: Optional[int] = None,
+    ):
+        """
+        Initialize the planner.
+
+        :param mdp: the lazy composition MDP, used as a generative model.
+        :param exploration: the exploration constant of UCB1 (the mean returns
+          are normalized in [0, 1] with the extreme values seen in the tree).
+        :param max_depth: the horizon of a simulation (tree path plus rollout).
+        :param rollouts_per_leaf: the number of rollouts that evaluate a new leaf.
+        :param seed: the seed of the random generators.
+        """
+        assert 0.0 <= mdp.gamma < 1.0, "MCTS needs a discount factor less than 1"
+        assert rollouts_per_leaf > 0, "at least one rollout per leaf is needed"
+        self.mdp = mdp
+        self.exploration = exploration
+        self.max_depth = max_depth
+        self.rollouts_per_leaf = rollouts_per_leaf
+        self.random = random.Random(seed)
+        self.rollouts = VectorizedRollouts(mdp, seed)
+        self._min_mean = math.inf
+        self._max_mean = -math.inf
+
+    def _normalize(self, value: float) -> float:
+        """Normalize a mean return with the extreme mean returns seen in the tree."""
+        if self._max_mean > self._min_mean:
+            return (value - self._min_mean) / (self._max_mean - self._min_mean)
+        return 0.5
+
+    def _expand(self, node: _DecisionNode) -> None:
+        """Create the chance nodes of a decision node (none for the terminal states)."""
+        if self.mdp.is_terminal(node.state):
+            node.children = []
+            return
+        node.children = [
+            _ChanceNode(action, reward, next_states, probs)
+            for action, reward, next_states, probs in self.mdp.transitions(node.state)
+        ]
+
+    def _select(self, node: _DecisionNode) -> _ChanceNode:
+        """Select a chance node with UCB1 (unvisited actions first)."""
+        assert node.children, "the node must be expanded, and have actions"
+        best, best_score = node.children[0], -math.inf
+        log_visits = math.log(max(node.visits, 1))
+        for child in node.children:
+            if child.visits == 0:
+                return child
+            score = self._normalize(child.mean) + self.exploration * math.sqrt(
+                log_visits / child.visits
+            )
+            if score > best_score:
+                best, best_score = child, score
+        return best
+
+    def _evaluate(self, state: State, depth: int) -> Tuple[float, int]:
+        """Estimate the value of a new leaf with a batch of rollouts."""
+        if depth <= 0 or self.mdp.is_terminal(state):
+            return 0.0, 0
+        returns = self.rollouts.run(state, self.rollouts_per_leaf, depth)
+        return float(returns.mean()), self.rollouts_per_leaf
+
+    def _simulate(self, root: _DecisionNode) -> int:
+        """Run a simulation from the root, and return the number of rollouts."""
+        path: List[Tuple[_DecisionNode, _ChanceNode]] = []
+        node = root
+        depth = self.max_depth
+        value, rollouts = 0.0, 0
+        while depth > 0:
+            if node.children is None:
+                self._expand(node)
+                value, rollouts = self._evaluate(node.state, depth)
+                break
+            if len(node.children) == 0:
+                break
+            chance = self._select(node)
+            next_state = self.random.choices(chance.next_states, chance.probs)[0]
+            path.append((node, chance))
+            if next_state not in chance.children:
+                chance.children[next_state] = _DecisionNode(next_state)
+            node = chance.children[next_state]
+            depth -= 1
+        node.visits += 1
+        for decision, chance in reversed(path):
+            value = chance.reward + self.mdp.gamma * value
+            decision.visits += 1
+            chance.visits += 1
+            chance.total += value
+            self._min_mean = min(self._min_mean, chance.mean)
+            self._max_mean = max(self._max_mean, chance.mean)
+        return rollouts
+
+    def plan(
+        self,
+        state: Optional[State] = None,
+        simulations: Optional[int] = 1000,
+        time_budget: Optional[float] = None,
+    ) -> MCTSResult:
+        """
+        Search from a state, and return the next action.
+
+        :param state: the current state (default: the initial state of the MDP).
+        :param simulations: the maximum number of simulations, if any.
+        :param time_budget: the planning time, in seconds, if any.
+        :return: the most visited action, with the search statistics.
+        """
+        assert (
+            simulations is not None or time_budget is not None
+        ), "the search must be bounded"
+        start_time = time.monotonic()
+        state = self.mdp.initial_state if state is None else state
+        root = _DecisionNode(state)
+        self._min_mean, self._max_mean = math.inf, -math.inf
+        nb_simulations = 0
+        nb_rollouts = 0
+        if state != COMPOSITION_MDP_SINK_STATE:
+            while simulations is None or nb_simulations < simulations:
+                if time_budget is not None and time.monotonic() - start_time >= time_budget:
+                    break
+                nb_rollouts += self._simulate(root)
+                nb_simulations += 1
+                if root.children is not None and len(root.children) == 0:
+                    break
+
+        children = [child for child in root.children or [] if child.visits > 0]
+        best = max(children, key=lambda child: child.visits, default=None)
+        return MCTSResult(
+            state,
+            None if best is None else best.action,
+            0.0 if best is None else best.mean,
+            {child.action: (child.mean, child.visits) for child in children},
+            nb_simulations,
+            nb_rollouts,
+            time.monotonic() - start_time,
+        )
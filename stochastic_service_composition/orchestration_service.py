@@ -0,0 +1,559 @@
+"""
+This module implements an event-driven orchestration service around a solved policy.
+
+Every service reports its state changes (e.g. "av" -> "br", "re" -> "con") as
+ServiceEvent objects, either directly (OrchestrationService.submit) or through
+a publish/subscribe broker: the LocalBroker is an in-process stand-in of an
+MQTT broker (same topics and wildcards), and connect_mqtt bridges a real one
+with paho-mqtt. The OrchestrationService keeps the current system state and
+DFA state, and emits the action (symbol, service_id) of the policy (a
+PolicyRuntime) for the current state:
+
+- when an action is emitted, the DFA state moves forward with its symbol, and
+  no other action is emitted until the chosen service reports its new state;
+- the events wait in a bounded queue; when the service falls behind, the
+  queued events are coalesced (only the last state of every service matters)
+  and a single decision is taken for all of them; when the queue is full, the
+  queued events of the same service are merged first (keeping the latest
+  state), and if it is still full, the producer either waits ("block"), or an
+  event is dropped ("drop_oldest", "drop_newest"), but never the one of the
+  service whose action is running, which would stall the orchestration;
+- the latency of every decision (from the reception of the oldest event it
+  accounts for, to the emission of the action) is recorded in a histogram.
+"""
+import asyncio
+import json
+import math
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.policy_runtime import PolicyRuntime
+from stochastic_service_composition.types import Action, State
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+SERVICE_STATE_TOPIC = "services/{service_id}/state"
+SERVICE_STATE_FILTER = "services/+/state"
+ACTION_TOPIC = "orchestrator/action"
+
+
+class ServiceEvent:
+    """A state change reported by a service."""
+
+    def __init__(self, service_id: int, state: State, timestamp: Optional[float] = None):
+        """
+        Initialize the event.
+
+        :param service_id: the index of the service in the community.
+        :param state: the new local state of the service.
+        :param timestamp: the time.perf_counter() instant of the reception
+          (default: set when the event is submitted).
+        """
+        self.service_id = service_id
+        self.state = state
+        self.timestamp = timestamp
+
+    def to_payload(self) -> bytes:
+        """Serialize the event as an MQTT payload."""
+        return json.dumps({"service_id": self.service_id, "state": self.state}).encode()
+
+    @classmethod
+    def from_payload(cls, payload: bytes) -> "ServiceEvent":
+        """Deserialize an event from an MQTT payload."""
+        data = json.loads(payload)
+        return cls(int(data["service_id"]), data["state"])
+
+
+class LatencyHistogram:
+    """A histogram of latencies, with logarithmic buckets."""
+
+    def __init__(
+        self,
+        min_latency: float = 1e-6,
+        max_latency: float = 10.0,
+        buckets_per_decade: int = 20,
+    ):
+        """
+        Initialize the histogram.
+
+        :param min_latency: the upper bound of the first bucket, in seconds.
+        :param max_latency: the lower bound of the last bucket, in seconds.
+        :param buckets_per_decade: the number of buckets per factor 10.
+        """
+        nb_decades = math.log10(max_latency / min_latency)
+        nb_bounds = int(math.ceil(nb_decades * buckets_per_decade))
+        self.bounds = min_latency * 10.0 ** (np.arange(nb_bounds + 1) / buckets_per_decade)
+        self.counts = np.zeros(len(self.bounds) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    @property
+    def count(self) -> int:
+        """Get the number of recorded latencies."""
+        return int(self.counts.sum())
+
+    @property
+    def mean(self) -> float:
+        """Get the mean latency."""
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def record(self, latency: float) -> None:
+        """
+        Record a latency.
+
+        :param latency: the latency, in seconds.
+        """
+        self.counts[np.searchsorted(self.bounds, latency)] += 1
+        self.total += latency
+        self.maximum = max(self.maximum, latency)
+
+    def percentile(self, p: float) -> float:
+        """
+        Get a percentile of the latencies (the upper bound of its bucket).
+
+        :param p: the percentile, in [0, 100].
+        :return: the latency, in seconds.
+        """
+        if self.count == 0:
+            return 0.0
+        rank = max(int(math.ceil(p / 100.0 * self.count)), 1)
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+        if bucket >= len(self.bounds):
+            return self.maximum
+        return min(float(self.bounds[bucket]), self.maximum)
+
+    def summary(self) -> Dict[str, float]:
+        """Get the count, mean, main percentiles and maximum of the latencies."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.maximum,
+        }
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """
+    Check whether a topic matches an MQTT topic filter.
+
+    :param topic_filter: the filter, possibly with the wildcards '+' (one
+      level) and '#' (any number of levels, at the end).
+    :param topic: the topic.
+    :return: True if the topic matches.
+    """
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels) or (level != "+" and level != topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class LocalBroker:
+    """An in-process stand-in of an MQTT broker, with bounded subscriber queues."""
+
+    def __init__(self, overflow: str = DROP_OLDEST):
+        """
+        Initialize the broker.
+
+        :param overflow: what to do when a subscriber queue is full, one of
+          OVERFLOW_POLICIES (the queued messages on the same topic are merged
+          first, keeping the latest payload).
+        """
+        assert overflow in OVERFLOW_POLICIES, f"unknown overflow policy {overflow}"
+        self.overflow = overflow
+        self.subscriptions: List[Tuple[str, asyncio.Queue]] = []
+        self.dropped = 0
+
+    def subscribe(self, topic_filter: str, maxsize: int = 0) -> asyncio.Queue:
+        """
+        Subscribe to the topics that match a filter.
+
+        :param topic_filter: the MQTT topic filter.
+        :param maxsize: the size of the queue (0 for unbounded).
+        :return: the queue that receives the (topic, payload) messages.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.subscriptions.append((topic_filter, queue))
+        return queue
+
+    async def publish(self, topic: str, payload: bytes) -> None:
+        """
+        Publish a message to the matching subscribers.
+
+        :param topic: the topic.
+        :param payload: the payload.
+        """
+        for topic_filter, queue in self.subscriptions:
+            if topic_matches(topic_filter, topic):
+                await _put(
+                    queue,
+                    (topic, payload),
+                    self.overflow,
+                    self._drop,
+                    _message_topic,
+                    _latest_message,
+                )
+
+    def _drop(self) -> None:
+        self.dropped += 1
+
+    async def publish_event(self, event: ServiceEvent) -> None:
+        """
+        Publish a service state change on its topic.
+
+        :param event: the event.
+        """
+        topic = SERVICE_STATE_TOPIC.format(service_id=event.service_id)
+        await self.publish(topic, event.to_payload())
+
+
+def _merge_by_key(
+    items: List[Any],
+    key: Callable[[Any], Optional[Hashable]],
+    merge: Callable[[Any, Any], Any],
+) -> List[Any]:
+    """Merge the items with the same key into the first one (items with key None are kept)."""
+    result: List[Any] = []
+    positions: Dict[Hashable, int] = {}
+    for item in items:
+        item_key = key(item)
+        if item_key is None:
+            result.append(item)
+        elif item_key in positions:
+            position = positions[item_key]
+            result[position] = merge(result[position], item)
+        else:
+            positions[item_key] = len(result)
+            result.append(item)
+    return result
+
+
+def _put_nowait(
+    queue: asyncio.Queue,
+    item,
+    overflow: str,
+    on_drop: Callable[[], None],
+    key: Optional[Callable[[Any], Optional[Hashable]]] = None,
+    merge: Optional[Callable[[Any, Any], Any]] = None,
+    protected: Optional[Callable[[Any], bool]] = None,
+) -> int:
+    """
+    Put an item in a bounded queue without waiting, with an overflow policy.
+
+    When the queue is full, the queued items with the same key as another
+    one (including the new item) are merged first. If the queue is still
+    full, the oldest or the newest item that is not protected is dropped
+    (BLOCK, which cannot wait here, drops the newest one).
+
+    :param queue: the queue.
+    :param item: the new item.
+    :param overflow: one of OVERFLOW_POLICIES.
+    :param on_drop: called when an item is dropped.
+    :param key: the key of the items that can be merged (None: not mergeable).
+    :param merge: the merge of an item with a more recent one with the same key.
+    :param protected: whether an item must not be dropped.
+    :return: the number of items merged.
+    """
+    if not queue.full():
+        queue.put_nowait(item)
+        return 0
+    items = [queue.get_nowait() for _ in range(queue.qsize())]
+    for _ in items:
+        queue.task_done()
+    items.append(item)
+    nb_items = len(items)
+    if key is not None and merge is not None:
+        items = _merge_by_key(items, key, merge)
+    nb_merged = nb_items - len(items)
+    if len(items) > queue.maxsize:
+        on_drop()
+        candidates = [
+            k for k, queued in enumerate(items) if protected is None or not protected(queued)
+        ]
+        if len(candidates) == 0:
+            candidates = [len(items) - 1]
+        del items[candidates[0] if overflow == DROP_OLDEST else candidates[-1]]
+    for queued in items:
+        queue.put_nowait(queued)
+    return nb_merged
+
+
+async def _put(
+    queue: asyncio.Queue,
+    item,
+    overflow: str,
+    on_drop: Callable[[], None],
+    key: Optional[Callable[[Any], Optional[Hashable]]] = None,
+    merge: Optional[Callable[[Any, Any], Any]] = None,
+    protected: Optional[Callable[[Any], bool]] = None,
+) -> int:
+    """Put an item in a bounded queue, with an overflow policy (see _put_nowait)."""
+    if overflow == BLOCK:
+        await queue.put(item)
+        return 0
+    return _put_nowait(queue, item, overflow, on_drop, key, merge, protected)
+
+
+def _message_topic(message: Tuple[str, bytes]) -> str:
+    return message[0]
+
+
+def _latest_message(_old: Tuple[str, bytes], new: Tuple[str, bytes]) -> Tuple[str, bytes]:
+    return new
+
+
+class OrchestrationService:
+    """An asyncio service that turns service state changes into orchestration actions."""
+
+    def __init__(
+        self,
+        runtime: PolicyRuntime,
+        dfa: SimpleDFA,
+        system_state: Sequence[State],
+        dfa_state: Optional[State] = None,
+        queue_size: int = 1024,
+        overflow: str = BLOCK,
+        emit: Optional[Callable[[Action, State], Awaitable[None]]] = None,
+    ):
+        """
+        Initialize the service.
+
+        :param runtime: the policy of the composition.
+        :param dfa: the target DFA.
+        :param system_state: the initial local state of every service.
+        :param dfa_state: the initial DFA state (default: the initial state of the DFA).
+        :param queue_size: the maximum number of events waiting to be processed.
+        :param overflow: what to do when the event queue is full, one of OVERFLOW_POLICIES.
+        :param emit: the coroutine called with every action and the new DFA
+          state (default: put them in the actions queue).
+        """
+        assert overflow in OVERFLOW_POLICIES, f"unknown overflow policy {overflow}"
+        self.runtime = runtime
+        self.dfa = dfa
+        self.system_state = list(system_state)
+        self.dfa_state = dfa.initial_state if dfa_state is None else dfa_state
+        self.overflow = overflow
+        self.events: asyncio.Queue = asyncio.Queue(queue_size)
+        self.actions: asyncio.Queue = asyncio.Queue()
+        self.emit = emit if emit is not None else self._put_action
+        self.pending_service: Optional[int] = None
+        self.latency = LatencyHistogram()
+        self.events_received = 0
+        self.events_dropped = 0
+        self.events_coalesced = 0
+        self.actions_emitted = 0
+        self._running = False
+
+    async def _put_action(self, action: Action, dfa_state: State) -> None:
+        await self.actions.put((action, dfa_state))
+
+    def _drop(self) -> None:
+        self.events_dropped += 1
+
+    @staticmethod
+    def _event_service(event: Optional[ServiceEvent]) -> Optional[int]:
+        # the stop sentinel is never merged
+        return None if event is None else event.service_id
+
+    @staticmethod
+    def _merge_events(old: ServiceEvent, new: ServiceEvent) -> ServiceEvent:
+        # the latest state, received since the oldest timestamp
+        return ServiceEvent(new.service_id, new.state, old.timestamp)
+
+    def _protected(self, event: Optional[ServiceEvent]) -> bool:
+        # the event of the running service (and the stop sentinel) must not be dropped
+        return event is None or event.service_id == self.pending_service
+
+    async def submit(self, event: ServiceEvent) -> None:
+        """
+        Submit a state change, applying the overflow policy if the queue is full.
+
+        :param event: the event.
+        """
+        if event.timestamp is None:
+            event.timestamp = time.perf_counter()
+        self.events_received += 1
+        self.events_coalesced += await _put(
+            self.events,
+            event,
+            self.overflow,
+            self._drop,
+            self._event_service,
+            self._merge_events,
+            self._protected,
+        )
+
+    def submit_nowait(self, event: ServiceEvent) -> None:
+        """
+        Submit a state change without waiting.
+
+        If the queue is full, the events of the same service are merged, and
+        then an event is dropped as with "drop_newest" (or "drop_oldest").
+
+        :param event: the event.
+        """
+        if event.timestamp is None:
+            event.timestamp = time.perf_counter()
+        self.events_received += 1
+        self.events_coalesced += _put_nowait(
+            self.events,
+            event,
+            self.overflow,
+            self._drop,
+            self._event_service,
+            self._merge_events,
+            self._protected,
+        )
+
+    def next_action(self) -> Optional[Action]:
+        """Get the action of the policy for the current state, if any."""
+        return self.runtime.action(self.system_state, self.dfa_state)
+
+    def _apply(self, event: ServiceEvent) -> None:
+        self.system_state[event.service_id] = event.state
+        if event.service_id == self.pending_service:
+            self.pending_service = None
+
+    async def decide(self) -> Optional[Action]:
+        """
+        Emit the action for the current state, unless an action is still running.
+
+        :return: the emitted action, if any.
+        """
+        if self.pending_service is not None:
+            return None
+        action = self.next_action()
+        if not isinstance(action, tuple):
+            # no action, or the 'undefined' action of the states where the target is over
+            return None
+        symbol, service_id = action
+        if symbol in self.dfa.alphabet:
+            self.dfa_state = self.dfa.transition_function.get(self.dfa_state, {}).get(
+                symbol, self.dfa_state
+            )
+        self.pending_service = service_id
+        self.actions_emitted += 1
+        await self.emit(action, self.dfa_state)
+        return action
+
+    async def run(self) -> None:
+        """Process the events until stop() is called (the first decision is taken first)."""
+        self._running = True
+        await self.decide()
+        while self._running:
+            event = await self.events.get()
+            if event is None:
+                self.events.task_done()
+                break
+            batch = [event]
+            # coalesce the events that are already waiting
+            while not self.events.empty():
+                queued = self.events.get_nowait()
+                if queued is None:
+                    self._running = False
+                    self.events.task_done()
+                    break
+                batch.append(queued)
+            for queued in batch:
+                self._apply(queued)
+            self.events_coalesced += len(batch) - 1
+            if await self.decide() is not None:
+                oldest = min(queued.timestamp for queued in batch)
+                self.latency.record(time.perf_counter() - oldest)
+            for _ in batch:
+                self.events.task_done()
+        self._running = False
+
+    async def stop(self) -> None:
+        """Stop the service once the events submitted so far are processed."""
+        await self.events.put(None)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the counters and the latency summary of the service."""
+        result: Dict[str, float] = {
+            "events_received": self.events_received,
+            "events_dropped": self.events_dropped,
+            "events_coalesced": self.events_coalesced,
+            "actions_emitted": self.actions_emitted,
+        }
+        for key, value in self.latency.summary().items():
+            result[f"latency_{key}"] = value
+        return result
+
+    async def consume(self, broker: LocalBroker, queue_size: int = 0) -> None:
+        """
+        Forward the service state changes published on a local broker.
+
+        The actions are published on ACTION_TOPIC only if emit publishes them
+        (see publish_actions).
+
+        :param broker: the broker.
+        :param queue_size: the size of the subscription queue (0 for unbounded).
+        """
+        messages = broker.subscribe(SERVICE_STATE_FILTER, queue_size)
+        while True:
+            _topic, payload = await messages.get()
+            await self.submit(ServiceEvent.from_payload(payload))
+
+
+def publish_actions(broker: LocalBroker) -> Callable[[Action, State], Awaitable[None]]:
+    """
+    Get an emit coroutine that publishes the actions on a local broker.
+
+    :param broker: the broker.
+    :return: the coroutine, to be given to OrchestrationService.
+    """
+
+    async def emit(action: Action, dfa_state: State) -> None:
+        symbol, service_id = action
+        payload = {"symbol": symbol, "service_id": service_id, "dfa_state": dfa_state}
+        await broker.publish(ACTION_TOPIC, json.dumps(payload).encode())
+
+    return emit
+
+
+def connect_mqtt(
+    service: OrchestrationService,
+    loop: asyncio.AbstractEventLoop,
+    host: str = "localhost",
+    port: int = 1883,
+):
+    """
+    Forward the service state changes published on an MQTT broker, with paho-mqtt.
+
+    The paho network loop runs in its own thread; the events are handed over
+    to the asyncio loop with submit_nowait, hence they are merged or dropped
+    (and counted) when the event queue is full.
+
+    :param service: the orchestration service.
+    :param loop: the asyncio loop the service runs in.
+    :param host: the host of the MQTT broker.
+    :param port: the port of the MQTT broker.
+    :return: the connected paho client (call loop_stop and disconnect to close it).
+    """
+    import paho.mqtt.client as mqtt
+
+    def on_connect(client, _userdata, _flags, _rc, *_args):
+        client.subscribe(SERVICE_STATE_FILTER)
+
+    def on_message(_client, _userdata, message):
+        event = ServiceEvent.from_payload(message.payload)
+        loop.call_soon_threadsafe(service.submit_nowait, event)
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(host, port)
+    client.loop_start()
+    return client
@@ -0,0 +1,332 @@
+"""
+This module implements a multi-process version of comp_mdp.
+
+The (integer-encoded) composition states are partitioned by hash among the
+worker processes. Every worker expands the states it owns, using the
+vectorized expansion of batched_composition, and forwards the discovered
+successors to their owners in batches. Termination is detected with the
+four-counter method: the master process repeatedly probes the workers for
+the number of batches sent and received, and stops when two consecutive
+waves report the same, balanced, counters. Finally, the per-worker
+transition shards are merged into the composition MDP.
+"""
+import multiprocessing
+import os
+import queue
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from mdp_dp_rl.processes.mdp import MDP
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.batched_composition import (
+    CompositionTables,
+    build_transition_function,
+)
+from stochastic_service_composition.composition_mdp import (
+    COMPOSITION_MDP_SINK_STATE,
+    COMPOSITION_MDP_UNDEFINED_ACTION,
+    DEFAULT_GAMMA,
+)
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.types import MDPDynamics
+
+DEFAULT_BATCH_SIZE = 4096
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_POLL_TIMEOUT = 1.0
+
+_STATES_MESSAGE = "states"
+_PROBE_MESSAGE = "probe"
+_STOP_MESSAGE = "stop"
+
+
+def owner_of(codes: np.ndarray, nb_workers: int) -> np.ndarray:
+    """
+    Compute the worker that owns each state.
+
+    Codes are scrambled with a multiplicative hash, so that states that differ
+    only in the DFA component (or in one service component) are spread among
+    the workers.
+
+    :param codes: the state codes.
+    :param nb_workers: the number of workers.
+    :return: the index of the owner of each state.
+    """
+    scrambled = np.asarray(codes, dtype=np.int64).astype(np.uint64) * _HASH_MULTIPLIER
+    return ((scrambled >> np.uint64(32)) % np.uint64(nb_workers)).astype(np.int64)
+
+
+class _Worker:
+    """The state of a composition worker process."""
+
+    def __init__(
+        self,
+        worker_id: int,
+        tables: CompositionTables,
+        inboxes: Sequence[multiprocessing.Queue],
+        control: multiprocessing.Queue,
+        batch_size: int,
+    ):
+        self.worker_id = worker_id
+        self.nb_workers = len(inboxes)
+        self.tables = tables
+        self.inboxes = inboxes
+        self.control = control
+        self.batch_size = batch_size
+
+        self.visited: Set[int] = set()
+        self.pending: List[int] = []
+        self.outboxes: List[List[np.ndarray]] = [[] for _ in range(self.nb_workers)]
+        self.outbox_sizes = [0] * self.nb_workers
+        self.shards: List[Tuple[np.ndarray, ...]] = []
+        self.sent = 0
+        self.received = 0
+
+    def run(self) -> None:
+        """Serve messages until the stop message is received."""
+        inbox = self.inboxes[self.worker_id]
+        while True:
+            try:
+                message = inbox.get(block=len(self.pending) == 0)
+            except queue.Empty:
+                self._expand_pending()
+                continue
+            kind = message[0]
+            if kind == _STATES_MESSAGE:
+                self.received += 1
+                self._receive(message[1])
+            elif kind == _PROBE_MESSAGE:
+                # answer only when there is no local work left
+                while len(self.pending) > 0:
+                    self._expand_pending()
+                self._flush(force=True)
+                self.control.put(
+                    (_PROBE_MESSAGE, message[1], self.worker_id, self.sent, self.received)
+                )
+            elif kind == _STOP_MESSAGE:
+                self._send_shards()
+                return
+
+    def _receive(self, codes: np.ndarray) -> None:
+        """Enqueue the states not visited yet."""
+        for code in codes.tolist():
+            if code not in self.visited:
+                self.visited.add(code)
+                self.pending.append(code)
+
+    def _expand_pending(self) -> None:
+        """Expand a batch of pending states and route their successors."""
+        frontier = np.array(self.pending[: self.batch_size], dtype=np.int64)
+        del self.pending[: self.batch_size]
+        shard = self.tables.expand(frontier)
+        self.shards.append(shard)
+
+        destinations = np.unique(shard[2])
+        destinations = destinations[destinations != COMPOSITION_MDP_SINK_STATE]
+        owners = owner_of(destinations, self.nb_workers)
+        for worker_id in np.unique(owners).tolist():
+            codes = destinations[owners == worker_id]
+            if worker_id == self.worker_id:
+                self._receive(codes)
+            else:
+                self.outboxes[worker_id].append(codes)
+                self.outbox_sizes[worker_id] += len(codes)
+        self._flush(force=False)
+
+    def _flush(self, force: bool) -> None:
+        """Send the outboxes that are full (or all the non-empty ones, if forced)."""
+        for worker_id in range(self.nb_workers):
+            size = self.outbox_sizes[worker_id]
+            if size == 0 or (not force and size < self.batch_size):
+                continue
+            codes = np.concatenate(self.outboxes[worker_id])
+            self.inboxes[worker_id].put((_STATES_MESSAGE, codes))
+            self.sent += 1
+            self.outboxes[worker_id] = []
+            self.outbox_sizes[worker_id] = 0
+
+    def _send_shards(self) -> None:
+        """Send the transitions computed by this worker to the master."""
+        if len(self.shards) == 0:
+            shard: Optional[Tuple[np.ndarray, ...]] = None
+        else:
+            shard = tuple(
+                np.concatenate([s[k] for s in self.shards]) for k in range(5)
+            )
+        visited = np.fromiter(self.visited, dtype=np.int64, count=len(self.visited))
+        self.control.put((_STOP_MESSAGE, self.worker_id, shard, visited))
+
+
+def _run_worker(
+    worker_id: int,
+    tables: CompositionTables,
+    inboxes: Sequence[multiprocessing.Queue],
+    control: multiprocessing.Queue,
+    batch_size: int,
+) -> None:
+    """Entry point of the worker processes."""
+    _Worker(worker_id, tables, inboxes, control, batch_size).run()
+
+
+def _get_control_message(
+    control: multiprocessing.Queue, processes: Sequence[multiprocessing.Process]
+):
+    """Wait for a message from the workers, failing if one of them died."""
+    while True:
+        try:
+            return control.get(timeout=_POLL_TIMEOUT)
+        except queue.Empty:
+            for process in processes:
+                if not process.is_alive() and process.exitcode != 0:
+                    raise RuntimeError(
+                        f"composition worker {process.name} exited with code {process.exitcode}"
+                    )
+
+
+def _seed_workers(
+    tables: CompositionTables,
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    inboxes: Sequence[multiprocessing.Queue],
+) -> int:
+    """
+    Send the initial states to their owners.
+
+    :return: the number of batches sent.
+    """
+    initial_codes = tables.initial_codes(dfa, services)
+    owners = owner_of(initial_codes, len(inboxes))
+    nb_sent = 0
+    for worker_id in np.unique(owners).tolist():
+        inboxes[worker_id].put((_STATES_MESSAGE, initial_codes[owners == worker_id]))
+        nb_sent += 1
+    return nb_sent
+
+
+def _wait_for_termination(
+    inboxes: Sequence[multiprocessing.Queue],
+    control: multiprocessing.Queue,
+    processes: Sequence[multiprocessing.Process],
+    master_sent: int,
+) -> None:
+    """
+    Probe the workers until the four-counter method detects termination.
+
+    :param master_sent: the number of batches sent by the master.
+    """
+    previous_counters: Optional[Tuple[int, int]] = None
+    wave = 0
+    while True:
+        wave += 1
+        for inbox in inboxes:
+            inbox.put((_PROBE_MESSAGE, wave))
+        sent, received = master_sent, 0
+        for _ in range(len(inboxes)):
+            _kind, reply_wave, _worker_id, worker_sent, worker_received = (
+                _get_control_message(control, processes)
+            )
+            assert reply_wave == wave
+            sent += worker_sent
+            received += worker_received
+        counters = (sent, received)
+        if sent == received and counters == previous_counters:
+            return
+        previous_counters = counters
+
+
+def _collect_shards(
+    inboxes: Sequence[multiprocessing.Queue],
+    control: multiprocessing.Queue,
+    processes: Sequence[multiprocessing.Process],
+) -> Tuple[List[Tuple[np.ndarray, ...]], np.ndarray]:
+    """
+    Stop the workers and gather their results.
+
+    :return: the transition shards, and the codes of the visited states.
+    """
+    for inbox in inboxes:
+        inbox.put((_STOP_MESSAGE,))
+    shards = []
+    visited_by_worker: Dict[int, np.ndarray] = {}
+    for _ in range(len(inboxes)):
+        _kind, worker_id, shard, visited = _get_control_message(control, processes)
+        if shard is not None:
+            shards.append(shard)
+        visited_by_worker[worker_id] = visited
+    return shards, np.concatenate(list(visited_by_worker.values()))
+
+
+def _merge_shards(
+    tables: CompositionTables,
+    shards: Sequence[Tuple[np.ndarray, ...]],
+    visited: np.ndarray,
+) -> MDPDynamics:
+    """Merge the transition shards of the workers into a transition function."""
+    sources, action_ids, destinations, probs, rewards = (
+        np.concatenate([shard[k] for shard in shards]) for k in range(5)
+    )
+    transition_function = build_transition_function(
+        tables, sources, action_ids, destinations, probs, rewards
+    )
+    for state in tables.encoder.decode_many(visited):
+        transition_function.setdefault(state, {})
+    if (destinations == COMPOSITION_MDP_SINK_STATE).any():
+        transition_function[COMPOSITION_MDP_SINK_STATE] = {
+            COMPOSITION_MDP_UNDEFINED_ACTION: ({COMPOSITION_MDP_SINK_STATE: 1.0}, 0.0)
+        }
+    return transition_function
+
+
+def comp_mdp_parallel(
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    gamma: float = DEFAULT_GAMMA,
+    nb_workers: Optional[int] = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> MDP:
+    """
+    Compute the composition MDP with several worker processes.
+
+    The result is the same MDP computed by comp_mdp.
+
+    :param dfa: the target DFA.
+    :param services: the community of services.
+    :param gamma: the discount factor.
+    :param nb_workers: the number of worker processes (default: number of CPUs).
+    :param batch_size: the number of states forwarded/expanded per batch.
+    :return: the composition MDP.
+    """
+    nb_workers = nb_workers if nb_workers is not None else (os.cpu_count() or 1)
+    assert nb_workers >= 1, "at least one worker"
+    dfa = dfa.trim()
+    tables = CompositionTables(dfa, services)
+
+    context = multiprocessing.get_context()
+    inboxes = [context.Queue() for _ in range(nb_workers)]
+    control = context.Queue()
+    processes = [
+        context.Process(
+            target=_run_worker,
+            args=(worker_id, tables, inboxes, control, batch_size),
+            name=f"composition-worker-{worker_id}",
+            daemon=True,
+        )
+        for worker_id in range(nb_workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        master_sent = _seed_workers(tables, dfa, services, inboxes)
+        _wait_for_termination(inboxes, control, processes, master_sent)
+        shards, visited = _collect_shards(inboxes, control, processes)
+    finally:
+        for process in processes:
+            process.join(timeout=_POLL_TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+
+    result = MDP(_merge_shards(tables, shards, visited), gamma)
+    system_initial_state = tuple(service.initial_state for service in services)
+    result.initial_state = (system_initial_state, dfa.initial_state)  # type: ignore
+    return result
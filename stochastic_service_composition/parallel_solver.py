@@ -0,0 +1,192 @@
+"""
+This module implements multi-core value iteration over shared-memory arrays.
+
+The arrays of an ArrayMDP are copied once into multiprocessing.shared_memory
+blocks, so that every worker process reads the same MDP without holding a
+private copy. States are split into contiguous blocks (balanced by number of
+transitions); in every sweep each worker performs Jacobi backups on a block,
+reading the current value vector and writing its slice of the next one. The
+two value vectors are swapped by the master process between sweeps.
+"""
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from stochastic_service_composition.array_mdp import ArrayMDP, segment_max
+from stochastic_service_composition.solvers import (
+    DEFAULT_TOLERANCE,
+    InitialValues,
+    SolverResult,
+    initial_value_vector,
+)
+from stochastic_service_composition.types import Action, State
+
+# arrays of the MDP shared with the workers
+_MDP_ARRAYS = (
+    "state_action_ptr",
+    "sa_rewards",
+    "transition_ptr",
+    "next_states",
+    "probs",
+    "transition_sas",
+)
+_VALUE_BUFFERS = ("values_0", "values_1")
+
+# per-process views on the shared arrays, set by _init_worker
+_shared_arrays: Dict[str, np.ndarray] = {}
+_shared_blocks: List[shared_memory.SharedMemory] = []
+
+
+class _SharedArrays:
+    """Owner of the shared-memory blocks, on the master side."""
+
+    def __init__(self):
+        self.blocks: List[shared_memory.SharedMemory] = []
+        self.specs: Dict[str, Tuple[str, Tuple[int, ...], str]] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    def add(self, name: str, array: np.ndarray) -> np.ndarray:
+        """Copy an array into a new shared-memory block."""
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        self.blocks.append(block)
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        shared[...] = array
+        self.specs[name] = (block.name, array.shape, array.dtype.str)
+        self.arrays[name] = shared
+        return shared
+
+    def release(self) -> None:
+        """Close and unlink all the blocks."""
+        self.arrays.clear()
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+
+def _init_worker(specs: Dict[str, Tuple[str, Tuple[int, ...], str]]) -> None:
+    """Attach the worker process to the shared-memory blocks."""
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _shared_blocks.append(block)
+        _shared_arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def _backup_block(args: Tuple[int, int, int, float]) -> float:
+    """
+    Back up the states in range(start, end).
+
+    :param args: the tuple (start, end, source buffer index, gamma).
+    :return: the maximum residual on the block.
+    """
+    start, end, source, gamma = args
+    values = _shared_arrays[_VALUE_BUFFERS[source]]
+    new_values = _shared_arrays[_VALUE_BUFFERS[1 - source]]
+    state_action_ptr = _shared_arrays["state_action_ptr"]
+    transition_ptr = _shared_arrays["transition_ptr"]
+
+    sa_start, sa_end = state_action_ptr[start], state_action_ptr[end]
+    tr_start, tr_end = transition_ptr[sa_start], transition_ptr[sa_end]
+    next_states = _shared_arrays["next_states"][tr_start:tr_end]
+    probs = _shared_arrays["probs"][tr_start:tr_end]
+    transition_sas = _shared_arrays["transition_sas"][tr_start:tr_end] - sa_start
+
+    expected = np.bincount(
+        transition_sas, weights=probs * values[next_states], minlength=sa_end - sa_start
+    )
+    q_values = _shared_arrays["sa_rewards"][sa_start:sa_end] + gamma * expected
+    block_values = segment_max(
+        q_values, state_action_ptr[start : end + 1] - sa_start, empty=0.0
+    )
+    new_values[start:end] = block_values
+    return float(np.max(np.abs(block_values - values[start:end]), initial=0.0))
+
+
+def split_in_blocks(mdp: ArrayMDP, nb_blocks: int) -> List[Tuple[int, int]]:
+    """
+    Split the states in contiguous blocks with (roughly) the same number of transitions.
+
+    :param mdp: the MDP.
+    :param nb_blocks: the number of blocks.
+    :return: the list of ranges (start, end).
+    """
+    work = mdp.transition_ptr[mdp.state_action_ptr] + np.arange(mdp.nb_states + 1)
+    targets = np.linspace(0, work[-1], nb_blocks + 1)
+    bounds = np.unique(np.searchsorted(work, targets))
+    bounds[0], bounds[-1] = 0, mdp.nb_states
+    bounds = np.unique(bounds)
+    return [
+        (int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start
+    ]
+
+
+def parallel_value_iteration(
+    mdp: ArrayMDP,
+    gamma: Optional[float] = None,
+    tol: float = DEFAULT_TOLERANCE,
+    max_iterations: Optional[int] = None,
+    nb_workers: Optional[int] = None,
+    blocks_per_worker: int = 4,
+    initial_values: Optional[InitialValues] = None,
+    initial_policy: Optional[Mapping[State, Action]] = None,
+) -> SolverResult:
+    """
+    Run Jacobi value iteration on a pool of worker processes.
+
+    The sweeps are the same as in solvers.value_iteration, hence the result is
+    the same.
+
+    :param mdp: the MDP.
+    :param gamma: the discount factor (default: the one of the MDP).
+    :param tol: the tolerance on successive differences.
+    :param max_iterations: the maximum number of sweeps, including the
+      evaluation sweeps of the initial policy, if any.
+    :param nb_workers: the number of worker processes (default: number of CPUs).
+    :param blocks_per_worker: number of state blocks per worker, for load balancing.
+    :param initial_values: the initial value function, if any.
+    :param initial_policy: a policy to evaluate to get the initial value function, if any.
+    :return: the values and the greedy policy.
+    """
+    gamma = mdp.gamma if gamma is None else gamma
+    nb_workers = nb_workers if nb_workers is not None else (os.cpu_count() or 1)
+    assert nb_workers >= 1, "at least one worker"
+    blocks = split_in_blocks(mdp, nb_workers * blocks_per_worker)
+    initial, iterations = initial_value_vector(
+        mdp, gamma, tol, initial_values, initial_policy, max_iterations
+    )
+
+    shared = _SharedArrays()
+    try:
+        for name in _MDP_ARRAYS:
+            shared.add(name, getattr(mdp, name))
+        for name in _VALUE_BUFFERS:
+            shared.add(name, initial)
+
+        context = multiprocessing.get_context()
+        with context.Pool(
+            nb_workers, initializer=_init_worker, initargs=(shared.specs,)
+        ) as pool:
+            source = 0
+            residual = np.inf
+            sweeps = 0
+            while max_iterations is None or iterations + sweeps < max_iterations:
+                residuals = pool.map(
+                    _backup_block, [(start, end, source, gamma) for start, end in blocks]
+                )
+                sweeps += 1
+                source = 1 - source
+                residual = max(residuals, default=0.0)
+                if residual < tol:
+                    break
+        values = shared.arrays[_VALUE_BUFFERS[source]].copy()
+    finally:
+        shared.release()
+
+    iterations += sweeps
+    policy = mdp.greedy(mdp.q_values(values, gamma))
+    return SolverResult(
+        mdp, values, policy, iterations, iterations * mdp.nb_states, residual, gamma
+    )
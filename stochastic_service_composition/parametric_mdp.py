@@ -0,0 +1,268 @@
+"""
+This module links the rewards and probabilities of a composition MDP to the service parameters.
+
+Every state-action pair (symbol, i) of a composition MDP gets its reward from
+the reward of action symbol of service i in its current local state (plus a
+goal/target reward), and every transition gets its probability from the
+probability of the corresponding local next state (times the target policy
+probability, in the automata-based composition). A ParametricMDP keeps those
+references, so that the service parameters (e.g. a cost or a broken
+probability) can be changed in place on the built MDP and the MDP re-solved,
+without recomposing it.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from mdp_dp_rl.processes.mdp import MDP
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.solvers import (
+    SolverResult,
+    batched_value_iteration,
+    value_iteration,
+)
+from stochastic_service_composition.types import Action, State
+
+NO_PARAMETER = -1
+
+RewardKey = Tuple[int, State, Action]
+ProbabilityKey = Tuple[int, State, Action, State]
+
+
+def service_action(state: State, action: Action) -> Optional[Tuple[int, State, Action]]:
+    """
+    Get the service action that produced a composition state-action pair.
+
+    Both the comp_mdp states ((s_1, ..., s_n), q) with actions (symbol, i),
+    and the composition_mdp states ((s_1, ..., s_n), t, symbol) with actions i
+    are supported.
+
+    :param state: the composition state.
+    :param action: the composition action.
+    :return: the triple (service id, local state, symbol), or None if the
+      pair does not correspond to a service action (e.g. sink states).
+    """
+    if not isinstance(state, tuple):
+        return None
+    if len(state) == 2 and isinstance(action, tuple) and len(action) == 2:
+        symbol, service_id = action
+        return service_id, state[0][service_id], symbol
+    if len(state) == 3 and isinstance(action, int):
+        return action, state[0][action], state[2]
+    return None
+
+
+class ParametricMDP:
+    """An array-backed composition MDP linked to the parameters of its services."""
+
+    def __init__(self, mdp: ArrayMDP, services: Sequence[Service]):
+        """
+        Link a composition MDP to the parameters of its services.
+
+        :param mdp: the array-backed composition MDP (it is updated in place).
+        :param services: the community of services the MDP was built from.
+        """
+        self.mdp = mdp
+        self.reward_keys: List[RewardKey] = []
+        self.probability_keys: List[ProbabilityKey] = []
+        reward_index: Dict[RewardKey, int] = {}
+        probability_index: Dict[ProbabilityKey, int] = {}
+        reward_values: List[float] = []
+        probability_values: List[float] = []
+
+        self.sa_reward_parameter = np.full(mdp.nb_state_actions, NO_PARAMETER, dtype=np.int64)
+        self.sa_reward_offset = mdp.sa_rewards.copy()
+        self.transition_probability_parameter = np.full(
+            mdp.nb_transitions, NO_PARAMETER, dtype=np.int64
+        )
+        self.transition_probability_scale = mdp.probs.copy()
+
+        for s, state in enumerate(mdp.states):
+            for k in range(mdp.state_action_ptr[s], mdp.state_action_ptr[s + 1]):
+                linked = service_action(state, mdp.actions[mdp.sa_actions[k]])
+                if linked is None:
+                    continue
+                service_id, local_state, symbol = linked
+                next_local_states, local_reward = services[service_id].transition_function[
+                    local_state
+                ][symbol]
+                reward_key = (service_id, local_state, symbol)
+                if reward_key not in reward_index:
+                    reward_index[reward_key] = len(self.reward_keys)
+                    self.reward_keys.append(reward_key)
+                    reward_values.append(local_reward)
+                self.sa_reward_parameter[k] = reward_index[reward_key]
+                self.sa_reward_offset[k] = mdp.sa_rewards[k] - local_reward
+
+                for t in range(mdp.transition_ptr[k], mdp.transition_ptr[k + 1]):
+                    next_local_state = mdp.states[mdp.next_states[t]][0][service_id]
+                    probability_key = (service_id, local_state, symbol, next_local_state)
+                    if probability_key not in probability_index:
+                        probability_index[probability_key] = len(self.probability_keys)
+                        self.probability_keys.append(probability_key)
+                        probability_values.append(next_local_states[next_local_state])
+                    self.transition_probability_parameter[t] = probability_index[
+                        probability_key
+                    ]
+                    self.transition_probability_scale[t] = (
+                        mdp.probs[t] / next_local_states[next_local_state]
+                    )
+
+        self.reward_index = reward_index
+        self.probability_index = probability_index
+        self.reward_values = np.array(reward_values, dtype=np.float64)
+        self.probability_values = np.array(probability_values, dtype=np.float64)
+        self.last_result: Optional[SolverResult] = None
+
+    @classmethod
+    def from_mdp(cls, mdp: MDP, services: Sequence[Service]) -> "ParametricMDP":
+        """
+        Link an mdp_dp_rl composition MDP to the parameters of its services.
+
+        :param mdp: the output of comp_mdp or composition_mdp.
+        :param services: the community of services.
+        :return: the parametric MDP.
+        """
+        return cls(ArrayMDP.from_mdp(mdp), services)
+
+    def set_reward(self, service_id: int, state: State, action: Action, reward: float) -> None:
+        """
+        Change the reward of a service action, in place.
+
+        :param service_id: the index of the service.
+        :param state: the local state of the service.
+        :param action: the action of the service.
+        :param reward: the new reward.
+        """
+        key = (service_id, state, action)
+        assert key in self.reward_index, f"no transition of the MDP depends on {key}"
+        parameter = self.reward_index[key]
+        self.reward_values[parameter] = reward
+        affected = self.sa_reward_parameter == parameter
+        self.mdp.sa_rewards[affected] = self.sa_reward_offset[affected] + reward
+
+    def set_probabilities(
+        self,
+        service_id: int,
+        state: State,
+        action: Action,
+        next_states: Dict[State, float],
+    ) -> None:
+        """
+        Change the next state distribution of a service action, in place.
+
+        The support of the distribution cannot change, since it determines the
+        state space of the composition.
+
+        :param service_id: the index of the service.
+        :param state: the local state of the service.
+        :param action: the action of the service.
+        :param next_states: the new distribution over the local next states.
+        """
+        assert abs(sum(next_states.values()) - 1.0) <= 1e-8, "not a probability distribution"
+        for next_state, prob in next_states.items():
+            key = (service_id, state, action, next_state)
+            assert prob > 0.0, f"probability of {key} must be positive"
+            assert key in self.probability_index, f"no transition of the MDP depends on {key}"
+        for next_state, prob in next_states.items():
+            parameter = self.probability_index[(service_id, state, action, next_state)]
+            self.probability_values[parameter] = prob
+            affected = self.transition_probability_parameter == parameter
+            self.mdp.probs[affected] = self.transition_probability_scale[affected] * prob
+
+    def set_service(self, service_id: int, service: Service) -> None:
+        """
+        Change all the parameters of a service, in place.
+
+        The new service must have the same transition structure as the old one.
+
+        :param service_id: the index of the service.
+        :param service: the new service.
+        """
+        for state, transitions in service.transition_function.items():
+            for action, (next_states, reward) in transitions.items():
+                if (service_id, state, action) not in self.reward_index:
+                    # the action is never taken in the composition
+                    continue
+                self.set_reward(service_id, state, action, reward)
+                self.set_probabilities(service_id, state, action, next_states)
+
+    def solve(
+        self, gamma: Optional[float] = None, warm_start: bool = True, **kwargs
+    ) -> SolverResult:
+        """
+        Solve the MDP with the current parameters.
+
+        :param gamma: the discount factor (default: the one of the MDP).
+        :param warm_start: whether to start from the values of the last solve, if any.
+        :param kwargs: the other arguments of solvers.value_iteration.
+        :return: the solver result.
+        """
+        if warm_start and self.last_result is not None and "initial_values" not in kwargs:
+            kwargs["initial_values"] = self.last_result.values
+        self.last_result = value_iteration(self.mdp, gamma=gamma, **kwargs)
+        return self.last_result
+
+    def scenario_arrays(
+        self,
+        reward_values: Optional[np.ndarray] = None,
+        probability_values: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the rewards and probabilities of the MDP for several parameter vectors.
+
+        :param reward_values: the service rewards, of shape (len(reward_keys), K)
+          (default: the current ones).
+        :param probability_values: the service probabilities, of shape
+          (len(probability_keys), K) (default: the current ones).
+        :return: the rewards, of shape (nb_state_actions, K), and the transition
+          probabilities, of shape (nb_transitions, K).
+        """
+        nb_scenarios = {
+            np.shape(values)[1]
+            for values in (reward_values, probability_values)
+            if values is not None
+        }
+        assert len(nb_scenarios) <= 1, f"inconsistent number of scenarios: {nb_scenarios}"
+        k = nb_scenarios.pop() if nb_scenarios else 1
+        if reward_values is None:
+            reward_values = np.repeat(self.reward_values[:, None], k, axis=1)
+        if probability_values is None:
+            probability_values = np.repeat(self.probability_values[:, None], k, axis=1)
+
+        reward_linked = (self.sa_reward_parameter != NO_PARAMETER)[:, None]
+        sa_rewards = self.sa_reward_offset[:, None] + np.where(
+            reward_linked, reward_values[np.maximum(self.sa_reward_parameter, 0)], 0.0
+        )
+        probability_linked = (self.transition_probability_parameter != NO_PARAMETER)[:, None]
+        probs = self.transition_probability_scale[:, None] * np.where(
+            probability_linked,
+            probability_values[np.maximum(self.transition_probability_parameter, 0)],
+            1.0,
+        )
+        return sa_rewards, probs
+
+    def solve_scenarios(
+        self,
+        gammas: Optional[Sequence[float]] = None,
+        reward_values: Optional[np.ndarray] = None,
+        probability_values: Optional[np.ndarray] = None,
+        **kwargs,
+    ) -> List[SolverResult]:
+        """
+        Solve the MDP for several discount factors and parameter vectors at once.
+
+        :param gammas: the discount factor of every scenario (default: the one of the MDP).
+        :param reward_values: the service rewards of every scenario, see scenario_arrays.
+        :param probability_values: the service probabilities of every scenario,
+          see scenario_arrays.
+        :param kwargs: the other arguments of solvers.batched_value_iteration.
+        :return: the result of every scenario.
+        """
+        if reward_values is None and probability_values is None:
+            return batched_value_iteration(self.mdp, gammas=gammas, **kwargs)
+        sa_rewards, probs = self.scenario_arrays(reward_values, probability_values)
+        return batched_value_iteration(
+            self.mdp, gammas=gammas, sa_rewards=sa_rewards, probs=probs, **kwargs
+        )
@@ -0,0 +1,202 @@
+"""
+This module implements the exact analysis of a policy on an array-backed MDP.
+
+A deterministic policy turns the MDP into a Markov chain. For a set of target
+states (e.g. the composition states with an accepting DFA state), the module
+computes, for every state:
+
+- the probability of reaching the targets: the states that cannot reach
+  them in the graph of the chain have probability 0, and the probabilities
+  of the other states are the unique solution of the sparse linear system
+  x = P x + b restricted to them (b being the probability to reach the
+  targets in one step);
+- the undiscounted expected cost to reach the targets: it is finite only
+  for the states that reach the targets with probability 1, and it is the
+  unique solution of c = P c + cost restricted to them.
+
+Only the states of the relevant set take part in each linear solve, which
+makes the analysis scale to the large LTLf compositions.
+"""
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import spsolve
+
+from stochastic_service_composition.array_mdp import NO_ACTION, ArrayMDP
+from stochastic_service_composition.asynchronous_solvers import accepting_states
+from stochastic_service_composition.types import State
+
+# probabilities below 1 - PROBABILITY_ONE_TOLERANCE are not considered as 1
+PROBABILITY_ONE_TOLERANCE = 1e-9
+
+
+class PolicyAnalysis:
+    """The reachability probability and the expected cost of a policy, for every state."""
+
+    def __init__(
+        self, mdp: ArrayMDP, reach_probability: np.ndarray, expected_cost: np.ndarray
+    ):
+        """
+        Initialize the analysis.
+
+        :param mdp: the analysed MDP.
+        :param reach_probability: the probability of reaching the targets from every state.
+        :param expected_cost: the expected cost to reach the targets from
+          every state (inf if the probability is less than 1).
+        """
+        self.mdp = mdp
+        self.reach_probability = reach_probability
+        self.expected_cost = expected_cost
+
+    def at(self, state: Optional[State] = None) -> Tuple[float, float]:
+        """
+        Get the reachability probability and the expected cost of a state.
+
+        :param state: the state (default: the initial state of the MDP).
+        :return: the pair (probability, expected cost).
+        """
+        state = self.mdp.initial_state if state is None else state
+        index = self.mdp.state_index[state]
+        return float(self.reach_probability[index]), float(self.expected_cost[index])
+
+
+def myopic_policy(mdp: ArrayMDP) -> np.ndarray:
+    """
+    Get the policy that chooses the action with the best immediate reward.
+
+    In a composition MDP, this is the baseline that always delegates to the
+    cheapest service (ties are broken by the first action).
+
+    :param mdp: the MDP.
+    :return: the chosen state-action pair of every state.
+    """
+    return mdp.greedy(mdp.sa_rewards)
+
+
+def policy_chain(mdp: ArrayMDP, policy: np.ndarray) -> sp.csr_matrix:
+    """
+    Get the transition matrix of the Markov chain induced by a policy.
+
+    :param mdp: the MDP.
+    :param policy: the chosen state-action pair of every state (NO_ACTION
+      for the states without action, whose row is empty).
+    :return: the sparse nb_states x nb_states transition matrix.
+    """
+    policy = np.asarray(policy, dtype=np.int64)
+    has_action = policy != NO_ACTION
+    chosen = policy[has_action]
+    counts = np.zeros(mdp.nb_states, dtype=np.int64)
+    counts[has_action] = mdp.transition_ptr[chosen + 1] - mdp.transition_ptr[chosen]
+    ptr = np.concatenate([[0], np.cumsum(counts)])
+    # the transitions of the chosen pairs, in state order
+    transitions = np.repeat(
+        mdp.transition_ptr[chosen] - ptr[:-1][has_action], counts[has_action]
+    )
+    transitions += np.arange(ptr[-1])
+    return sp.csr_matrix(
+        (mdp.probs[transitions], mdp.next_states[transitions], ptr),
+        shape=(mdp.nb_states, mdp.nb_states),
+    )
+
+
+def _backward_reachable(chain: sp.csr_matrix, roots: np.ndarray) -> np.ndarray:
+    """Get the states that can reach one of the roots in the graph of a chain."""
+    # (graph @ x)[s] > 0 iff s has a successor in x
+    graph = (chain != 0).astype(np.int32)
+    reached = np.zeros(chain.shape[0], dtype=bool)
+    reached[roots] = True
+    frontier = reached.copy()
+    while frontier.any():
+        frontier = (graph @ frontier.astype(np.int32) > 0) & ~reached
+        reached |= frontier
+    return reached
+
+
+def _solve(chain: sp.csr_matrix, subset: np.ndarray, rhs: np.ndarray) -> np.ndarray:
+    """Solve x = P x + rhs on a subset of the states (x is 0 outside of it)."""
+    indices = np.flatnonzero(subset)
+    if len(indices) == 0:
+        return np.zeros(0)
+    restricted = chain[indices][:, indices]
+    system = sp.identity(len(indices), format="csc") - restricted.tocsc()
+    return np.atleast_1d(spsolve(system, rhs[indices]))
+
+
+def reachability_probability(
+    mdp: ArrayMDP, policy: np.ndarray, targets: np.ndarray
+) -> np.ndarray:
+    """
+    Compute the probability of reaching the targets under a policy.
+
+    :param mdp: the MDP.
+    :param policy: the chosen state-action pair of every state.
+    :param targets: the indices of the target states.
+    :return: the probability of every state.
+    """
+    return _reachability_probability(policy_chain(mdp, policy), targets)
+
+
+def _reachability_probability(chain: sp.csr_matrix, targets: np.ndarray) -> np.ndarray:
+    is_target = np.zeros(chain.shape[0], dtype=bool)
+    is_target[targets] = True
+    maybe = _backward_reachable(chain, targets) & ~is_target
+    probability = is_target.astype(np.float64)
+    one_step = chain @ is_target.astype(np.float64)
+    probability[maybe] = np.clip(_solve(chain, maybe, one_step), 0.0, 1.0)
+    return probability
+
+
+def analyse_policy(
+    mdp: ArrayMDP,
+    policy: np.ndarray,
+    targets: Iterable[State],
+    costs: Optional[np.ndarray] = None,
+) -> PolicyAnalysis:
+    """
+    Compute the reachability probability and the expected cost of a policy.
+
+    :param mdp: the MDP.
+    :param policy: the chosen state-action pair of every state.
+    :param targets: the target states.
+    :param costs: the cost of every state-action pair (default: minus the
+      reward). In a comp_mdp composition the rewards include the goal reward;
+      with a ParametricMDP p, the service costs alone are
+      p.sa_reward_offset - p.mdp.sa_rewards.
+    :return: the analysis.
+    """
+    policy = np.asarray(policy, dtype=np.int64)
+    costs = -mdp.sa_rewards if costs is None else np.asarray(costs, dtype=np.float64)
+    target_indices = np.array([mdp.state_index[state] for state in targets], dtype=np.int64)
+    chain = policy_chain(mdp, policy)
+    probability = _reachability_probability(chain, target_indices)
+
+    is_target = np.zeros(mdp.nb_states, dtype=bool)
+    is_target[target_indices] = True
+    # states that reach the targets almost surely: all their successors do as well
+    almost_sure = (probability >= 1.0 - PROBABILITY_ONE_TOLERANCE) & ~is_target
+    state_costs = np.zeros(mdp.nb_states)
+    has_action = policy != NO_ACTION
+    state_costs[has_action] = costs[policy[has_action]]
+    expected_cost = np.full(mdp.nb_states, np.inf)
+    expected_cost[is_target] = 0.0
+    expected_cost[almost_sure] = _solve(chain, almost_sure, state_costs)
+    return PolicyAnalysis(mdp, probability, expected_cost)
+
+
+def analyse_composition_policy(
+    mdp: ArrayMDP,
+    policy: np.ndarray,
+    accepting: Iterable[State],
+    costs: Optional[np.ndarray] = None,
+) -> PolicyAnalysis:
+    """
+    Analyse a policy of a comp_mdp composition, with the accepting DFA states as targets.
+
+    :param mdp: the composition MDP, with states ((s_1, ..., s_n), q).
+    :param policy: the chosen state-action pair of every state.
+    :param accepting: the accepting states of the DFA.
+    :param costs: the cost of every state-action pair (see analyse_policy).
+    :return: the analysis.
+    """
+    return analyse_policy(mdp, policy, accepting_states(mdp, accepting), costs)
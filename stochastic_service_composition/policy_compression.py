@@ -0,0 +1,416 @@
+"""
+This module implements the compression of a composition policy into a decision tree.
+
+The features of a composition state ((s_1, ..., s_n), q) are its components:
+the local state of every service and the DFA state, as indices (see
+encoding.StateEncoder). An exact decision tree is learned over them: every
+internal node tests one component (with one child per local state), and
+every leaf holds an action. The tree is grown greedily, splitting on the
+component with the highest information gain, until every leaf is pure, so
+that it reproduces the policy on all the given (reachable) states; since the
+components identify a state, purity is always reached. States that were not
+given follow the most frequent branch of a node.
+
+The tree is stored in flat integer arrays, which give a compact serialized
+form (a few numpy arrays and the action labels) and a lookup that costs one
+array access per level, for a single state or a batch of states.
+"""
+import io
+import json
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union, cast
+
+import numpy as np
+from mdp_dp_rl.processes.det_policy import DetPolicy
+
+from stochastic_service_composition.array_mdp import NO_ACTION
+from stochastic_service_composition.encoding import StateEncoder
+from stochastic_service_composition.policy_runtime import _is_composition_state
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.types import Action, CompositionState, State
+
+LEAF = -1
+
+
+def _conditional_entropy(values: np.ndarray, labels: np.ndarray, nb_labels: int) -> float:
+    """Get the entropy of the labels given the values (times the number of samples)."""
+    joint = np.bincount(values * nb_labels + labels)
+    joint = joint[joint > 0]
+    marginal = np.bincount(values)
+    marginal = marginal[marginal > 0]
+    return float(np.sum(marginal * np.log(marginal)) - np.sum(joint * np.log(joint)))
+
+
+class CompressedPolicy:
+    """A policy stored as a decision tree over the components of the composition states."""
+
+    def __init__(
+        self,
+        encoder: StateEncoder,
+        actions: Sequence[Action],
+        node_feature: np.ndarray,
+        node_action: np.ndarray,
+        child_ptr: np.ndarray,
+        children: np.ndarray,
+    ):
+        """
+        Initialize the policy.
+
+        Feature i < n is the local state of service i, and feature n is the DFA state.
+
+        :param encoder: the encoder of the composition states.
+        :param actions: the action labels; the leaves refer to them by index.
+        :param node_feature: the feature tested by every node (LEAF for the leaves).
+        :param node_action: the action of every leaf (NO_ACTION if none).
+        :param child_ptr: the offset of the children of every internal node;
+          the child for value v is children[child_ptr[node] + v].
+        :param children: the child nodes.
+        """
+        self.encoder = encoder
+        self.actions = list(actions)
+        self.node_feature = node_feature
+        self.node_action = node_action
+        self.child_ptr = child_ptr
+        self.children = children
+        self.radices = np.append(encoder.radices, encoder.nb_dfa_states)
+        # plain lists, faster than numpy scalars for single lookups
+        self._node_feature = node_feature.tolist()
+        self._node_action = node_action.tolist()
+        self._child_ptr = child_ptr.tolist()
+        self._children = children.tolist()
+
+    @classmethod
+    def from_policy(
+        cls,
+        policy: Union[DetPolicy, Mapping[State, Action]],
+        services: Sequence[Service],
+        dfa_states: Optional[Sequence[State]] = None,
+    ) -> "CompressedPolicy":
+        """
+        Learn the exact decision tree of a comp_mdp policy.
+
+        :param policy: a DetPolicy, or the action of every state; the states
+          that are not of the form ((s_1, ..., s_n), q) are ignored.
+        :param services: the community of services.
+        :param dfa_states: the states of the target DFA (default: the ones of the policy).
+        :return: the compressed policy.
+        """
+        if isinstance(policy, DetPolicy):
+            policy = {
+                state: max(actions, key=actions.get)
+                for state, actions in policy.policy_data.items()
+            }
+        composition_policy = {
+            cast(CompositionState, state): a
+            for state, a in policy.items()
+            if _is_composition_state(state)
+        }
+        if dfa_states is None:
+            dfa_states = list({dfa_state for _, dfa_state in composition_policy})
+        encoder = StateEncoder(services, list(dfa_states))
+
+        actions: List[Action] = []
+        action_index: Dict[Action, int] = {}
+        features = np.zeros(
+            (len(composition_policy), encoder.nb_services + 1), dtype=np.int64
+        )
+        labels = np.zeros(len(composition_policy), dtype=np.int64)
+        for row, ((system_state, dfa_state), action) in enumerate(
+            composition_policy.items()
+        ):
+            for i, component in enumerate(system_state):
+                features[row, i] = encoder.service_state_index[i][component]
+            features[row, -1] = encoder.dfa_state_index[dfa_state]
+            if action not in action_index:
+                action_index[action] = len(actions)
+                actions.append(action)
+            labels[row] = action_index[action]
+        return cls(encoder, actions, *_grow_tree(features, labels, len(actions), encoder))
+
+    @property
+    def nb_nodes(self) -> int:
+        """Get the number of nodes of the tree."""
+        return len(self.node_feature)
+
+    @property
+    def nb_leaves(self) -> int:
+        """Get the number of leaves (decision rules) of the tree."""
+        return int(np.count_nonzero(self.node_feature == LEAF))
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the arrays of the tree, in bytes."""
+        return sum(
+            array.nbytes
+            for array in (self.node_feature, self.node_action, self.child_ptr, self.children)
+        )
+
+    @property
+    def depth(self) -> int:
+        """Get the depth of the tree (the maximum number of tests of a lookup)."""
+        depth = np.zeros(self.nb_nodes, dtype=np.int64)
+        for node in range(self.nb_nodes):
+            if self.node_feature[node] != LEAF:
+                start = self.child_ptr[node]
+                end = start + self.radices[self.node_feature[node]]
+                depth[self.children[start:end]] = depth[node] + 1
+        return int(depth.max(initial=0))
+
+    def features(self, system_state: Sequence[State], dfa_state: State) -> List[int]:
+        """Get the features (component indices) of a composition state."""
+        result = [index[s] for index, s in zip(self.encoder.service_state_index, system_state)]
+        result.append(self.encoder.dfa_state_index[dfa_state])
+        return result
+
+    def action_id(self, features: Sequence[int]) -> int:
+        """
+        Get the index of the action of a state, given its features.
+
+        :param features: the index of every service state, then the index of the DFA state.
+        :return: the index in actions, or NO_ACTION.
+        """
+        node_feature, child_ptr, children = self._node_feature, self._child_ptr, self._children
+        node = 0
+        feature = node_feature[node]
+        while feature != LEAF:
+            node = children[child_ptr[node] + features[feature]]
+            feature = node_feature[node]
+        return self._node_action[node]
+
+    def action(self, system_state: Sequence[State], dfa_state: State) -> Optional[Action]:
+        """
+        Get the action of a composition state.
+
+        :param system_state: the local state of every service.
+        :param dfa_state: the DFA state.
+        :return: the action, or None.
+        """
+        node_feature, child_ptr, children = self._node_feature, self._child_ptr, self._children
+        service_state_index = self.encoder.service_state_index
+        nb_services = self.encoder.nb_services
+        # only the components tested along the path are looked up
+        node = 0
+        feature = node_feature[node]
+        while feature != LEAF:
+            if feature == nb_services:
+                value = self.encoder.dfa_state_index[dfa_state]
+            else:
+                value = service_state_index[feature][system_state[feature]]
+            node = children[child_ptr[node] + value]
+            feature = node_feature[node]
+        action_id = self._node_action[node]
+        return None if action_id == NO_ACTION else self.actions[action_id]
+
+    def action_ids(self, features: np.ndarray) -> np.ndarray:
+        """
+        Get the indices of the actions of many states, given their features.
+
+        :param features: an array of shape (N, nb_services + 1), see action_id.
+        :return: the indices in actions (NO_ACTION if none).
+        """
+        features = np.asarray(features, dtype=np.int64)
+        rows = np.arange(len(features))
+        nodes = np.zeros(len(features), dtype=np.int64)
+        tested = self.node_feature[nodes]
+        internal = tested != LEAF
+        while internal.any():
+            current = nodes[internal]
+            values = features[rows[internal], tested[internal]]
+            nodes[internal] = self.children[self.child_ptr[current] + values]
+            tested = self.node_feature[nodes]
+            internal = tested != LEAF
+        return self.node_action[nodes]
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the policy.
+
+        The encoding of the states and the actions are stored as JSON (hence
+        the states and the actions must be JSON values, as in the case studies).
+
+        :return: the serialized policy.
+        """
+        metadata = {
+            "service_states": self.encoder.service_states,
+            "dfa_states": self.encoder.dfa_states,
+            "actions": self.actions,
+        }
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            metadata=np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8),
+            node_feature=self.node_feature,
+            node_action=self.node_action,
+            child_ptr=self.child_ptr,
+            children=self.children,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CompressedPolicy":
+        """
+        Deserialize a policy serialized with to_bytes.
+
+        :param data: the serialized policy.
+        :return: the policy.
+        """
+        arrays = np.load(io.BytesIO(data))
+        metadata = json.loads(arrays["metadata"].tobytes().decode())
+        # the encoder only needs the states of the services
+        services = cast(
+            List[Service], [_StatesOnly(states) for states in metadata["service_states"]]
+        )
+        encoder = StateEncoder(services, metadata["dfa_states"])
+        actions = [tuple(a) if isinstance(a, list) else a for a in metadata["actions"]]
+        return cls(
+            encoder,
+            actions,
+            arrays["node_feature"],
+            arrays["node_action"],
+            arrays["child_ptr"],
+            arrays["children"],
+        )
+
+    def save(self, path: str) -> None:
+        """Save the serialized policy to a file."""
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> "CompressedPolicy":
+        """Load a policy saved with save."""
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+class _StatesOnly:
+    """The states of a service, enough to rebuild a StateEncoder."""
+
+    def __init__(self, states: Sequence[State]):
+        """
+        Initialize the stand-in.
+
+        :param states: the states of the service.
+        """
+        self.states = set(states)
+
+
+def _best_split(
+    features: np.ndarray, samples: np.ndarray, labels: np.ndarray, nb_labels: int
+) -> int:
+    """
+    Get the feature with the lowest conditional entropy (highest information gain).
+
+    :param features: the features of all the samples.
+    :param samples: the samples of the node.
+    :param labels: the labels of the samples of the node.
+    :param nb_labels: the number of labels.
+    :return: the feature to split on.
+    """
+    best_feature, best_entropy = None, np.inf
+    for feature in range(features.shape[1]):
+        values = features[samples, feature]
+        if np.all(values == values[0]):
+            continue
+        entropy = _conditional_entropy(values, labels, nb_labels)
+        if entropy < best_entropy:
+            best_feature, best_entropy = feature, entropy
+    assert best_feature is not None, "two identical states with different actions"
+    return best_feature
+
+
+class _TreeBuilder:
+    """The flat arrays of a decision tree, grown node by node."""
+
+    def __init__(self, radices: Sequence[int]):
+        """
+        Initialize the builder.
+
+        :param radices: the number of values of every feature.
+        """
+        self.radices = radices
+        self.node_feature: List[int] = []
+        self.node_action: List[int] = []
+        self.child_ptr: List[int] = []
+        self.children: List[int] = []
+
+    def new_node(self) -> int:
+        """Add a leaf without action, and get its index."""
+        self.node_feature.append(LEAF)
+        self.node_action.append(NO_ACTION)
+        self.child_ptr.append(0)
+        return len(self.node_feature) - 1
+
+    def split(
+        self, node: int, feature: int, majority: int, samples: np.ndarray, values: np.ndarray
+    ) -> List[Tuple[int, np.ndarray]]:
+        """
+        Make a node test a feature, with one child per value.
+
+        The values without samples share the child of the most frequent value.
+
+        :param node: the node to split.
+        :param feature: the feature to test.
+        :param majority: the most frequent label of the node.
+        :param samples: the samples of the node.
+        :param values: the value of the feature for every sample.
+        :return: the new children, with their samples.
+        """
+        order = np.argsort(values, kind="stable")
+        boundaries = np.searchsorted(values[order], np.arange(self.radices[feature] + 1))
+        value_child: List[Optional[int]] = []
+        new_children: List[Tuple[int, np.ndarray]] = []
+        for value in range(self.radices[feature]):
+            subset = samples[order[boundaries[value] : boundaries[value + 1]]]
+            if len(subset) == 0:
+                value_child.append(None)
+                continue
+            child = self.new_node()
+            value_child.append(child)
+            new_children.append((child, subset))
+        frequent_child = value_child[int(np.argmax(np.bincount(values)))]
+        assert frequent_child is not None
+        self.node_feature[node] = feature
+        self.node_action[node] = majority
+        self.child_ptr[node] = len(self.children)
+        self.children.extend(
+            frequent_child if child is None else child for child in value_child
+        )
+        return new_children
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Get the arrays node_feature, node_action, child_ptr and children."""
+        return (
+            np.array(self.node_feature, dtype=np.int16),
+            np.array(self.node_action, dtype=np.int32),
+            np.array(self.child_ptr, dtype=np.int32),
+            np.array(self.children, dtype=np.int32),
+        )
+
+
+def _grow_tree(
+    features: np.ndarray, labels: np.ndarray, nb_labels: int, encoder: StateEncoder
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Grow an exact decision tree, splitting on the feature with the highest information gain.
+
+    :return: the arrays node_feature, node_action, child_ptr and children.
+    """
+    builder = _TreeBuilder(np.append(encoder.radices, encoder.nb_dfa_states).tolist())
+    stack = [(builder.new_node(), np.arange(len(labels)), NO_ACTION)]
+    while stack:
+        node, samples, default = stack.pop()
+        if len(samples) == 0:
+            builder.node_action[node] = default
+            continue
+        node_labels = labels[samples]
+        counts = np.bincount(node_labels, minlength=nb_labels)
+        majority = int(np.argmax(counts))
+        if counts[majority] == len(samples):
+            builder.node_action[node] = majority
+            continue
+        feature = _best_split(features, samples, node_labels, nb_labels)
+        new_children = builder.split(
+            node, feature, majority, samples, features[samples, feature]
+        )
+        stack.extend((child, subset, majority) for child, subset in new_children)
+    return builder.arrays()
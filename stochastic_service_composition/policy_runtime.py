@@ -0,0 +1,272 @@
+"""
+This module implements a compact runtime to serve a solved orchestration policy.
+
+The policy of a comp_mdp composition (e.g. the DetPolicy returned by
+get_optimal_policy_vi, or a SolverResult) maps nested state tuples
+((s_1, ..., s_n), q) to actions (symbol, service_id). A PolicyRuntime stores it
+in integer arrays instead: the states are encoded with the mixed-radix
+encoding of encoding.StateEncoder, in O(n) for n services, and the actions are
+replaced by their index in a table. A query is then an array lookup, and a
+batch of queries a single fancy-indexing operation.
+
+When the encoded state space is small enough, the policy is a dense array
+indexed by the code (O(1) lookups); otherwise, it is a sorted array of codes
+searched with binary search.
+"""
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union, cast
+
+import numpy as np
+from mdp_dp_rl.processes.det_policy import DetPolicy
+
+from stochastic_service_composition.array_mdp import NO_ACTION
+from stochastic_service_composition.encoding import StateEncoder
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.solvers import SolverResult
+from stochastic_service_composition.types import Action, CompositionState, State
+
+# the maximum number of entries of a dense policy table (16 MiB of int32)
+DEFAULT_DENSE_LIMIT = 2 ** 22
+
+
+def _is_composition_state(state: State) -> bool:
+    """Check whether a state is a comp_mdp state ((s_1, ..., s_n), q) (not the sink)."""
+    return isinstance(state, tuple) and len(state) == 2 and isinstance(state[0], tuple)
+
+
+class PolicyRuntime:
+    """A deterministic orchestration policy, stored in integer arrays."""
+
+    def __init__(
+        self,
+        encoder: StateEncoder,
+        policy: Mapping[State, Action],
+        dense_limit: int = DEFAULT_DENSE_LIMIT,
+    ):
+        """
+        Load a policy.
+
+        :param encoder: the encoder of the composition states.
+        :param policy: the action of every composition state; the states that
+          are not of the form ((s_1, ..., s_n), q), like the sink state, are ignored.
+        :param dense_limit: the maximum size of the encoded state space for
+          which the policy is stored as a dense table.
+        """
+        self.encoder = encoder
+        # the contribution of every local state to the code, as Python integers
+        self._offsets: List[Dict[State, int]] = [
+            {state: digit * int(stride) for state, digit in index.items()}
+            for index, stride in zip(encoder.service_state_index, encoder.strides)
+        ]
+        self.actions: List[Action] = []
+        action_index: Dict[Action, int] = {}
+        codes: List[int] = []
+        action_ids: List[int] = []
+        for state, action in policy.items():
+            if not _is_composition_state(state):
+                continue
+            if action not in action_index:
+                action_index[action] = len(self.actions)
+                self.actions.append(action)
+            system_state, dfa_state = cast(CompositionState, state)
+            codes.append(encoder.encode(system_state, dfa_state))
+            action_ids.append(action_index[action])
+        self.action_index = action_index
+
+        codes_array = np.array(codes, dtype=np.int64)
+        action_ids_array = np.array(action_ids, dtype=np.int32)
+        self.dense = encoder.size <= dense_limit
+        if self.dense:
+            self.table = np.full(encoder.size, NO_ACTION, dtype=np.int32)
+            self.table[codes_array] = action_ids_array
+        else:
+            order = np.argsort(codes_array)
+            self.codes = codes_array[order]
+            self.table = action_ids_array[order]
+
+    @classmethod
+    def from_policy(
+        cls,
+        policy: Union[DetPolicy, Mapping[State, Action]],
+        services: Sequence[Service],
+        dfa_states: Optional[Iterable[State]] = None,
+        dense_limit: int = DEFAULT_DENSE_LIMIT,
+    ) -> "PolicyRuntime":
+        """
+        Load a policy of a comp_mdp composition.
+
+        :param policy: a DetPolicy, or the action of every state.
+        :param services: the community of services.
+        :param dfa_states: the states of the target DFA (default: the ones of the policy).
+        :param dense_limit: see the constructor.
+        :return: the runtime.
+        """
+        if isinstance(policy, DetPolicy):
+            policy = {
+                state: max(actions, key=actions.get)
+                for state, actions in policy.policy_data.items()
+            }
+        if dfa_states is None:
+            dfa_states = {
+                cast(CompositionState, state)[1]
+                for state in policy
+                if _is_composition_state(state)
+            }
+        return cls(StateEncoder(services, list(dfa_states)), policy, dense_limit)
+
+    @classmethod
+    def from_result(
+        cls,
+        result: SolverResult,
+        services: Sequence[Service],
+        dfa_states: Optional[Iterable[State]] = None,
+        dense_limit: int = DEFAULT_DENSE_LIMIT,
+    ) -> "PolicyRuntime":
+        """
+        Load the policy of a solver result on a comp_mdp composition.
+
+        :param result: the solver result.
+        :param services: the community of services.
+        :param dfa_states: the states of the target DFA (default: the ones of the MDP).
+        :param dense_limit: see the constructor.
+        :return: the runtime.
+        """
+        return cls.from_policy(
+            result.mdp.policy_actions(result.policy), services, dfa_states, dense_limit
+        )
+
+    @property
+    def nb_states(self) -> int:
+        """Get the number of states with an action."""
+        if self.dense:
+            return int(np.count_nonzero(self.table != NO_ACTION))
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the policy arrays, in bytes."""
+        return self.table.nbytes + (0 if self.dense else self.codes.nbytes)
+
+    def encode(self, system_state: Sequence[State], dfa_state: State) -> int:
+        """
+        Encode an observed state.
+
+        :param system_state: the local state of every service.
+        :param dfa_state: the DFA state.
+        :return: the code of the state.
+        """
+        code = self.encoder.dfa_state_index[dfa_state]
+        for offsets, state in zip(self._offsets, system_state):
+            code += offsets[state]
+        return code
+
+    def encode_many(
+        self, system_states: Sequence[Sequence[State]], dfa_states: Sequence[State]
+    ) -> np.ndarray:
+        """
+        Encode many observed states.
+
+        :param system_states: the local state of every service, for every state.
+        :param dfa_states: the DFA state of every state.
+        :return: the array of codes.
+        """
+        digits = np.array(
+            [
+                [index[s] for index, s in zip(self.encoder.service_state_index, system_state)]
+                for system_state in system_states
+            ],
+            dtype=np.int64,
+        ).reshape(len(system_states), self.encoder.nb_services)
+        dfa_digits = np.array(
+            [self.encoder.dfa_state_index[q] for q in dfa_states], dtype=np.int64
+        )
+        return self.encoder.encode_many(digits, dfa_digits)
+
+    def action_id(self, code: int) -> int:
+        """
+        Get the index of the action of an encoded state.
+
+        :param code: the code of the state.
+        :return: the index in actions, or NO_ACTION if the state has no action.
+        """
+        if self.dense:
+            return int(self.table[code])
+        position = int(np.searchsorted(self.codes, code))
+        if position < len(self.codes) and self.codes[position] == code:
+            return int(self.table[position])
+        return NO_ACTION
+
+    def action_ids(self, codes: np.ndarray) -> np.ndarray:
+        """
+        Get the indices of the actions of many encoded states.
+
+        :param codes: the codes of the states.
+        :return: the indices in actions (NO_ACTION for the states without action).
+        """
+        codes = np.asarray(codes, dtype=np.int64)
+        if self.dense:
+            return self.table[codes]
+        if len(self.codes) == 0:
+            return np.full(len(codes), NO_ACTION, dtype=np.int32)
+        positions = np.minimum(np.searchsorted(self.codes, codes), len(self.codes) - 1)
+        return np.where(self.codes[positions] == codes, self.table[positions], NO_ACTION)
+
+    def action(self, system_state: Sequence[State], dfa_state: State) -> Optional[Action]:
+        """
+        Get the action of an observed state.
+
+        :param system_state: the local state of every service.
+        :param dfa_state: the DFA state.
+        :return: the action (symbol, service_id), or None if the state has no action.
+        """
+        action_id = self.action_id(self.encode(system_state, dfa_state))
+        return None if action_id == NO_ACTION else self.actions[action_id]
+
+    def actions_many(
+        self, system_states: Sequence[Sequence[State]], dfa_states: Sequence[State]
+    ) -> List[Optional[Action]]:
+        """
+        Get the actions of many observed states.
+
+        :param system_states: the local state of every service, for every state.
+        :param dfa_states: the DFA state of every state.
+        :return: the actions (None for the states without action), in the same order.
+        """
+        action_ids = self.action_ids(self.encode_many(system_states, dfa_states))
+        return [
+            None if action_id == NO_ACTION else self.actions[action_id]
+            for action_id in action_ids.tolist()
+        ]
+
+
+def query_throughput(
+    runtime: PolicyRuntime,
+    states: Sequence[Tuple[Sequence[State], State]],
+    batch_size: Optional[int] = None,
+    repeat: int = 5,
+) -> float:
+    """
+    Measure the query throughput of a runtime, from observed states to actions.
+
+    :param runtime: the policy runtime.
+    :param states: the observed states (system state, DFA state) to query.
+    :param batch_size: the number of states per query (default: single queries).
+    :param repeat: the number of passes over the states.
+    :return: the number of states answered per second (best pass).
+    """
+    assert len(states) > 0, "at least one state is needed"
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if batch_size is None:
+            for system_state, dfa_state in states:
+                runtime.action(system_state, dfa_state)
+        else:
+            for i in range(0, len(states), batch_size):
+                batch = states[i : i + batch_size]
+                runtime.actions_many(
+                    [system_state for system_state, _ in batch],
+                    [dfa_state for _, dfa_state in batch],
+                )
+        best = min(best, time.perf_counter() - start)
+    return len(states) / best if best > 0.0 else float("inf")
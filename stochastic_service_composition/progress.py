@@ -0,0 +1,188 @@
+"""
+This module implements the progress reporting and the cancellation of compositions and solves.
+
+A ProgressMonitor is passed to a long-running computation (comp_mdp and
+composition_mdp, including the system service they build, comp_mdp_batched,
+value_iteration), which updates it as it goes. At a configurable interval, the monitor builds a ProgressReport (states
+expanded, frontier size, transitions emitted, states per second, current
+memory) and passes it to a callback. Cancellation is cooperative: the
+computation stops at its next update if the monitor has been cancelled (e.g.
+from another thread or a signal handler), if the callback returned False, or
+if the wall-clock budget is exhausted. A stopped composition returns None
+(after saving its checkpoint, if any, so that it can be resumed), and a
+stopped solve returns its current, unconverged, result.
+"""
+import os
+import sys
+import time
+from typing import Callable, Optional
+
+DEFAULT_REPORT_INTERVAL = 1.0
+
+
+def current_memory() -> int:
+    """
+    Get the memory used by the process, in bytes.
+
+    On Linux, this is the current resident set size; elsewhere, it is the
+    peak resident set size.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource  # not available on Windows
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ProgressReport:
+    """The progress of a computation, at some point in time."""
+
+    def __init__(
+        self,
+        stage: str,
+        elapsed: float,
+        states: int,
+        frontier: Optional[int],
+        transitions: Optional[int],
+        iterations: Optional[int],
+        residual: Optional[float],
+        memory: int,
+    ):
+        """
+        Initialize the report.
+
+        :param stage: the computation, e.g. "comp_mdp" or "value_iteration".
+        :param elapsed: the time since the beginning of the stage, in seconds.
+        :param states: the number of states expanded (compositions) or backed up (solves).
+        :param frontier: the number of states waiting to be expanded (compositions).
+        :param transitions: the number of transitions emitted (compositions).
+        :param iterations: the number of sweeps (solves).
+        :param residual: the last maximum difference between two value functions (solves).
+        :param memory: the memory used by the process, in bytes.
+        """
+        self.stage = stage
+        self.elapsed = elapsed
+        self.states = states
+        self.frontier = frontier
+        self.transitions = transitions
+        self.iterations = iterations
+        self.residual = residual
+        self.memory = memory
+
+    @property
+    def states_per_second(self) -> float:
+        """Get the mean number of states expanded (or backed up) per second."""
+        return self.states / self.elapsed if self.elapsed > 0.0 else 0.0
+
+    def __str__(self) -> str:
+        """Describe the progress on one line."""
+        fields = [f"{self.stage}: {self.elapsed:.1f} s", f"states={self.states}"]
+        if self.frontier is not None:
+            fields.append(f"frontier={self.frontier}")
+        if self.transitions is not None:
+            fields.append(f"transitions={self.transitions}")
+        if self.iterations is not None:
+            fields.append(f"iterations={self.iterations}")
+        if self.residual is not None:
+            fields.append(f"residual={self.residual:.3g}")
+        fields.append(f"states/s={self.states_per_second:.0f}")
+        fields.append(f"memory={self.memory / 2 ** 20:.1f} MB")
+        return ", ".join(fields)
+
+
+# a callback receives the reports; it can return False to cancel the computation
+ProgressCallback = Callable[[ProgressReport], Optional[bool]]
+
+
+class ProgressMonitor:
+    """Reports the progress of computations, and stops them when cancelled or out of time."""
+
+    def __init__(
+        self,
+        callback: Optional[ProgressCallback] = None,
+        interval: float = DEFAULT_REPORT_INTERVAL,
+        time_budget: Optional[float] = None,
+    ):
+        """
+        Initialize the monitor.
+
+        :param callback: the function that receives the reports, if any; if
+          it returns False, the computation is cancelled.
+        :param interval: the minimum time between two reports, in seconds.
+        :param time_budget: the wall-clock time after which the computations
+          are stopped, in seconds from the creation of the monitor (shared by
+          all the computations it monitors), if any.
+        """
+        self.callback = callback
+        self.interval = interval
+        self.time_budget = time_budget
+        self.start = time.monotonic()
+        self.stop_reason: Optional[str] = None
+        self.last_report: Optional[ProgressReport] = None
+        self._stage: Optional[str] = None
+        self._stage_start = self.start
+        self._last_report_time = self.start
+
+    @property
+    def stopped(self) -> bool:
+        """Check whether the computations must stop."""
+        return self.stop_reason is not None
+
+    @property
+    def elapsed(self) -> float:
+        """Get the time since the creation of the monitor, in seconds."""
+        return time.monotonic() - self.start
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        """Ask the computations to stop at their next update (e.g. from another thread)."""
+        if self.stop_reason is None:
+            self.stop_reason = reason
+
+    def update(
+        self,
+        stage: str,
+        states: int,
+        frontier: Optional[int] = None,
+        transitions: Optional[int] = None,
+        iterations: Optional[int] = None,
+        residual: Optional[float] = None,
+        final: bool = False,
+    ) -> bool:
+        """
+        Update the progress of a computation, and report it if the interval has elapsed.
+
+        :param stage: the computation.
+        :param states: see ProgressReport.
+        :param frontier: see ProgressReport.
+        :param transitions: see ProgressReport.
+        :param iterations: see ProgressReport.
+        :param residual: see ProgressReport.
+        :param final: whether this is the last update of the computation
+          (then it is always reported).
+        :return: whether the computation can go on.
+        """
+        now = time.monotonic()
+        if stage != self._stage:
+            self._stage = stage
+            self._stage_start = now
+        if final or now - self._last_report_time >= self.interval:
+            self._last_report_time = now
+            self.last_report = ProgressReport(
+                stage,
+                now - self._stage_start,
+                states,
+                frontier,
+                transitions,
+                iterations,
+                residual,
+                current_memory(),
+            )
+            if self.callback is not None and self.callback(self.last_report) is False:
+                self.cancel("cancelled by the callback")
+        if self.time_budget is not None and now - self.start >= self.time_budget:
+            self.cancel(f"time budget of {self.time_budget} s exhausted")
+        return self.stop_reason is None
@@ -0,0 +1,249 @@
+"""
+This module implements a replay benchmark of orchestration policies.
+
+A trace is a sequence of service state changes, each with the composition
+state ((s_1, ..., s_n), q) it leads to. Traces are generated in closed loop:
+the policy chooses an action, and the next local state of the chosen service
+is sampled from its transition probabilities (when the target is over, the
+services are reset to their initial states and a new run starts). Traces can
+be saved and loaded as JSON lines, to replay recorded executions.
+
+The replay drives the policy lookups at a given event rate, in open loop: the
+i-th decision is due at start + i / rate, and its latency is measured from
+that instant, so that a lookup slower than the event rate delays the next
+ones and shows up in the latency percentiles.
+"""
+import json
+import random
+import sys
+import time
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.types import Action, State
+
+RESET = -1
+
+
+class TraceEvent:
+    """A service state change, with the composition state it leads to."""
+
+    def __init__(
+        self,
+        service_id: int,
+        state: State,
+        system_state: Tuple[State, ...],
+        dfa_state: State,
+    ):
+        """
+        Initialize the event.
+
+        :param service_id: the index of the service, or RESET if all the
+          services are reset to their initial states.
+        :param state: the new local state of the service (None for RESET).
+        :param system_state: the local state of every service after the change.
+        :param dfa_state: the DFA state after the change.
+        """
+        self.service_id = service_id
+        self.state = state
+        self.system_state = system_state
+        self.dfa_state = dfa_state
+
+    def to_json(self) -> str:
+        """Serialize the event as a JSON line."""
+        return json.dumps(
+            {
+                "service_id": self.service_id,
+                "state": self.state,
+                "system_state": list(self.system_state),
+                "dfa_state": self.dfa_state,
+            }
+        )
+
+    @classmethod
+    def from_json(cls, line: str) -> "TraceEvent":
+        """Deserialize an event from a JSON line."""
+        data = json.loads(line)
+        return cls(
+            data["service_id"], data["state"], tuple(data["system_state"]), data["dfa_state"]
+        )
+
+
+class DictPolicy:
+    """A policy given as a dictionary from composition states to actions (the baseline)."""
+
+    def __init__(self, policy: Mapping[State, Action]):
+        """
+        Initialize the policy.
+
+        :param policy: the action of every state, or the policy_data of a
+          DetPolicy (a dictionary of action distributions).
+        """
+        self.policy = {
+            state: max(action, key=action.__getitem__) if isinstance(action, dict) else action
+            for state, action in policy.items()
+        }
+
+    @property
+    def nbytes(self) -> int:
+        """Get the memory used by the dictionary and its keys, in bytes."""
+        return deep_sizeof(self.policy)
+
+    def action(self, system_state: Sequence[State], dfa_state: State) -> Optional[Action]:
+        """Get the action of a state, if any."""
+        return self.policy.get((tuple(system_state), dfa_state))
+
+
+def deep_sizeof(obj, seen: Optional[set] = None) -> int:
+    """
+    Estimate the memory used by an object and by the objects it contains.
+
+    :param obj: the object (containers are dictionaries, lists, tuples and sets).
+    :param seen: the ids of the objects already counted.
+    :return: the size in bytes.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def generate_trace(
+    policy,
+    services: Sequence[Service],
+    dfa: SimpleDFA,
+    nb_events: int,
+    seed: Optional[int] = None,
+) -> List[TraceEvent]:
+    """
+    Generate a trace by executing a policy on the services.
+
+    :param policy: the policy, with a method action(system_state, dfa_state)
+      (e.g. a PolicyRuntime or a DictPolicy).
+    :param services: the community of services.
+    :param dfa: the target DFA.
+    :param nb_events: the number of events of the trace.
+    :param seed: the seed of the random generator.
+    :return: the trace.
+    """
+    rng = random.Random(seed)
+    initial_system_state = tuple(service.initial_state for service in services)
+    system_state, dfa_state = list(initial_system_state), dfa.initial_state
+    trace: List[TraceEvent] = []
+    while len(trace) < nb_events:
+        action = policy.action(system_state, dfa_state)
+        if not isinstance(action, tuple):
+            # the target is over (or stuck): start a new run
+            system_state, dfa_state = list(initial_system_state), dfa.initial_state
+            trace.append(TraceEvent(RESET, None, initial_system_state, dfa_state))
+            continue
+        symbol, service_id = action
+        next_states, _reward = services[service_id].transition_function[
+            system_state[service_id]
+        ][symbol]
+        next_state = rng.choices(list(next_states), list(next_states.values()))[0]
+        system_state[service_id] = next_state
+        if symbol in dfa.alphabet:
+            dfa_state = dfa.transition_function.get(dfa_state, {}).get(symbol, dfa_state)
+        trace.append(TraceEvent(service_id, next_state, tuple(system_state), dfa_state))
+    return trace
+
+
+def save_trace(trace: Iterable[TraceEvent], path: str) -> None:
+    """Save a trace as JSON lines."""
+    with open(path, "w") as f:
+        for event in trace:
+            f.write(event.to_json() + "\n")
+
+
+def load_trace(path: str) -> List[TraceEvent]:
+    """Load a trace saved with save_trace."""
+    with open(path, "r") as f:
+        return [TraceEvent.from_json(line) for line in f if line.strip()]
+
+
+class ReplayReport:
+    """The result of a replay: decision latencies, throughput and policy memory."""
+
+    def __init__(
+        self,
+        latencies: np.ndarray,
+        elapsed: float,
+        rate: Optional[float],
+        policy_bytes: Optional[int],
+    ):
+        """
+        Initialize the report.
+
+        :param latencies: the latency of every decision, in seconds.
+        :param elapsed: the duration of the replay, in seconds.
+        :param rate: the target event rate, in events per second (None for
+          as fast as possible).
+        :param policy_bytes: the memory used by the policy structure, if known.
+        """
+        self.latencies = latencies
+        self.elapsed = elapsed
+        self.rate = rate
+        self.policy_bytes = policy_bytes
+
+    @property
+    def throughput(self) -> float:
+        """Get the number of decisions per second."""
+        return len(self.latencies) / self.elapsed if self.elapsed > 0.0 else float("inf")
+
+    def percentile(self, p: float) -> float:
+        """Get a percentile of the decision latency, in seconds."""
+        return float(np.percentile(self.latencies, p)) if len(self.latencies) > 0 else 0.0
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """Get the main figures of the report (latencies in microseconds)."""
+        return {
+            "decisions": len(self.latencies),
+            "rate": self.rate,
+            "throughput": self.throughput,
+            "p50_us": self.percentile(50) * 1e6,
+            "p99_us": self.percentile(99) * 1e6,
+            "max_us": self.percentile(100) * 1e6,
+            "policy_bytes": self.policy_bytes,
+        }
+
+
+def replay(
+    policy, trace: Sequence[TraceEvent], rate: Optional[float] = None
+) -> ReplayReport:
+    """
+    Replay a trace: look up the action of the state after every event.
+
+    :param policy: the policy, with a method action(system_state, dfa_state),
+      and optionally an attribute nbytes.
+    :param trace: the trace.
+    :param rate: the event rate, in events per second (default: as fast as possible).
+    :return: the report.
+    """
+    assert rate is None or rate > 0.0, "the rate must be positive"
+    latencies = np.zeros(len(trace))
+    period = 0.0 if rate is None else 1.0 / rate
+    start = time.perf_counter()
+    for i, event in enumerate(trace):
+        if rate is None:
+            due = time.perf_counter()
+        else:
+            due = start + i * period
+            remaining = due - time.perf_counter()
+            if remaining > 1e-3:
+                time.sleep(remaining - 1e-3)
+            while time.perf_counter() < due:
+                pass
+        policy.action(event.system_state, event.dfa_state)
+        latencies[i] = time.perf_counter() - due
+    elapsed = time.perf_counter() - start
+    return ReplayReport(latencies, elapsed, rate, getattr(policy, "nbytes", None))
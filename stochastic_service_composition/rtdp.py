@@ -0,0 +1,362 @@
+"""
+This module implements an anytime planner for online orchestration.
+
+Instead of building and solving the whole composition MDP of comp_mdp, a
+LazyCompositionMDP generates the transitions of a composition state
+((s_1, ..., s_n), q) only when the planner reaches it, and an RTDPPlanner runs
+bounded real-time dynamic programming (BRTDP) trials from the current state:
+
+- a lower and an upper bound on the optimal value of every visited state are
+  kept in a table, and initialized from the bounds on the rewards;
+- a trial follows the action that is greedy with respect to the upper bound,
+  and samples the next state proportionally to p(s') * (U(s') - L(s')), so
+  that it goes where the value is still uncertain; it ends when the expected
+  gap of the successors is small relative to the gap of the start state;
+- the states of the trial are backed up (on both bounds) in reverse order.
+
+Planning can be interrupted at a deadline: the planner then returns the action
+that is greedy with respect to the lower bound, together with the bounds of
+the current state. Since the lower bound starts from a value that the
+Bellman operator can only increase, the returned action guarantees at least
+the returned lower bound. The value table is kept across calls, hence the
+planner improves over time as the orchestration goes on.
+"""
+import random
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, cast
+
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.composition_mdp import (
+    COMPOSITION_MDP_SINK_STATE,
+    COMPOSITION_MDP_UNDEFINED_ACTION,
+    DEFAULT_GAMMA,
+)
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.types import Action, CompositionState, State
+
+# the transitions of a state: (action, reward, next states, probabilities)
+LazyTransitions = List[Tuple[Action, float, Tuple[State, ...], Tuple[float, ...]]]
+
+
+class LazyCompositionMDP:
+    """The composition MDP of comp_mdp, whose transitions are generated on demand."""
+
+    def __init__(
+        self, dfa: SimpleDFA, services: Sequence[Service], gamma: float = DEFAULT_GAMMA
+    ):
+        """
+        Initialize the lazy composition.
+
+        :param dfa: the target DFA.
+        :param services: the community of services.
+        :param gamma: the discount factor.
+        """
+        self.dfa = dfa.trim()
+        self.services = list(services)
+        self.gamma = gamma
+        self.initial_state = (
+            tuple(service.initial_state for service in self.services),
+            self.dfa.initial_state,
+        )
+        self._allowed_services: Dict[State, List[int]] = {}
+        self._transitions: Dict[State, LazyTransitions] = {}
+
+    @property
+    def nb_expanded_states(self) -> int:
+        """Get the number of states whose transitions have been generated."""
+        return len(self._transitions)
+
+    def reward_bounds(self) -> Tuple[float, float]:
+        """
+        Get a lower and an upper bound on the reward of any transition.
+
+        :return: the minimum and the maximum reward (both bounds include 0,
+          the reward of the sink state).
+        """
+        rewards = [
+            reward
+            for service in self.services
+            for transitions in service.transition_function.values()
+            for _next_states, reward in transitions.values()
+        ]
+        # the goal reward is 0 or 1
+        r_min = min(min(rewards, default=0.0), 0.0)
+        r_max = max(max(rewards, default=0.0) + 1.0, 0.0)
+        return r_min, r_max
+
+    def allowed_services(self, dfa_state: State) -> List[int]:
+        """Get the services that can do one of the next DFA actions, as in comp_mdp."""
+        if dfa_state not in self._allowed_services:
+            next_dfa_actions = set(self.dfa.transition_function.get(dfa_state, {}).keys())
+            self._allowed_services[dfa_state] = [
+                service_id
+                for service_id, service in enumerate(self.services)
+                if len(next_dfa_actions.intersection(service.actions)) > 0
+            ]
+        return self._allowed_services[dfa_state]
+
+    def is_terminal(self, state: State) -> bool:
+        """Check whether a state can only loop with reward 0 (its value is 0)."""
+        if state == COMPOSITION_MDP_SINK_STATE:
+            return True
+        _system_state, dfa_state = cast(CompositionState, state)
+        return len(self.allowed_services(dfa_state)) == 0
+
+    def transitions(self, state: State) -> LazyTransitions:
+        """
+        Get the transitions of a composition state, generating them if needed.
+
+        :param state: the composition state ((s_1, ..., s_n), q), or the sink state.
+        :return: the list of (action, reward, next states, probabilities).
+        """
+        if state in self._transitions:
+            return self._transitions[state]
+        if self.is_terminal(state):
+            result: LazyTransitions = [
+                (
+                    COMPOSITION_MDP_UNDEFINED_ACTION,
+                    0.0,
+                    (COMPOSITION_MDP_SINK_STATE,),
+                    (1.0,),
+                )
+            ]
+            self._transitions[state] = result
+            return result
+
+        system_state, dfa_state = cast(CompositionState, state)
+        dfa_transitions = self.dfa.transition_function.get(dfa_state, {})
+        result = []
+        for service_id in self.allowed_services(dfa_state):
+            service = self.services[service_id]
+            for symbol, (next_service_states, reward) in service.transition_function[
+                system_state[service_id]
+            ].items():
+                if symbol not in self.dfa.alphabet:
+                    next_dfa_state = dfa_state
+                    goal_reward = 0.0
+                elif symbol in dfa_transitions:
+                    next_dfa_state = dfa_transitions[symbol]
+                    goal_reward = 1.0 if self.dfa.is_accepting(next_dfa_state) else 0.0
+                else:
+                    continue
+                next_states = []
+                for next_service_state in next_service_states:
+                    next_system_state = list(system_state)
+                    next_system_state[service_id] = next_service_state
+                    next_states.append((tuple(next_system_state), next_dfa_state))
+                result.append(
+                    (
+                        (symbol, service_id),
+                        goal_reward + reward,
+                        tuple(next_states),
+                        tuple(next_service_states.values()),
+                    )
+                )
+        self._transitions[state] = result
+        return result
+
+
+class PlanningResult:
+    """The output of a call to RTDPPlanner.plan."""
+
+    def __init__(
+        self,
+        state: State,
+        action: Optional[Action],
+        lower: float,
+        upper: float,
+        trials: int,
+        backups: int,
+        elapsed: float,
+    ):
+        """
+        Initialize the result.
+
+        :param state: the state the planner was called from.
+        :param action: the action that is greedy with respect to the lower
+          bound (None for the states without actions).
+        :param lower: the lower bound on the optimal value of the state, which
+          is also guaranteed by the returned action.
+        :param upper: the upper bound on the optimal value of the state.
+        :param trials: the number of trials of this call.
+        :param backups: the number of state backups of this call.
+        :param elapsed: the planning time, in seconds.
+        """
+        self.state = state
+        self.action = action
+        self.lower = lower
+        self.upper = upper
+        self.trials = trials
+        self.backups = backups
+        self.elapsed = elapsed
+
+    @property
+    def gap(self) -> float:
+        """Get the gap between the bounds of the state."""
+        return self.upper - self.lower
+
+
+class RTDPPlanner:
+    """An anytime bounded-RTDP planner, whose value table persists across calls."""
+
+    def __init__(
+        self,
+        mdp: LazyCompositionMDP,
+        epsilon: float = 1e-3,
+        tau: float = 10.0,
+        max_depth: int = 1000,
+        seed: Optional[int] = None,
+    ):
+        """
+        Initialize the planner.
+
+        :param mdp: the lazy composition MDP.
+        :param epsilon: the gap of the bounds at which planning from a state stops.
+        :param tau: a trial ends when the expected gap of the successors is
+          below the gap of the start state divided by tau.
+        :param max_depth: the maximum length of a trial.
+        :param seed: the seed of the trial sampling.
+        """
+        assert 0.0 <= mdp.gamma < 1.0, "RTDP needs a discount factor less than 1"
+        assert tau > 1.0, "tau must be greater than 1"
+        self.mdp = mdp
+        self.epsilon = epsilon
+        self.tau = tau
+        self.max_depth = max_depth
+        self.random = random.Random(seed)
+        self.lower: Dict[State, float] = {}
+        self.upper: Dict[State, float] = {}
+        self.total_trials = 0
+        self.total_backups = 0
+        r_min, r_max = mdp.reward_bounds()
+        self.initial_lower = r_min / (1.0 - mdp.gamma)
+        self.initial_upper = r_max / (1.0 - mdp.gamma)
+
+    def reset(self) -> None:
+        """Forget the value table (e.g. after a change of the service parameters)."""
+        self.lower.clear()
+        self.upper.clear()
+
+    def bounds(self, state: State) -> Tuple[float, float]:
+        """Get the current lower and upper bound on the optimal value of a state."""
+        if self.mdp.is_terminal(state):
+            return 0.0, 0.0
+        return (
+            self.lower.get(state, self.initial_lower),
+            self.upper.get(state, self.initial_upper),
+        )
+
+    def _q_bounds(self, state: State) -> Tuple[List[float], List[float]]:
+        """Compute the bounds on the Q-value of every action of a state."""
+        gamma = self.mdp.gamma
+        lower, upper = self.lower, self.upper
+        initial_lower, initial_upper = self.initial_lower, self.initial_upper
+        lower_q, upper_q = [], []
+        for _action, reward, next_states, probs in self.mdp.transitions(state):
+            expected_lower = expected_upper = 0.0
+            for next_state, prob in zip(next_states, probs):
+                if self.mdp.is_terminal(next_state):
+                    continue
+                expected_lower += prob * lower.get(next_state, initial_lower)
+                expected_upper += prob * upper.get(next_state, initial_upper)
+            lower_q.append(reward + gamma * expected_lower)
+            upper_q.append(reward + gamma * expected_upper)
+        return lower_q, upper_q
+
+    def _backup(self, state: State) -> Tuple[List[float], List[float]]:
+        """Back up both bounds of a (non-terminal) state."""
+        lower_q, upper_q = self._q_bounds(state)
+        # the bounds can only improve, which keeps the lower bound monotone;
+        # as in ArrayMDP, a state without actions has value 0
+        lower = max(self.lower.get(state, self.initial_lower), max(lower_q, default=0.0))
+        upper = min(self.upper.get(state, self.initial_upper), max(upper_q, default=0.0))
+        self.lower[state], self.upper[state] = lower, upper
+        self.total_backups += 1
+        return lower_q, upper_q
+
+    def _trial(self, start: State, deadline: Optional[float]) -> int:
+        """Run a trial from a state, and return the number of backups."""
+        trajectory: List[State] = []
+        state = start
+        start_lower, start_upper = self.bounds(start)
+        threshold = (start_upper - start_lower) / self.tau
+        for _ in range(self.max_depth):
+            if self.mdp.is_terminal(state):
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            trajectory.append(state)
+            _lower_q, upper_q = self._backup(state)
+            if len(upper_q) == 0:
+                break
+            best = max(range(len(upper_q)), key=upper_q.__getitem__)
+            _action, _reward, next_states, probs = self.mdp.transitions(state)[best]
+            weights = []
+            for next_state, prob in zip(next_states, probs):
+                next_lower, next_upper = self.bounds(next_state)
+                weights.append(prob * (next_upper - next_lower))
+            if sum(weights) <= threshold:
+                break
+            state = self.random.choices(next_states, weights)[0]
+        for state in reversed(trajectory):
+            self._backup(state)
+        return 2 * len(trajectory)
+
+    def greedy_action(self, state: State) -> Optional[Action]:
+        """
+        Get the action that is greedy with respect to the lower bound.
+
+        :param state: the state.
+        :return: the action, or None for the states without actions.
+        """
+        if self.mdp.is_terminal(state):
+            return None
+        lower_q, _upper_q = self._q_bounds(state)
+        if len(lower_q) == 0:
+            return None
+        best = max(range(len(lower_q)), key=lower_q.__getitem__)
+        return self.mdp.transitions(state)[best][0]
+
+    def plan(
+        self,
+        state: Optional[State] = None,
+        time_budget: Optional[float] = None,
+        deadline: Optional[float] = None,
+        max_trials: Optional[int] = None,
+    ) -> PlanningResult:
+        """
+        Run trials from a state until the bounds meet, or the time is over.
+
+        :param state: the current state (default: the initial state of the MDP).
+        :param time_budget: the planning time, in seconds, if any.
+        :param deadline: the time.monotonic() instant at which planning stops, if any.
+        :param max_trials: the maximum number of trials, if any.
+        :return: the greedy action with its value bounds.
+        """
+        start_time = time.monotonic()
+        state = self.mdp.initial_state if state is None else state
+        if time_budget is not None:
+            budget_deadline = start_time + time_budget
+            deadline = budget_deadline if deadline is None else min(deadline, budget_deadline)
+        trials = 0
+        backups = 0
+        while max_trials is None or trials < max_trials:
+            lower, upper = self.bounds(state)
+            if upper - lower < self.epsilon:
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            backups += self._trial(state, deadline)
+            trials += 1
+        self.total_trials += trials
+        lower, upper = self.bounds(state)
+        return PlanningResult(
+            state,
+            self.greedy_action(state),
+            lower,
+            upper,
+            trials,
+            backups,
+            time.monotonic() - start_time,
+        )
@@ -1,8 +1,9 @@
 """This module contains the implementation of the service abstraction."""
 
 from collections import deque
-from typing import Deque, Set, Tuple
+from typing import Deque, Optional, Set, Tuple
 
+from stochastic_service_composition.progress import ProgressMonitor
 from stochastic_service_composition.types import (
     Action,
     State,
@@ -167,12 +168,37 @@ def build_service_from_transitions(
     return Service(states, actions, final_states, initial_state, transition_function)
 
 
-def build_system_service(*services: Service) -> Service:
+def reachable_states(service: Service) -> Set[State]:
+    """
+    Compute the states of a service that are reachable from its initial state.
+
+    :param service: the service
+    :return: the set of reachable states
+    """
+    visited = {service.initial_state}
+    queue: Deque[State] = deque([service.initial_state])
+    while len(queue) > 0:
+        current_state = queue.popleft()
+        for next_states, _reward in service.transition_function.get(
+            current_state, {}
+        ).values():
+            for next_state in next_states.keys():
+                if next_state not in visited:
+                    visited.add(next_state)
+                    queue.append(next_state)
+    return visited
+
+
+def build_system_service(
+    *services: Service, monitor: Optional[ProgressMonitor] = None
+) -> Optional[Service]:
     """
     Do the build_system_service between services.
 
     :param services: a list of service instances
-    :return: the system service
+    :param monitor: if given, the progress is reported to it, and the
+      construction stops when it is cancelled.
+    :return: the system service, or None if the monitor stopped the construction
     """
     #assert len(services) >= 2, "at least two services"
 
@@ -187,8 +213,13 @@ def build_system_service(*services: Service) -> Service:
     queue: Deque[Tuple[State, ...]] = deque()
     queue.append(new_initial_state)
     to_be_visited = {new_initial_state}
-    visited = set()
+    visited: Set[Tuple[State, ...]] = set()
+    nb_transitions = 0
     while len(queue) > 0:
+        if monitor is not None and not monitor.update(
+            "system_service", len(visited), len(queue), nb_transitions
+        ):
+            return None
         current_state: Tuple[State, ...] = queue.popleft()
         to_be_visited.remove(current_state)
         visited.add(current_state)
@@ -220,10 +251,13 @@ def build_system_service(*services: Service) -> Service:
                     next_state_list[i] = next_service_state
                     next_state = tuple(next_state_list)
                     new_transition_function[current_state][symbol][0][next_state] = prob
+                    nb_transitions += 1
                     if next_state not in visited and next_state not in to_be_visited:
                         to_be_visited.add(next_state)
                         queue.append(next_state)
 
+    if monitor is not None:
+        monitor.update("system_service", len(visited), 0, nb_transitions, final=True)
     new_service = Service(
         states=new_states,
         actions=actions,
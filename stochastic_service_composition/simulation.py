@@ -0,0 +1,286 @@
+"""
+This module implements a vectorized Monte Carlo simulator of policies on array-backed MDPs.
+
+Thousands of episodes are run in lockstep, as numpy arrays (the current state
+of every episode, its cumulative and discounted reward, its number of steps).
+At every step, the state-action pair chosen by the policy in every state is
+looked up, and the next state is sampled with a single comparison against a
+padded table of cumulative transition probabilities (one row per state-action
+pair). Episodes stop when they reach a goal state (e.g. the composition states
+with an accepting DFA state, as in policy_analysis), a state without action, or
+the horizon; only the episodes that reach a goal state are completed.
+
+The result gives the empirical completion probability, the distribution of
+the cost (the undiscounted sum of the costs of the state-action pairs, by
+default minus their rewards) and of the makespan (the number of steps to
+completion), with confidence intervals. The 'undefined' steps of a comp_mdp
+composition (towards the sink state, once the target is over) are not service
+executions, hence they count neither as steps nor as costs.
+"""
+import math
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from stochastic_service_composition.array_mdp import NO_ACTION, ArrayMDP
+from stochastic_service_composition.asynchronous_solvers import accepting_states
+from stochastic_service_composition.composition_mdp import COMPOSITION_MDP_UNDEFINED_ACTION
+from stochastic_service_composition.types import State
+
+# the z-scores of the usual confidence levels
+_Z_SCORES = {0.9: 1.6448536269514722, 0.95: 1.959963984540054, 0.99: 2.5758293035489004}
+
+
+def _z_score(level: float) -> float:
+    """Get the two-sided z-score of a confidence level."""
+    assert level in _Z_SCORES, f"unsupported confidence level {level}"
+    return _Z_SCORES[level]
+
+
+def mean_confidence_interval(values: np.ndarray, level: float = 0.95) -> Tuple[float, float]:
+    """
+    Compute a normal confidence interval for the mean of a sample.
+
+    :param values: the sample.
+    :param level: the confidence level (0.9, 0.95 or 0.99).
+    :return: the lower and upper bounds of the interval.
+    """
+    if len(values) == 0:
+        return math.nan, math.nan
+    mean = float(np.mean(values))
+    if len(values) == 1:
+        return mean, mean
+    half_width = _z_score(level) * float(np.std(values, ddof=1)) / math.sqrt(len(values))
+    return mean - half_width, mean + half_width
+
+
+def proportion_confidence_interval(
+    successes: int, trials: int, level: float = 0.95
+) -> Tuple[float, float]:
+    """
+    Compute the Wilson score interval of a proportion.
+
+    :param successes: the number of successes.
+    :param trials: the number of trials.
+    :param level: the confidence level (0.9, 0.95 or 0.99).
+    :return: the lower and upper bounds of the interval.
+    """
+    if trials == 0:
+        return 0.0, 1.0
+    z = _z_score(level)
+    p = successes / trials
+    denominator = 1.0 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    spread = math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials))
+    half_width = z * spread / denominator
+    # the bounds of the extreme proportions are exact, without rounding errors
+    lower = 0.0 if successes == 0 else max(center - half_width, 0.0)
+    upper = 1.0 if successes == trials else min(center + half_width, 1.0)
+    return lower, upper
+
+
+class SimulationResult:
+    """The outcome of every simulated episode."""
+
+    def __init__(
+        self,
+        completed: np.ndarray,
+        steps: np.ndarray,
+        total_rewards: np.ndarray,
+        discounted_returns: np.ndarray,
+        gamma: float,
+        total_costs: Optional[np.ndarray] = None,
+    ):
+        """
+        Initialize the result.
+
+        :param completed: whether every episode reached a goal state.
+        :param steps: the number of steps of every episode.
+        :param total_rewards: the (undiscounted) sum of the rewards of every episode.
+        :param discounted_returns: the discounted return of every episode.
+        :param gamma: the discount factor of the discounted returns.
+        :param total_costs: the (undiscounted) sum of the costs of every
+          episode (default: minus the sum of the rewards).
+        """
+        self.completed = completed
+        self.steps = steps
+        self.total_rewards = total_rewards
+        self.discounted_returns = discounted_returns
+        self.gamma = gamma
+        self.total_costs = -total_rewards if total_costs is None else total_costs
+
+    @property
+    def nb_episodes(self) -> int:
+        """Get the number of episodes."""
+        return len(self.completed)
+
+    @property
+    def completion_probability(self) -> float:
+        """Get the fraction of episodes that reached a goal state."""
+        return float(np.mean(self.completed)) if self.nb_episodes > 0 else 0.0
+
+    @property
+    def costs(self) -> np.ndarray:
+        """
+        Get the cost of the completed episodes.
+
+        Unless costs were given to Simulator.run, this is minus the sum of the
+        rewards, which in a comp_mdp composition includes the goal rewards.
+        """
+        return self.total_costs[self.completed]
+
+    @property
+    def makespans(self) -> np.ndarray:
+        """Get the number of steps of the completed episodes."""
+        return self.steps[self.completed]
+
+    def summary(self, level: float = 0.95) -> Dict[str, object]:
+        """
+        Get the main statistics, with confidence intervals.
+
+        :param level: the confidence level (0.9, 0.95 or 0.99).
+        :return: the statistics; the cost and makespan statistics are over the
+          completed episodes.
+        """
+        costs, makespans = self.costs, self.makespans
+        percentiles = [5, 50, 95]
+        return {
+            "episodes": self.nb_episodes,
+            "completion_probability": self.completion_probability,
+            "completion_probability_ci": proportion_confidence_interval(
+                int(np.sum(self.completed)), self.nb_episodes, level
+            ),
+            "discounted_return": float(np.mean(self.discounted_returns)),
+            "discounted_return_ci": mean_confidence_interval(self.discounted_returns, level),
+            "cost": float(np.mean(costs)) if len(costs) > 0 else math.nan,
+            "cost_ci": mean_confidence_interval(costs, level),
+            "cost_percentiles": dict(
+                zip(percentiles, np.percentile(costs, percentiles).tolist())
+            )
+            if len(costs) > 0
+            else {},
+            "makespan": float(np.mean(makespans)) if len(makespans) > 0 else math.nan,
+            "makespan_ci": mean_confidence_interval(makespans, level),
+            "makespan_percentiles": dict(
+                zip(percentiles, np.percentile(makespans, percentiles).tolist())
+            )
+            if len(makespans) > 0
+            else {},
+        }
+
+
+class Simulator:
+    """A vectorized simulator of the episodes of an array-backed MDP."""
+
+    def __init__(
+        self,
+        mdp: ArrayMDP,
+        goal_states: Optional[Iterable[State]] = None,
+        accepting: Optional[Iterable[State]] = None,
+    ):
+        """
+        Precompute the sampling tables of an MDP.
+
+        Exactly one of goal_states and accepting must be given.
+
+        :param mdp: the MDP.
+        :param goal_states: the states where an episode is completed.
+        :param accepting: the accepting states of the DFA of a comp_mdp
+          composition: the goal states are then the accepting_states of the
+          composition.
+        """
+        assert (goal_states is None) != (
+            accepting is None
+        ), "exactly one of goal_states and accepting must be given"
+        if accepting is not None:
+            goal_states = accepting_states(mdp, accepting)
+        assert goal_states is not None
+        self.mdp = mdp
+        self.goal = np.zeros(mdp.nb_states, dtype=bool)
+        self.goal[[mdp.state_index[state] for state in goal_states]] = True
+        # whether a state-action pair is a step of the services (not 'undefined')
+        undefined = [
+            a
+            for a, action in enumerate(mdp.actions)
+            if action == COMPOSITION_MDP_UNDEFINED_ACTION
+        ]
+        self.counted = ~np.isin(mdp.sa_actions, undefined)
+
+        # padded tables, one row per state-action pair: the next states and the
+        # cumulative probabilities (padded with 2.0, and ending with exactly 1.0,
+        # so that a padding column is never sampled)
+        counts = np.diff(mdp.transition_ptr)
+        width = max(int(counts.max(initial=0)), 1)
+        positions = np.arange(mdp.nb_transitions) - mdp.transition_ptr[mdp.transition_sas]
+        self.next_state_table = np.zeros((mdp.nb_state_actions, width), dtype=np.int64)
+        self.next_state_table[mdp.transition_sas, positions] = mdp.next_states
+        cumulative = np.concatenate([[0.0], np.cumsum(mdp.probs)])
+        self.cumulative_table = np.full((mdp.nb_state_actions, width), 2.0)
+        self.cumulative_table[mdp.transition_sas, positions] = (
+            cumulative[1:] - cumulative[mdp.transition_ptr[mdp.transition_sas]]
+        )
+        has_transitions = np.flatnonzero(counts > 0)
+        self.cumulative_table[has_transitions, counts[has_transitions] - 1] = 1.0
+
+    def run(
+        self,
+        policy: np.ndarray,
+        nb_episodes: int = 10000,
+        horizon: int = 1000,
+        initial_state: Optional[State] = None,
+        gamma: Optional[float] = None,
+        seed: Optional[int] = None,
+        costs: Optional[np.ndarray] = None,
+    ) -> SimulationResult:
+        """
+        Simulate episodes of a policy.
+
+        :param policy: the chosen state-action pair of every state, e.g.
+          SolverResult.policy.
+        :param nb_episodes: the number of episodes.
+        :param horizon: the maximum number of steps of an episode.
+        :param initial_state: the initial state (default: the one of the MDP).
+        :param gamma: the discount factor of the returns (default: the one of the MDP).
+        :param seed: the seed of the random generator.
+        :param costs: the cost of every state-action pair (default: minus the
+          reward), as in analyse_policy; e.g. the service costs alone of a
+          ParametricMDP p are p.sa_reward_offset - p.mdp.sa_rewards.
+        :return: the outcome of every episode.
+        """
+        mdp = self.mdp
+        initial_state = mdp.initial_state if initial_state is None else initial_state
+        assert initial_state is not None, "the MDP has no initial state, one must be given"
+        gamma = mdp.gamma if gamma is None else gamma
+        policy = np.asarray(policy, dtype=np.int64)
+        costs = -mdp.sa_rewards if costs is None else np.asarray(costs, dtype=np.float64)
+        rng = np.random.default_rng(seed)
+
+        states = np.full(nb_episodes, mdp.state_index[initial_state], dtype=np.int64)
+        total_rewards = np.zeros(nb_episodes)
+        total_costs = np.zeros(nb_episodes)
+        discounted_returns = np.zeros(nb_episodes)
+        steps = np.zeros(nb_episodes, dtype=np.int64)
+        # the episodes still running, by index
+        running = np.flatnonzero(~self.goal[states] & (policy[states] != NO_ACTION))
+        discount = 1.0
+        for _ in range(horizon):
+            if len(running) == 0:
+                break
+            current = states[running]
+            sas = policy[current]
+            rewards = mdp.sa_rewards[sas]
+            counted = self.counted[sas]
+            total_rewards[running] += rewards
+            total_costs[running] += np.where(counted, costs[sas], 0.0)
+            discounted_returns[running] += discount * rewards
+            steps[running] += counted
+            u = rng.random(len(running))
+            columns = (u[:, None] >= self.cumulative_table[sas]).sum(axis=1)
+            next_states = self.next_state_table[sas, columns]
+            states[running] = next_states
+            discount *= gamma
+            running = running[~self.goal[next_states] & (policy[next_states] != NO_ACTION)]
+        completed = self.goal[states]
+        return SimulationResult(
+            completed, steps, total_rewards, discounted_returns, gamma, total_costs
+        )
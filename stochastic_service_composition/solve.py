@@ -0,0 +1,53 @@
+"""This module provides a single entry point to the solvers of array-backed MDPs."""
+from typing import Callable, Dict, Iterable, Optional
+
+from mdp_dp_rl.processes.mdp import MDP
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.asynchronous_solvers import (
+    gauss_seidel_value_iteration,
+    prioritized_sweeping,
+)
+from stochastic_service_composition.backward_induction import backward_induction
+from stochastic_service_composition.interval_iteration import interval_value_iteration
+from stochastic_service_composition.parallel_solver import parallel_value_iteration
+from stochastic_service_composition.solvers import SolverResult, value_iteration
+from stochastic_service_composition.types import State
+
+SOLVERS: Dict[str, Callable[..., SolverResult]] = {
+    "value_iteration": value_iteration,
+    "parallel": parallel_value_iteration,
+    "interval": interval_value_iteration,
+    "gauss_seidel": gauss_seidel_value_iteration,
+    "prioritized_sweeping": prioritized_sweeping,
+    "backward_induction": backward_induction,
+}
+
+
+def solve(
+    mdp,
+    method: str = "value_iteration",
+    accepting: Optional[Iterable[State]] = None,
+    **kwargs,
+) -> SolverResult:
+    """
+    Solve an MDP with one of the available solvers.
+
+    Every solver returns a SolverResult, whose iterations and backups
+    attributes allow to compare the methods.
+
+    :param mdp: the MDP, either an ArrayMDP or an mdp_dp_rl MDP.
+    :param method: the name of the solver, one of SOLVERS.
+    :param accepting: the accepting states of the target DFA, if known; they
+      are the roots of the state ordering of gauss_seidel (see
+      gauss_seidel_value_iteration), and are ignored by the other methods.
+    :param kwargs: the arguments of the solver; all the solvers take gamma
+      and tol (the stopping tolerance).
+    :return: the solver result.
+    """
+    assert method in SOLVERS, f"unknown method {method}, expected one of {sorted(SOLVERS)}"
+    if isinstance(mdp, MDP):
+        mdp = ArrayMDP.from_mdp(mdp)
+    if method == "gauss_seidel" and accepting is not None:
+        kwargs["accepting"] = accepting
+    return SOLVERS[method](mdp, **kwargs)
@@ -0,0 +1,411 @@
+"""This module implements vectorized solvers for array-backed MDPs."""
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from mdp_dp_rl.processes.det_policy import DetPolicy
+
+from stochastic_service_composition.array_mdp import NO_ACTION, ArrayMDP, segment_max
+from stochastic_service_composition.checkpoint import Checkpoint, content_digest
+from stochastic_service_composition.progress import ProgressMonitor
+from stochastic_service_composition.types import Action, State
+
+# same tolerance used with DPAnalytic in the case studies
+DEFAULT_TOLERANCE = 1e-4
+
+# a value function, as a dictionary or as a vector indexed like ArrayMDP.states
+InitialValues = Union[Mapping[State, float], np.ndarray]
+
+
+class SolverResult:
+    """The output of a solver."""
+
+    def __init__(
+        self,
+        mdp: ArrayMDP,
+        values: np.ndarray,
+        policy: np.ndarray,
+        iterations: int,
+        backups: int,
+        residual: float,
+        gamma: float,
+    ):
+        """
+        Initialize the result.
+
+        :param mdp: the solved MDP.
+        :param values: the value of every state.
+        :param policy: the chosen state-action pair of every state.
+        :param iterations: the number of sweeps performed.
+        :param backups: the number of state backups performed.
+        :param residual: the maximum difference between the last two value functions.
+        :param gamma: the discount factor.
+        """
+        self.mdp = mdp
+        self.values = values
+        self.policy = policy
+        self.iterations = iterations
+        self.backups = backups
+        self.residual = residual
+        self.gamma = gamma
+
+    @property
+    def error_bound(self) -> float:
+        """
+        Get a bound on the distance between the values and the optimal values.
+
+        If V' = B(V) then ||V' - V*|| <= gamma / (1 - gamma) * ||V' - V||,
+        whatever the initial value function was.
+        """
+        if self.gamma >= 1.0:
+            return np.inf if self.residual > 0.0 else 0.0
+        return self.gamma / (1.0 - self.gamma) * self.residual
+
+    def value_function(self) -> Dict[State, float]:
+        """Get the value function as a dictionary."""
+        return self.mdp.value_function(self.values)
+
+    def det_policy(self) -> DetPolicy:
+        """Get the policy as a DetPolicy object."""
+        return self.mdp.det_policy(self.policy)
+
+
+def bellman_backup(
+    mdp: ArrayMDP, values: np.ndarray, gamma: float
+) -> np.ndarray:
+    """
+    Apply the Bellman optimality operator to a value function.
+
+    States without actions get value 0.
+
+    :param mdp: the MDP.
+    :param values: the value of every state.
+    :param gamma: the discount factor.
+    :return: the new value of every state.
+    """
+    return segment_max(mdp.q_values(values, gamma), mdp.state_action_ptr, empty=0.0)
+
+
+def policy_backup(
+    mdp: ArrayMDP, values: np.ndarray, policy: np.ndarray, gamma: float
+) -> np.ndarray:
+    """
+    Apply the Bellman operator of a policy to a value function.
+
+    States where the policy has no action get the optimality backup.
+
+    :param mdp: the MDP.
+    :param values: the value of every state.
+    :param policy: the chosen state-action pair of every state (or NO_ACTION).
+    :param gamma: the discount factor.
+    :return: the new value of every state.
+    """
+    q_values = mdp.q_values(values, gamma)
+    optimal = segment_max(q_values, mdp.state_action_ptr, empty=0.0)
+    has_action = policy != NO_ACTION
+    return np.where(has_action, q_values[np.where(has_action, policy, 0)], optimal)
+
+
+def initial_value_vector(
+    mdp: ArrayMDP,
+    gamma: float,
+    tol: float = DEFAULT_TOLERANCE,
+    initial_values: Optional[InitialValues] = None,
+    initial_policy: Optional[Mapping[State, Action]] = None,
+    max_iterations: Optional[int] = None,
+) -> Tuple[np.ndarray, int]:
+    """
+    Compute the starting point of value iteration.
+
+    The initial values default to 0 (also for the states missing from a
+    dictionary). If an initial policy is given, it is evaluated starting from
+    the initial values, and its value function is the starting point.
+
+    :param mdp: the MDP.
+    :param gamma: the discount factor.
+    :param tol: the tolerance of the policy evaluation.
+    :param initial_values: the initial value function, if any.
+    :param initial_policy: the initial policy, if any.
+    :param max_iterations: the maximum number of policy evaluation sweeps, if any.
+    :return: the initial value of every state, and the number of sweeps performed.
+    """
+    if initial_values is None:
+        values = np.zeros(mdp.nb_states)
+    elif isinstance(initial_values, np.ndarray):
+        assert initial_values.shape == (mdp.nb_states,), "one value per state expected"
+        values = initial_values.astype(np.float64, copy=True)
+    else:
+        values = mdp.value_vector(initial_values)
+
+    sweeps = 0
+    if initial_policy is not None:
+        policy = mdp.policy_vector(initial_policy)
+        while max_iterations is None or sweeps < max_iterations:
+            new_values = policy_backup(mdp, values, policy, gamma)
+            sweeps += 1
+            residual = np.max(np.abs(new_values - values), initial=0.0)
+            values = new_values
+            if residual < tol:
+                break
+    return values, sweeps
+
+
+def value_iteration(
+    mdp: ArrayMDP,
+    gamma: Optional[float] = None,
+    tol: float = DEFAULT_TOLERANCE,
+    max_iterations: Optional[int] = None,
+    initial_values: Optional[InitialValues] = None,
+    initial_policy: Optional[Mapping[State, Action]] = None,
+    checkpoint: Optional[Checkpoint] = None,
+    monitor: Optional[ProgressMonitor] = None,
+) -> SolverResult:
+    """
+    Run (Jacobi) value iteration with vectorized backups.
+
+    Iteration stops when the maximum difference between two successive value
+    functions is below the tolerance, as in DPAnalytic.get_optimal_policy_vi.
+    The stopping test does not depend on the starting point (see
+    SolverResult.error_bound), so the iteration can be warm-started from the
+    solution of a similar MDP, e.g. after a parameter update or for a
+    different discount factor.
+
+    :param mdp: the MDP.
+    :param gamma: the discount factor (default: the one of the MDP).
+    :param tol: the tolerance on successive differences.
+    :param max_iterations: the maximum number of sweeps, including the
+      evaluation sweeps of the initial policy, if any.
+    :param initial_values: the initial value function, if any.
+    :param initial_policy: a policy to evaluate to get the initial value function, if any.
+    :param checkpoint: if given, the values and the number of sweeps are saved
+      to it periodically and on completion, and the iteration resumes from
+      its latest snapshot (instead of the initial values); the snapshot is
+      tied to the content of the MDP, gamma and tol.
+    :param monitor: if given, the progress is reported to it after every
+      sweep, and the iteration stops when it is cancelled (the result is then
+      not converged, see SolverResult.residual).
+    :return: the values and the greedy policy.
+    """
+    gamma = mdp.gamma if gamma is None else gamma
+    signature = None
+    saved = None
+    if checkpoint is not None:
+        signature = (
+            content_digest(
+                mdp.state_action_ptr,
+                mdp.sa_rewards,
+                mdp.transition_ptr,
+                mdp.next_states,
+                mdp.probs,
+            ),
+            gamma,
+            tol,
+        )
+        saved = checkpoint.load("value_iteration", signature)
+    if saved is None:
+        values, iterations = initial_value_vector(
+            mdp, gamma, tol, initial_values, initial_policy, max_iterations
+        )
+        residual = np.inf
+        sweeps = 0
+    else:
+        values, iterations = saved["values"], saved["iterations"]
+        residual, sweeps = saved["residual"], saved["sweeps"]
+
+    def snapshot() -> Dict:
+        return {"values": values, "iterations": iterations, "residual": residual, "sweeps": sweeps}
+
+    # the policy evaluation sweeps count towards max_iterations
+    while (max_iterations is None or iterations + sweeps < max_iterations) and residual >= tol:
+        if checkpoint is not None and checkpoint.due():
+            checkpoint.save("value_iteration", signature, snapshot())
+        if monitor is not None and not monitor.update(
+            "value_iteration",
+            sweeps * mdp.nb_states,
+            iterations=iterations + sweeps,
+            residual=residual,
+        ):
+            break
+        new_values = bellman_backup(mdp, values, gamma)
+        sweeps += 1
+        residual = float(np.max(np.abs(new_values - values), initial=0.0))
+        values = new_values
+    if checkpoint is not None:
+        checkpoint.save("value_iteration", signature, snapshot())
+    iterations += sweeps
+    if monitor is not None:
+        monitor.update(
+            "value_iteration",
+            sweeps * mdp.nb_states,
+            iterations=iterations,
+            residual=residual,
+            final=True,
+        )
+    policy = mdp.greedy(mdp.q_values(values, gamma))
+    return SolverResult(
+        mdp, values, policy, iterations, iterations * mdp.nb_states, residual, gamma
+    )
+
+
+def _padded_columns(ptr: np.ndarray) -> List[np.ndarray]:
+    """
+    Split the segments ptr[i]:ptr[i + 1] in padded columns (ELLPACK layout).
+
+    Column j holds the index of the j-th element of every segment, or the
+    padding index ptr[-1] if the segment is shorter.
+
+    :param ptr: the segment offsets.
+    :return: one index array per column, of length len(ptr) - 1.
+    """
+    counts = np.diff(ptr)
+    segments = np.repeat(np.arange(len(counts)), counts)
+    positions = np.arange(ptr[-1]) - ptr[:-1][segments]
+    columns = []
+    for j in range(int(counts.max(initial=0))):
+        column = np.full(len(counts), ptr[-1], dtype=np.int64)
+        selected = positions == j
+        column[segments[selected]] = np.flatnonzero(selected)
+        columns.append(column)
+    return columns
+
+
+class _ScenarioBackup:
+    """The Bellman operator of K scenarios, in ELLPACK layout, on a states-by-K value matrix."""
+
+    def __init__(
+        self, mdp: ArrayMDP, gammas: np.ndarray, sa_rewards: np.ndarray, probs: np.ndarray
+    ):
+        # padded transitions have probability 0 (towards state 0)
+        transition_columns = _padded_columns(mdp.transition_ptr)
+        padded_next_states = np.append(mdp.next_states, 0)
+        padded_probs = np.vstack([probs, np.zeros((1, probs.shape[1]))])
+        self.next_state_columns = [padded_next_states[c] for c in transition_columns]
+        self.prob_columns = [padded_probs[c] for c in transition_columns]
+        # padded actions repeat the first action of the state, which does not
+        # change the maximum; states without actions point to a row of zeros
+        self.action_columns = _padded_columns(mdp.state_action_ptr)
+        for column in self.action_columns[1:]:
+            padding = column == mdp.nb_state_actions
+            column[padding] = self.action_columns[0][padding]
+        self.gammas = gammas
+        self.sa_rewards = sa_rewards
+
+    def select(self, scenarios: np.ndarray) -> None:
+        """Keep only some scenarios (columns)."""
+        self.prob_columns = [p[:, scenarios] for p in self.prob_columns]
+        self.gammas = self.gammas[scenarios]
+        self.sa_rewards = self.sa_rewards[:, scenarios]
+
+    def q_values(self, values: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Compute the Q-values, of shape (nb_state_actions, K)."""
+        expected = self.prob_columns[0] * values[self.next_state_columns[0]]
+        for probs, next_states in zip(self.prob_columns[1:], self.next_state_columns[1:]):
+            expected += probs * values[next_states]
+        expected *= self.gammas
+        return np.add(self.sa_rewards, expected, out=out)
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        """Apply the Bellman optimality operator; states without actions get value 0."""
+        nb_state_actions = len(self.sa_rewards)
+        padded = np.zeros((nb_state_actions + 1, values.shape[1]))
+        self.q_values(values, out=padded[:nb_state_actions])
+        if not self.action_columns:
+            return np.zeros_like(values)
+        new_values = padded[self.action_columns[0]]
+        for column in self.action_columns[1:]:
+            np.maximum(new_values, padded[column], out=new_values)
+        return new_values
+
+
+def _scenario_matrix(
+    array: Optional[np.ndarray], default: np.ndarray, nb_scenarios: int
+) -> np.ndarray:
+    """Get a per-scenario parameter as a matrix with one column per scenario."""
+    if array is None:
+        return np.repeat(default[:, None], nb_scenarios, axis=1)
+    array = np.asarray(array, dtype=np.float64)
+    assert array.shape == (len(default), nb_scenarios), (
+        f"expected shape {(len(default), nb_scenarios)}, got {array.shape}"
+    )
+    return array
+
+
+def batched_value_iteration(
+    mdp: ArrayMDP,
+    gammas: Optional[Sequence[float]] = None,
+    sa_rewards: Optional[np.ndarray] = None,
+    probs: Optional[np.ndarray] = None,
+    tol: float = DEFAULT_TOLERANCE,
+    max_iterations: Optional[int] = None,
+) -> List[SolverResult]:
+    """
+    Run value iteration on K scenarios at once, on a states-by-K value matrix.
+
+    The scenarios share the states, actions and transition structure of the
+    MDP, and can differ in the discount factor, in the rewards and in the
+    transition probabilities. Parameters that are not given are the ones of
+    the MDP. Every scenario stops as soon as its own residual is below the
+    tolerance, and the sums are performed in the same order as in
+    value_iteration, so the results are the same as with K separate runs.
+
+    :param mdp: the MDP.
+    :param gammas: the discount factor of every scenario.
+    :param sa_rewards: the rewards of every scenario, of shape (nb_state_actions, K).
+    :param probs: the transition probabilities of every scenario, of shape (nb_transitions, K).
+    :param tol: the tolerance on successive differences.
+    :param max_iterations: the maximum number of sweeps, if any.
+    :return: the result of every scenario.
+    """
+    candidates = [
+        len(gammas) if gammas is not None else None,
+        np.shape(sa_rewards)[1] if sa_rewards is not None else None,
+        np.shape(probs)[1] if probs is not None else None,
+    ]
+    sizes = {size for size in candidates if size is not None}
+    assert len(sizes) <= 1, f"inconsistent number of scenarios: {sizes}"
+    nb_scenarios = sizes.pop() if sizes else 1
+    gamma_vector = (
+        np.full(nb_scenarios, mdp.gamma)
+        if gammas is None
+        else np.asarray(gammas, dtype=np.float64)
+    )
+    sa_rewards = _scenario_matrix(sa_rewards, mdp.sa_rewards, nb_scenarios)
+    probs = _scenario_matrix(probs, mdp.probs, nb_scenarios)
+    backup = _ScenarioBackup(mdp, gamma_vector, sa_rewards, probs)
+
+    values = np.zeros((mdp.nb_states, nb_scenarios))
+    iterations = np.zeros(nb_scenarios, dtype=np.int64)
+    residuals = np.full(nb_scenarios, np.inf)
+    active = np.arange(nb_scenarios)
+    active_values = values
+    while len(active) > 0:
+        if max_iterations is not None and iterations[active[0]] >= max_iterations:
+            break
+        new_values = backup(active_values)
+        residuals[active] = np.max(
+            np.abs(new_values - active_values), axis=0, initial=0.0
+        )
+        active_values = new_values
+        iterations[active] += 1
+        converged = residuals[active] < tol
+        if converged.any():
+            # converged scenarios are frozen, and dropped from the backups
+            values[:, active] = active_values
+            active = active[~converged]
+            active_values = active_values[:, ~converged]
+            backup.select(np.flatnonzero(~converged))
+    values[:, active] = active_values
+
+    final = _ScenarioBackup(mdp, gamma_vector, sa_rewards, probs)
+    policies = mdp.greedy(final.q_values(values))
+    return [
+        SolverResult(
+            mdp,
+            values[:, k].copy(),
+            policies[:, k].copy(),
+            int(iterations[k]),
+            int(iterations[k]) * mdp.nb_states,
+            float(residuals[k]),
+            float(gamma_vector[k]),
+        )
+        for k in range(nb_scenarios)
+    ]
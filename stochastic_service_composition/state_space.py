@@ -0,0 +1,554 @@
+"""
+This module implements the estimation of the size of the composition of comp_mdp,
+and the admission control of compositions against a budget.
+
+From the services and the target DFA alone, the estimator computes:
+
+- the number of states and transitions of the system service, exactly: the
+  services are interleaved, so the system states are the combinations of the
+  reachable local states;
+- an upper bound on the number of composition states: every service is
+  composed with the DFA alone, the other services being abstracted into the
+  DFA moves they could trigger from any of their states; the reachable pairs
+  (s_i, q) over-approximate the projections of the composition states, hence
+  the sum over q of the products of the projections bounds their number;
+- a sampled estimate of the number of composition states, state-action
+  pairs and transitions: a partial BFS (exact when it completes) and random
+  walks (to reach the deep states) collect composition states. The walks are
+  run in two independent batches, and the capture-recapture (Chapman)
+  estimate of the states they reach tells whether they are saturated: if it
+  expects less than one unseen state, the estimate is the observed count.
+  Otherwise it is the same sum of products, on the observed projections
+  (which overestimates the number of states when services are correlated
+  through the DFA). The sizes of the transitions are extrapolated from the
+  mean out-degree of the observed states;
+- the peak memory needed by every composition strategy, from costs measured
+  on the case studies.
+
+The admission control picks the first strategy whose estimate fits a budget:
+the explicit MDP (built by comp_mdp, which also builds the system service, or
+by comp_mdp_batched), the matrix-free value iteration of kronecker (whose value
+tensor covers all the combinations of local states), or the lazy composition
+of rtdp (for online planning, whose memory grows with the expanded states
+only). If none fits, the composition is refused.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.batched_composition import (
+    INITIAL_LOCAL_STATES,
+    CompositionTables,
+    _is_in_sorted,
+    comp_mdp_batched,
+)
+from stochastic_service_composition.composition_mdp import (
+    COMPOSITION_MDP_SINK_STATE,
+    DEFAULT_GAMMA,
+    comp_mdp,
+)
+from stochastic_service_composition.kronecker import kronecker_value_iteration
+from stochastic_service_composition.rtdp import LazyCompositionMDP
+from stochastic_service_composition.services import Service, reachable_states
+
+# peak memory costs, measured on the case studies (64-bit CPython): the
+# mdp_dp_rl MDP built by comp_mdp_batched, per transition; comp_mdp also
+# builds the system service, and prints the whole transition function
+EXPLICIT_BYTES_PER_TRANSITION = 1000
+COMP_MDP_BYTES_PER_TRANSITION = 9000
+SYSTEM_BYTES_PER_TRANSITION = 500
+# the value tensor of kronecker, with the temporaries of the backup
+TENSOR_BYTES_PER_STATE = 200
+
+COMP_MDP = "comp_mdp"
+EXPLICIT = "explicit"
+KRONECKER = "kronecker"
+LAZY = "lazy"
+STRATEGIES = (COMP_MDP, EXPLICIT, KRONECKER, LAZY)
+DEFAULT_STRATEGIES = (EXPLICIT, KRONECKER, LAZY)
+
+DEFAULT_SAMPLE_LIMIT = 100000
+DEFAULT_NB_WALKS = 1000
+DEFAULT_WALK_LENGTH = 200
+
+
+class StateSpaceEstimate:
+    """The (bounded and estimated) size of a composition, and the memory it needs."""
+
+    def __init__(
+        self,
+        nb_system_states: int,
+        nb_system_transitions: int,
+        nb_composition_states_bound: int,
+        nb_tensor_states: int,
+        nb_composition_states: float,
+        nb_state_actions: float,
+        nb_transitions: float,
+        nb_sampled_states: int,
+        exact: bool,
+    ):
+        """
+        Initialize the estimate.
+
+        :param nb_system_states: the number of states of the system service.
+        :param nb_system_transitions: the number of transitions of the system service.
+        :param nb_composition_states_bound: an upper bound on the number of composition states.
+        :param nb_tensor_states: the number of combinations of local states and DFA states.
+        :param nb_composition_states: the estimated number of composition states.
+        :param nb_state_actions: the estimated number of state-action pairs.
+        :param nb_transitions: the estimated number of transitions.
+        :param nb_sampled_states: the number of composition states observed.
+        :param exact: whether the whole composition has been explored (then
+          the estimates are exact).
+        """
+        self.nb_system_states = nb_system_states
+        self.nb_system_transitions = nb_system_transitions
+        self.nb_composition_states_bound = nb_composition_states_bound
+        self.nb_tensor_states = nb_tensor_states
+        self.nb_composition_states = nb_composition_states
+        self.nb_state_actions = nb_state_actions
+        self.nb_transitions = nb_transitions
+        self.nb_sampled_states = nb_sampled_states
+        self.exact = exact
+
+    @property
+    def transitions_per_state(self) -> float:
+        """Get the estimated mean number of transitions of a composition state."""
+        if self.nb_composition_states == 0:
+            return 0.0
+        return self.nb_transitions / self.nb_composition_states
+
+    def explicit_bytes(self, use_bound: bool = False) -> float:
+        """
+        Estimate the peak memory needed to build the explicit MDP with comp_mdp_batched.
+
+        :param use_bound: use the upper bound on the number of states,
+          instead of the estimate.
+        :return: the size in bytes.
+        """
+        return self.transitions(use_bound) * EXPLICIT_BYTES_PER_TRANSITION
+
+    def comp_mdp_bytes(self, use_bound: bool = False) -> float:
+        """
+        Estimate the peak memory needed to build the explicit MDP with comp_mdp.
+
+        :param use_bound: see explicit_bytes.
+        :return: the size in bytes.
+        """
+        return (
+            self.transitions(use_bound) * COMP_MDP_BYTES_PER_TRANSITION
+            + self.nb_system_transitions * SYSTEM_BYTES_PER_TRANSITION
+        )
+
+    def tensor_bytes(self) -> float:
+        """Estimate the memory needed by the matrix-free value iteration of kronecker."""
+        return self.nb_tensor_states * TENSOR_BYTES_PER_STATE
+
+    def states(self, use_bound: bool = False) -> float:
+        """Get the estimated number of composition states (or its upper bound)."""
+        return self.nb_composition_states_bound if use_bound else self.nb_composition_states
+
+    def transitions(self, use_bound: bool = False) -> float:
+        """Get the estimated number of transitions (or the one of the upper bound on the states)."""
+        return self.states(use_bound) * self.transitions_per_state
+
+    def summary(self) -> Dict[str, object]:
+        """Get the figures of the estimate (memory in MB)."""
+        return {
+            "system_states": self.nb_system_states,
+            "system_transitions": self.nb_system_transitions,
+            "composition_states_bound": self.nb_composition_states_bound,
+            "composition_states": self.nb_composition_states,
+            "state_actions": self.nb_state_actions,
+            "transitions": self.nb_transitions,
+            "tensor_states": self.nb_tensor_states,
+            "sampled_states": self.nb_sampled_states,
+            "exact": self.exact,
+            "comp_mdp_mb": self.comp_mdp_bytes() / 2 ** 20,
+            "explicit_mb": self.explicit_bytes() / 2 ** 20,
+            "explicit_bound_mb": self.explicit_bytes(use_bound=True) / 2 ** 20,
+            "tensor_mb": self.tensor_bytes() / 2 ** 20,
+        }
+
+
+def _reachable_local_transitions(service: Service) -> Tuple[int, int]:
+    """Get the number of reachable states and of their transitions (one per next state)."""
+    states = reachable_states(service)
+    nb_transitions = sum(
+        len(next_states)
+        for state in states
+        for next_states, _reward in service.transition_function.get(state, {}).values()
+    )
+    return len(states), nb_transitions
+
+
+def _initial_local_states(tables: CompositionTables, services: Sequence[Service]) -> List[np.ndarray]:
+    """Get the local states of every service in the initial states of comp_mdp, as indices."""
+    result = []
+    for service_id, service in enumerate(services):
+        state_index = tables.encoder.service_state_index[service_id]
+        initial = {
+            s for s in reachable_states(service) if s in INITIAL_LOCAL_STATES
+        } | {service.initial_state}
+        result.append(np.array(sorted(state_index[s] for s in initial), dtype=np.int64))
+    return result
+
+
+def projection_bounds(
+    tables: CompositionTables, dfa: SimpleDFA, services: Sequence[Service]
+) -> List[np.ndarray]:
+    """
+    Over-approximate the projections (s_i, q) of the composition states.
+
+    :param tables: the tables of the composition.
+    :param dfa: the (trimmed) target DFA.
+    :param services: the community of services.
+    :return: for every service, a boolean array of shape (|S_i|, |Q|),
+      true for the pairs that may be reachable.
+    """
+    encoder = tables.encoder
+    nb_dfa_states = encoder.nb_dfa_states
+    initial_dfa_state = encoder.dfa_state_index[dfa.initial_state]
+    # the DFA moves that every service can trigger, from any of its local states
+    moves = [np.zeros((nb_dfa_states, nb_dfa_states), dtype=bool) for _ in services]
+    for local in tables.local_transitions:
+        i = local.service_id
+        next_dfa = tables.next_dfa[:, local.symbol]
+        sources = np.flatnonzero(tables.allowed[:, i] & (next_dfa >= 0))
+        moves[i][sources, next_dfa[sources]] = True
+
+    result = []
+    for i, initial_states in enumerate(_initial_local_states(tables, services)):
+        other_moves = np.zeros((nb_dfa_states, nb_dfa_states), dtype=bool)
+        for j in range(len(services)):
+            if j != i:
+                other_moves |= moves[j]
+        local_transitions = [local for local in tables.local_transitions if local.service_id == i]
+        reached = np.zeros((encoder.radices[i], nb_dfa_states), dtype=bool)
+        reached[initial_states, initial_dfa_state] = True
+        changed = True
+        while changed:
+            new_reached = reached | (reached.astype(np.int64) @ other_moves > 0)
+            for local in local_transitions:
+                next_dfa = tables.next_dfa[:, local.symbol]
+                sources = np.flatnonzero(
+                    reached[local.state] & tables.allowed[:, i] & (next_dfa >= 0)
+                )
+                new_reached[np.ix_(local.next_states, next_dfa[sources])] = True
+            changed = bool((new_reached != reached).any())
+            reached = new_reached
+        result.append(reached)
+    return result
+
+
+def _product_size(projections: List[np.ndarray]) -> int:
+    """Get the sum over the DFA states of the products of the sizes of the projections."""
+    counts = [projection.sum(axis=0).tolist() for projection in projections]
+    return sum(
+        math.prod(count[q] for count in counts) for q in range(projections[0].shape[1])
+    )
+
+
+def _observed_projections(tables: CompositionTables, codes: np.ndarray) -> List[np.ndarray]:
+    """Get the projections (s_i, q) of a set of composition states."""
+    encoder = tables.encoder
+    dfa_digits = encoder.dfa_digits(codes)
+    result = []
+    for i in range(encoder.nb_services):
+        projection = np.zeros((encoder.radices[i], encoder.nb_dfa_states), dtype=bool)
+        projection[encoder.service_digits(codes, i), dfa_digits] = True
+        result.append(projection)
+    return result
+
+
+def _random_walks(
+    tables: CompositionTables,
+    initial_codes: np.ndarray,
+    nb_walks: int,
+    walk_length: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """Get the composition states visited by random walks (restarted at the sink)."""
+    walkers = rng.choice(initial_codes, nb_walks)
+    visited = [walkers]
+    for _ in range(walk_length):
+        sources, _action_ids, destinations, _probs, _rewards = tables.expand(
+            np.unique(walkers)
+        )
+        order = np.argsort(sources, kind="stable")
+        sources, destinations = sources[order], destinations[order]
+        start = np.searchsorted(sources, walkers, side="left")
+        count = np.searchsorted(sources, walkers, side="right") - start
+        chosen = start + np.floor(rng.random(nb_walks) * count).astype(np.int64)
+        walkers = np.where(count > 0, destinations[np.minimum(chosen, len(sources) - 1)], -1)
+        restart = walkers == COMPOSITION_MDP_SINK_STATE
+        walkers[restart] = rng.choice(initial_codes, int(restart.sum()))
+        visited.append(walkers)
+    return np.unique(np.concatenate(visited))
+
+
+def _chapman_estimate(first_sample: np.ndarray, second_sample: np.ndarray) -> float:
+    """
+    Estimate the size of a population from two independent samples (capture-recapture).
+
+    :param first_sample: the (unique) individuals of the first sample.
+    :param second_sample: the (unique) individuals of the second sample.
+    :return: the Chapman estimate of the size of the population.
+    """
+    recaptured = len(np.intersect1d(first_sample, second_sample, assume_unique=True))
+    return (len(first_sample) + 1) * (len(second_sample) + 1) / (recaptured + 1) - 1
+
+
+def estimate_state_space(
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    sample_limit: int = DEFAULT_SAMPLE_LIMIT,
+    nb_walks: int = DEFAULT_NB_WALKS,
+    walk_length: int = DEFAULT_WALK_LENGTH,
+    seed: Optional[int] = None,
+) -> StateSpaceEstimate:
+    """
+    Estimate the size of the composition of comp_mdp, without building it.
+
+    :param dfa: the target DFA.
+    :param services: the community of services.
+    :param sample_limit: the number of states after which the BFS stops.
+    :param nb_walks: the number of random walks (if the BFS does not complete),
+      split into two batches.
+    :param walk_length: the number of steps of every random walk.
+    :param seed: the seed of the random generator.
+    :return: the estimate.
+    """
+    dfa = dfa.trim()
+    tables = CompositionTables(dfa, services)
+    encoder = tables.encoder
+
+    local_sizes = [_reachable_local_transitions(service) for service in services]
+    nb_system_states = math.prod(nb_states for nb_states, _ in local_sizes)
+    nb_system_transitions = sum(
+        nb_transitions * nb_system_states // nb_states
+        for nb_states, nb_transitions in local_sizes
+    )
+    nb_tensor_states = math.prod(encoder.radices.tolist()) * encoder.nb_dfa_states
+    # the sink state, if any DFA state has no next action
+    sink = 1 if tables.sink.any() else 0
+    bound = _product_size(projection_bounds(tables, dfa, services)) + sink
+
+    # partial BFS, as in comp_mdp_batched
+    initial_codes = tables.initial_codes(dfa, services)
+    frontier, visited = initial_codes, initial_codes
+    nb_state_actions, nb_transitions = 0, 0
+    while len(frontier) > 0 and len(visited) < sample_limit:
+        sources, action_ids, destinations, _probs, _rewards = tables.expand(frontier)
+        nb_state_actions += len(np.unique(sources * len(tables.actions) + action_ids))
+        nb_transitions += len(sources)
+        destinations = np.unique(destinations)
+        destinations = destinations[destinations != COMPOSITION_MDP_SINK_STATE]
+        frontier = destinations[~_is_in_sorted(visited, destinations)]
+        visited = np.union1d(visited, frontier)
+
+    exact = len(frontier) == 0
+    if exact:
+        nb_states = len(visited) + sink
+        return StateSpaceEstimate(
+            nb_system_states,
+            nb_system_transitions,
+            bound,
+            nb_tensor_states,
+            nb_states,
+            nb_state_actions + sink,
+            nb_transitions + sink,
+            nb_states,
+            exact,
+        )
+
+    rng = np.random.default_rng(seed)
+    first_walks, second_walks = (
+        _random_walks(tables, initial_codes, batch_size, walk_length, rng)
+        for batch_size in (nb_walks - nb_walks // 2, nb_walks // 2)
+    )
+    walked = np.union1d(first_walks, second_walks)
+    observed = np.union1d(visited, walked)
+    if _chapman_estimate(first_walks, second_walks) < len(walked) + 1:
+        # saturated: the walks are not expected to find any new state
+        nb_states = len(observed) + sink
+    else:
+        estimate = _product_size(_observed_projections(tables, observed)) + sink
+        nb_states = min(max(estimate, len(observed) + sink), bound)
+    # the mean out-degree, over all the observed states
+    nb_state_actions, nb_transitions = 0, 0
+    for start in range(0, len(observed), sample_limit):
+        sources, action_ids, _destinations, _probs, _rewards = tables.expand(
+            observed[start : start + sample_limit]
+        )
+        nb_state_actions += len(np.unique(sources * len(tables.actions) + action_ids))
+        nb_transitions += len(sources)
+    return StateSpaceEstimate(
+        nb_system_states,
+        nb_system_transitions,
+        bound,
+        nb_tensor_states,
+        nb_states,
+        nb_states * nb_state_actions / len(observed),
+        nb_states * nb_transitions / len(observed),
+        len(observed),
+        exact,
+    )
+
+
+class CompositionBudget:
+    """The resources a composition may use."""
+
+    def __init__(
+        self,
+        max_bytes: Optional[float] = None,
+        max_states: Optional[float] = None,
+        max_transitions: Optional[float] = None,
+    ):
+        """
+        Initialize the budget (None for no limit).
+
+        :param max_bytes: the maximum memory, in bytes.
+        :param max_states: the maximum number of states of the model.
+        :param max_transitions: the maximum number of transitions of the model.
+        """
+        self.max_bytes = max_bytes
+        self.max_states = max_states
+        self.max_transitions = max_transitions
+
+    def violations(
+        self, estimate: StateSpaceEstimate, strategy: str, use_bound: bool = False
+    ) -> List[str]:
+        """
+        Check a strategy against the budget.
+
+        :param estimate: the estimate of the composition.
+        :param strategy: one of STRATEGIES (LAZY is always within budget,
+          since nothing is built up front).
+        :param use_bound: use the upper bound on the number of composition
+          states, instead of the estimate.
+        :return: the exceeded limits, as messages (empty if the strategy fits).
+        """
+        assert strategy in STRATEGIES, f"unknown strategy {strategy}"
+        if strategy == LAZY:
+            return []
+        if strategy in (COMP_MDP, EXPLICIT):
+            nb_states = estimate.states(use_bound)
+            nb_transitions = estimate.transitions(use_bound)
+            nb_bytes = (
+                estimate.comp_mdp_bytes(use_bound)
+                if strategy == COMP_MDP
+                else estimate.explicit_bytes(use_bound)
+            )
+        else:
+            nb_states = estimate.nb_tensor_states
+            nb_transitions = 0
+            nb_bytes = estimate.tensor_bytes()
+        result = []
+        for name, value, limit in [
+            ("bytes", nb_bytes, self.max_bytes),
+            ("states", nb_states, self.max_states),
+            ("transitions", nb_transitions, self.max_transitions),
+        ]:
+            if limit is not None and value > limit:
+                result.append(f"{strategy}: {value:.4g} {name} > {limit:.4g}")
+        return result
+
+
+class AdmissionDecision:
+    """The outcome of the admission control of a composition."""
+
+    def __init__(
+        self,
+        strategy: Optional[str],
+        estimate: StateSpaceEstimate,
+        violations: Dict[str, List[str]],
+    ):
+        """
+        Initialize the decision.
+
+        :param strategy: the admitted strategy, or None if the composition is refused.
+        :param estimate: the estimate of the composition.
+        :param violations: the exceeded limits of every rejected strategy.
+        """
+        self.strategy = strategy
+        self.estimate = estimate
+        self.violations = violations
+
+    @property
+    def admitted(self) -> bool:
+        """Check whether a strategy has been admitted."""
+        return self.strategy is not None
+
+    @property
+    def reason(self) -> str:
+        """Get a description of the decision."""
+        rejected = "; ".join(m for messages in self.violations.values() for m in messages)
+        if self.strategy is None:
+            return f"refused ({rejected})"
+        return f"admitted {self.strategy}" + (f" ({rejected})" if rejected else "")
+
+
+def admit(
+    estimate: StateSpaceEstimate,
+    budget: CompositionBudget,
+    strategies: Sequence[str] = DEFAULT_STRATEGIES,
+    use_bound: bool = False,
+) -> AdmissionDecision:
+    """
+    Choose the first strategy that fits the budget.
+
+    :param estimate: the estimate of the composition.
+    :param budget: the budget.
+    :param strategies: the strategies, by order of preference.
+    :param use_bound: use the upper bound on the number of composition
+      states, instead of the estimate (conservative).
+    :return: the decision.
+    """
+    violations: Dict[str, List[str]] = {}
+    for strategy in strategies:
+        messages = budget.violations(estimate, strategy, use_bound)
+        if len(messages) == 0:
+            return AdmissionDecision(strategy, estimate, violations)
+        violations[strategy] = messages
+    return AdmissionDecision(None, estimate, violations)
+
+
+def comp_mdp_within_budget(
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    budget: CompositionBudget,
+    gamma: float = DEFAULT_GAMMA,
+    strategies: Sequence[str] = DEFAULT_STRATEGIES,
+    use_bound: bool = False,
+    estimate: Optional[StateSpaceEstimate] = None,
+) -> Tuple[AdmissionDecision, Optional[object]]:
+    """
+    Compose the services with the target, with the first strategy that fits the budget.
+
+    :param dfa: the target DFA.
+    :param services: the community of services.
+    :param budget: the budget.
+    :param gamma: the discount factor.
+    :param strategies: the strategies, by order of preference.
+    :param use_bound: see admit.
+    :param estimate: the estimate of the composition (default: computed with
+      estimate_state_space).
+    :return: the decision, and the model built by the admitted strategy: the
+      MDP of comp_mdp for COMP_MDP, the (same) MDP of comp_mdp_batched for EXPLICIT, the solved
+      KroneckerSolution for KRONECKER, a LazyCompositionMDP for LAZY, or None
+      if the composition is refused.
+    """
+    estimate = estimate_state_space(dfa, services) if estimate is None else estimate
+    decision = admit(estimate, budget, strategies, use_bound)
+    if decision.strategy == COMP_MDP:
+        return decision, comp_mdp(dfa, services, gamma)
+    if decision.strategy == EXPLICIT:
+        return decision, comp_mdp_batched(dfa, services, gamma)
+    if decision.strategy == KRONECKER:
+        return decision, kronecker_value_iteration(dfa, services, gamma)
+    if decision.strategy == LAZY:
+        return decision, LazyCompositionMDP(dfa, services, gamma)
+    return decision, None
@@ -0,0 +1,394 @@
+"""
+This module implements a symbolic composition engine based on decision diagrams.
+
+The local state of every service and the DFA state are binary-encoded with
+boolean variables; for each of them there is a "current" and a "next" copy
+(interleaved in the variable order). The composition of comp_mdp is
+represented, action by action, with algebraic decision diagrams:
+
+- the guard G_a(x_i, q): action a = (symbol, i) can be taken;
+- the reward R_a(x_i, q): service reward plus goal reward;
+- the transition T_a(x_i, q, x_i', q') = P_i(x_i, x_i') * [q' = delta(q, symbol)].
+
+Value iteration is performed symbolically:
+
+    V'(x, q) = max_a  G_a ? R_a + gamma * sum_{x_i', q'} T_a * V[x_i <- x_i', q <- q'] : -inf
+
+Since every action only touches the variables of one service and of the DFA,
+the other components never need a frame condition. The guards are restricted
+to the states reachable from the initial states of comp_mdp, computed
+symbolically beforehand; elsewhere the values are 0. The resulting value
+diagram can be queried on explicit composition states.
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple, cast
+
+import numpy as np
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.batched_composition import CompositionTables
+from stochastic_service_composition.composition_mdp import (
+    COMPOSITION_MDP_SINK_STATE,
+    COMPOSITION_MDP_UNDEFINED_ACTION,
+    DEFAULT_GAMMA,
+)
+from stochastic_service_composition.decision_diagrams import ADDManager
+from stochastic_service_composition.kronecker import LocalAction, build_local_actions
+from stochastic_service_composition.services import Service
+from stochastic_service_composition.solvers import DEFAULT_TOLERANCE
+from stochastic_service_composition.types import Action, CompositionState, State
+
+
+def _nb_bits(nb_values: int) -> int:
+    """Get the number of bits needed to encode some values."""
+    return max(1, math.ceil(math.log2(nb_values))) if nb_values > 1 else 1
+
+
+def _to_int(bits: Sequence[bool]) -> int:
+    """Decode a little-endian bit vector."""
+    return sum(1 << j for j, bit in enumerate(bits) if bit)
+
+
+class SymbolicAction:
+    """The decision diagrams of a composition action (symbol, service_id)."""
+
+    def __init__(self, local: LocalAction, guard: int, reward: int, transition: int):
+        """
+        Initialize the symbolic action.
+
+        :param local: the local action.
+        :param guard: the 0/1 diagram of the states where the action can be taken.
+        :param reward: the diagram of the reward (-inf where the action cannot be taken).
+        :param transition: the diagram of the transition probabilities (0 from
+          the states where the action cannot be taken).
+        """
+        self.local = local
+        self.guard = guard
+        self.reward = reward
+        self.transition = transition
+
+
+class SymbolicComposition:
+    """The symbolic representation of the composition MDP of comp_mdp."""
+
+    def __init__(self, dfa: SimpleDFA, services: Sequence[Service]):
+        """
+        Build the symbolic composition.
+
+        :param dfa: the target DFA.
+        :param services: the community of services.
+        """
+        dfa = dfa.trim()
+        self.tables = CompositionTables(dfa, services)
+        encoder = self.tables.encoder
+
+        # variable layout: DFA bits first, then the bits of each service;
+        # current variable of bit k at level 2k, next variable at level 2k+1.
+        sizes = [encoder.nb_dfa_states] + encoder.radices.tolist()
+        self.current_levels: List[List[int]] = []
+        nb_bits = 0
+        for size in sizes:
+            block_bits = _nb_bits(size)
+            self.current_levels.append([2 * (nb_bits + j) for j in range(block_bits)])
+            nb_bits += block_bits
+        self.manager = ADDManager(2 * nb_bits)
+
+        self.dfa_levels = self.current_levels[0]
+        self.service_levels = self.current_levels[1:]
+        # renaming current -> next, for the DFA and one service
+        self._rename_maps: List[Dict[int, int]] = [
+            {level: level + 1 for level in self.dfa_levels + levels}
+            for levels in self.service_levels
+        ]
+        self._inverse_rename_maps: List[Dict[int, int]] = [
+            {next_level: level for level, next_level in rename_map.items()}
+            for rename_map in self._rename_maps
+        ]
+
+        self.actions: List[SymbolicAction] = []
+        dfa_cache: Dict[int, Tuple[int, int]] = {}
+        for local in build_local_actions(self.tables):
+            if local.symbol not in dfa_cache:
+                dfa_cache[local.symbol] = self._dfa_diagrams(local.symbol)
+            dfa_transition, goal = dfa_cache[local.symbol]
+            self.actions.append(self._action_diagrams(local, dfa_transition, goal))
+
+        # the actions are restricted to the states of comp_mdp: the backups
+        # skip the states where an action cannot be taken, and the value
+        # diagram does not grow with the values of unreachable combinations
+        self.reachable = self._reachable_states(self.tables.initial_codes(dfa, services))
+        manager = self.manager
+        for action in self.actions:
+            action.guard = manager.apply("*", action.guard, self.reachable)
+            action.reward = manager.where(action.guard, action.reward, -math.inf)
+            action.transition = manager.apply("*", action.transition, action.guard)
+        # the backups start from 0 on the states without actions (the sink
+        # state, dead ends and unreachable states) and from -inf elsewhere
+        has_action = manager.constant(0.0)
+        for action in self.actions:
+            has_action = manager.apply("max", has_action, action.guard)
+        self.no_action_values = manager.where(has_action, manager.constant(-math.inf), 0.0)
+        self.collect_garbage(manager.constant(0.0))
+
+    def _dfa_diagrams(self, symbol: int) -> Tuple[int, int]:
+        """Build the DFA transition diagram and the goal reward diagram of a symbol."""
+        tables = self.tables
+        manager = self.manager
+        nb_dfa_states = tables.encoder.nb_dfa_states
+        next_dfa = tables.next_dfa[:, symbol]
+        tau = bool(tables.tau_symbols[symbol])
+        current, following = self.dfa_levels, [level + 1 for level in self.dfa_levels]
+        nb = len(current)
+
+        def transition(bits: Tuple[bool, ...]) -> float:
+            q, next_q = _to_int(bits[:nb]), _to_int(bits[nb:])
+            return float(q < nb_dfa_states and next_dfa[q] >= 0 and next_dfa[q] == next_q)
+
+        def goal(bits: Tuple[bool, ...]) -> float:
+            q = _to_int(bits)
+            if tau or q >= nb_dfa_states or next_dfa[q] < 0:
+                return 0.0
+            return float(tables.accepting[next_dfa[q]])
+
+        return (
+            manager.from_function(current + following, transition),
+            manager.from_function(current, goal),
+        )
+
+    def _action_diagrams(
+        self, local: LocalAction, dfa_transition: int, goal: int
+    ) -> SymbolicAction:
+        """Build the diagrams of a composition action."""
+        tables = self.tables
+        manager = self.manager
+        i = local.service_id
+        n_i = len(local.available)
+        nb_dfa_states = tables.encoder.nb_dfa_states
+        current = self.service_levels[i]
+        following = [level + 1 for level in current]
+        nb = len(current)
+        next_dfa = tables.next_dfa[:, local.symbol]
+
+        def local_transition(bits: Tuple[bool, ...]) -> float:
+            x, y = _to_int(bits[:nb]), _to_int(bits[nb:])
+            return float(local.matrix[x, y]) if x < n_i and y < n_i else 0.0
+
+        def local_reward(bits: Tuple[bool, ...]) -> float:
+            x = _to_int(bits)
+            return float(local.rewards[x]) if x < n_i else 0.0
+
+        def local_guard(bits: Tuple[bool, ...]) -> float:
+            x = _to_int(bits)
+            return float(x < n_i and local.available[x])
+
+        def dfa_guard(bits: Tuple[bool, ...]) -> float:
+            q = _to_int(bits)
+            return float(q < nb_dfa_states and tables.allowed[q, i] and next_dfa[q] >= 0)
+
+        guard = manager.apply(
+            "*",
+            manager.from_function(current, local_guard),
+            manager.from_function(self.dfa_levels, dfa_guard),
+        )
+        reward = manager.apply("+", manager.from_function(current, local_reward), goal)
+        transition = manager.apply(
+            "*", manager.from_function(current + following, local_transition), dfa_transition
+        )
+        return SymbolicAction(local, guard, reward, transition)
+
+    def _states_diagram(self, codes: np.ndarray) -> int:
+        """Build the 0/1 diagram of a set of composition states, given their codes."""
+        encoder = self.tables.encoder
+        digits = [encoder.dfa_digits(codes)] + [
+            encoder.service_digits(codes, i) for i in range(encoder.nb_services)
+        ]
+        bits_by_level: Dict[int, np.ndarray] = {}
+        for levels, block_digits in zip(self.current_levels, digits):
+            for j, level in enumerate(levels):
+                bits_by_level[level] = ((block_digits >> j) & 1).astype(bool)
+        levels = sorted(bits_by_level)
+        bits = np.stack([bits_by_level[level] for level in levels], axis=1)
+        manager = self.manager
+
+        def build(rows: np.ndarray, depth: int) -> int:
+            if len(rows) == 0:
+                return manager.constant(0.0)
+            if depth == len(levels):
+                return manager.constant(1.0)
+            high = rows[:, depth]
+            return manager.node(
+                levels[depth], build(rows[~high], depth + 1), build(rows[high], depth + 1)
+            )
+
+        return build(bits, 0)
+
+    def _reachable_states(self, initial_codes: np.ndarray) -> int:
+        """Compute the 0/1 diagram of the states reachable from the initial ones."""
+        manager = self.manager
+        reachable = self._states_diagram(initial_codes)
+        frontier = reachable
+        while True:
+            image = manager.constant(0.0)
+            for action in self.actions:
+                i = action.local.service_id
+                current = self.dfa_levels + self.service_levels[i]
+                successors = manager.multiply_sum_abstract(
+                    manager.apply("*", frontier, action.guard), action.transition, current
+                )
+                successors = manager.map_terminals(
+                    successors, lambda v: float(v > 0.0), "is_positive"
+                )
+                successors = manager.rename(successors, self._inverse_rename_maps[i])
+                image = manager.apply("max", image, successors)
+            new_reachable = manager.apply("max", reachable, image)
+            if new_reachable == reachable:
+                return reachable
+            unreached = manager.map_terminals(reachable, lambda v: 1.0 - v, "complement")
+            frontier = manager.apply("*", image, unreached)
+            reachable = new_reachable
+
+    def assignment(self, state: State) -> Dict[int, bool]:
+        """Get the assignment to the current variables encoding a composition state."""
+        system_state, dfa_state = cast(CompositionState, state)
+        encoder = self.tables.encoder
+        indices = [encoder.dfa_state_index[dfa_state]] + [
+            encoder.service_state_index[i][component]
+            for i, component in enumerate(system_state)
+        ]
+        assignment: Dict[int, bool] = {}
+        for levels, index in zip(self.current_levels, indices):
+            for j, level in enumerate(levels):
+                assignment[level] = bool((index >> j) & 1)
+        return assignment
+
+    def bellman_backup(self, values: int, gamma: float) -> int:
+        """Apply the Bellman optimality operator to a value diagram."""
+        manager = self.manager
+        new_values = self.no_action_values
+        for action in self.actions:
+            i = action.local.service_id
+            following = [level + 1 for level in self.dfa_levels + self.service_levels[i]]
+            # V is read on the next variables of the DFA and of the service
+            expected = manager.multiply_sum_abstract(
+                action.transition, values, following, self._rename_maps[i], gamma
+            )
+            # the reward is -inf where the action cannot be taken
+            new_values = manager.apply(
+                "max", new_values, manager.apply("+", action.reward, expected)
+            )
+        return new_values
+
+    def collect_garbage(self, values: int) -> int:
+        """
+        Free the nodes of the manager not used by the composition or by a value diagram.
+
+        :param values: the value diagram to keep.
+        :return: the new node of the value diagram.
+        """
+        roots = [self.reachable, self.no_action_values, values]
+        for action in self.actions:
+            roots.extend((action.guard, action.reward, action.transition))
+        roots = self.manager.collect(roots)
+        self.reachable, self.no_action_values, values = roots[:3]
+        for k, action in enumerate(self.actions):
+            action.guard, action.reward, action.transition = roots[3 + 3 * k : 6 + 3 * k]
+        return values
+
+
+class SymbolicSolution:
+    """The value diagram computed by symbolic_value_iteration, with its greedy policy."""
+
+    def __init__(
+        self, composition: SymbolicComposition, values: int, gamma: float, iterations: int
+    ):
+        """
+        Initialize the solution.
+
+        :param composition: the symbolic composition.
+        :param values: the value diagram.
+        :param gamma: the discount factor.
+        :param iterations: the number of sweeps performed.
+        """
+        self.composition = composition
+        self.values = values
+        self.gamma = gamma
+        self.iterations = iterations
+
+    def value(self, state: State) -> float:
+        """Get the value of a composition state ((s_1, ..., s_n), q)."""
+        if state == COMPOSITION_MDP_SINK_STATE:
+            return 0.0
+        return self.composition.manager.evaluate(
+            self.values, self.composition.assignment(state)
+        )
+
+    def q_values(self, state: State) -> Dict[Action, float]:
+        """Get the Q-value of every action available in a composition state."""
+        if state == COMPOSITION_MDP_SINK_STATE:
+            return {COMPOSITION_MDP_UNDEFINED_ACTION: 0.0}
+        composition = self.composition
+        tables = composition.tables
+        system_state, dfa_state = cast(CompositionState, state)
+        q = tables.encoder.dfa_state_index[dfa_state]
+        if tables.sink[q]:
+            return {COMPOSITION_MDP_UNDEFINED_ACTION: 0.0}
+        manager = composition.manager
+        assignment = composition.assignment(state)
+        result: Dict[Action, float] = {}
+        for action in composition.actions:
+            if manager.evaluate(action.guard, assignment) == 0.0:
+                continue
+            local = action.local
+            i = local.service_id
+            x_i = tables.encoder.service_state_index[i][system_state[i]]
+            next_q = int(tables.next_dfa[q, local.symbol])
+            next_state_template = list(system_state)
+            expected = 0.0
+            for y in np.flatnonzero(local.matrix[x_i]).tolist():
+                next_state_template[i] = tables.encoder.service_states[i][y]
+                next_state = (tuple(next_state_template), tables.encoder.dfa_states[next_q])
+                expected += local.matrix[x_i, y] * self.value(next_state)
+            symbol = tables.symbols[local.symbol]
+            result[(symbol, i)] = (
+                manager.evaluate(action.reward, assignment) + self.gamma * expected
+            )
+        return result
+
+    def action(self, state: State) -> Optional[Action]:
+        """Get the greedy action in a composition state (None if there is no action)."""
+        q_values = self.q_values(state)
+        if len(q_values) == 0:
+            return None
+        return max(q_values, key=q_values.__getitem__)
+
+
+def symbolic_value_iteration(
+    dfa: SimpleDFA,
+    services: Sequence[Service],
+    gamma: float = DEFAULT_GAMMA,
+    tol: float = DEFAULT_TOLERANCE,
+    max_iterations: Optional[int] = None,
+) -> SymbolicSolution:
+    """
+    Solve the composition MDP of comp_mdp symbolically.
+
+    :param dfa: the target DFA.
+    :param services: the community of services.
+    :param gamma: the discount factor.
+    :param tol: the tolerance on successive differences.
+    :param max_iterations: the maximum number of sweeps, if any.
+    :return: the solution.
+    """
+    composition = SymbolicComposition(dfa, services)
+    manager = composition.manager
+    values = manager.constant(0.0)
+    iterations = 0
+    while max_iterations is None or iterations < max_iterations:
+        new_values = composition.bellman_backup(values, gamma)
+        iterations += 1
+        residual = manager.max_distance(new_values, values)
+        # only the composition and the new values are needed by the next sweep
+        values = composition.collect_garbage(new_values)
+        if residual < tol:
+            break
+    return SymbolicSolution(composition, values, gamma, iterations)
@@ -13,3 +13,5 @@ Prob = float
 TransitionFunction = Dict[State, Dict[Action, State]]
 MDPDynamics = Dict[State, Dict[Action, Tuple[Dict[State, Prob], Reward]]]
 TargetDynamics = Dict[State, Dict[Action, Tuple[State, Prob, Reward]]]
+# a state ((s_1, ..., s_n), q) of the composition MDP, other than the sink
+CompositionState = Tuple[Tuple[State, ...], State]
@@ -0,0 +1,70 @@
+"""Fixtures shared by the tests: a small community and its targets."""
+import pytest
+from pythomata import SimpleDFA
+
+from stochastic_service_composition.composition_mdp import comp_mdp
+from tests.helpers import (
+    CHECK,
+    GAMMA,
+    PAINT,
+    RETRIEVE,
+    SYMBOLS,
+    breakable_service,
+    one_state_service,
+)
+
+
+@pytest.fixture
+def target() -> SimpleDFA:
+    """Build the target: retrieve, paint (possibly repeated) and check, in a loop."""
+    transition_function = {
+        0: {RETRIEVE: 1},
+        1: {PAINT: 2},
+        2: {PAINT: 2, CHECK: 0},
+    }
+    return SimpleDFA({0, 1, 2}, SYMBOLS, 0, {0}, transition_function)
+
+
+@pytest.fixture
+def sequential_target() -> SimpleDFA:
+    """Build an acyclic target: retrieve, paint twice and check, once."""
+    transition_function = {
+        0: {RETRIEVE: 1},
+        1: {PAINT: 2},
+        2: {PAINT: 3},
+        3: {CHECK: 4},
+    }
+    return SimpleDFA({0, 1, 2, 3, 4}, SYMBOLS, 0, {4}, transition_function)
+
+
+@pytest.fixture
+def community():
+    """Build a community whose painters can break and be repaired."""
+    return [
+        one_state_service([RETRIEVE], -1.0),
+        breakable_service(PAINT, 0.1, -1.0),
+        one_state_service([CHECK], -1.0),
+        breakable_service(PAINT, 0.3, -2.0),
+    ]
+
+
+@pytest.fixture
+def failing_community():
+    """Build a community whose only painter can break for good."""
+    return [
+        one_state_service([RETRIEVE], -1.0),
+        breakable_service(PAINT, 0.1, -1.0, repairable=False),
+        one_state_service([CHECK], -1.0),
+    ]
+
+
+@pytest.fixture
+def composition(target, community):
+    """Compose the looping target with the repairable community."""
+    return comp_mdp(target, community, GAMMA)
+
+
+@pytest.fixture
+def failing_composition(sequential_target, failing_community):
+    """Compose the acyclic target with the community that can fail."""
+    return comp_mdp(sequential_target, failing_community, GAMMA)
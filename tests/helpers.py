@@ -0,0 +1,47 @@
+"""Helpers shared by the tests: small services and composition comparisons."""
+from typing import Dict, Sequence
+
+import pytest
+from mdp_dp_rl.processes.mdp import MDP
+
+from stochastic_service_composition.services import Service, build_service_from_transitions
+
+RETRIEVE = "retrieve"
+PAINT = "paint"
+CHECK = "check"
+SYMBOLS = {RETRIEVE, PAINT, CHECK}
+GAMMA = 0.9
+
+
+def one_state_service(actions: Sequence[str], reward: float) -> Service:
+    """Build a service that can always perform some actions."""
+    transitions = {"re": {action: ({"re": 1.0}, reward) for action in actions}}
+    return build_service_from_transitions(transitions, "re", {"re"})  # type: ignore
+
+
+def breakable_service(
+    action: str, broken_prob: float, reward: float, repairable: bool = True
+) -> Service:
+    """
+    Build a service that can break while performing an action, and must be checked.
+
+    If the service is not repairable, once broken it cannot do anything.
+    """
+    transitions: Dict = {
+        "av": {action: ({"do": 1.0 - broken_prob, "br": broken_prob}, reward)},
+        "br": {f"ch_{action}": ({"av": 1.0}, -10.0)} if repairable else {},
+        "do": {f"ch_{action}": ({"av": 1.0}, 0.0)},
+    }
+    return build_service_from_transitions(transitions, "av", {"av"})  # type: ignore
+
+
+def assert_same_mdp(actual: MDP, expected: MDP) -> None:
+    """Check that two composition MDPs have the same states, transitions and rewards."""
+    assert actual.all_states == expected.all_states
+    for state in expected.all_states:
+        assert actual.transitions[state].keys() == expected.transitions[state].keys()
+        for action, next_states in expected.transitions[state].items():
+            assert actual.transitions[state][action] == pytest.approx(next_states)
+            assert actual.rewards[state][action] == pytest.approx(
+                expected.rewards[state][action]
+            )
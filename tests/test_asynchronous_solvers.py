@@ -0,0 +1,72 @@
+"""Tests for the asynchronous value iteration solvers and the solve() dispatcher."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.asynchronous_solvers import (
+    accepting_states,
+    backward_bfs_layers,
+    gauss_seidel_value_iteration,
+    prioritized_sweeping,
+)
+from stochastic_service_composition.solve import SOLVERS, solve
+from stochastic_service_composition.solvers import value_iteration
+
+COMPOSITIONS = [
+    ("composition", "target"),
+    ("failing_composition", "sequential_target"),
+]
+TOL = 1e-10
+
+
+@pytest.fixture(params=COMPOSITIONS, ids=[name for name, _ in COMPOSITIONS])
+def mdp_and_dfa(request):
+    """Get a composition as an ArrayMDP, and its target."""
+    composition_name, dfa_name = request.param
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    return mdp, request.getfixturevalue(dfa_name)
+
+
+def test_backward_bfs_layers(mdp_and_dfa):
+    """The layers are a permutation of the states, starting from the roots."""
+    mdp, dfa = mdp_and_dfa
+    roots = accepting_states(mdp, dfa.accepting_states)
+    order, layer_ptr = backward_bfs_layers(mdp, roots)
+    assert sorted(order.tolist()) == list(range(mdp.nb_states))
+    assert layer_ptr[0] == 0 and layer_ptr[-1] == mdp.nb_states
+    first_layer = {mdp.states[s] for s in order[layer_ptr[0] : layer_ptr[1]]}
+    assert first_layer == set(roots)
+
+
+@pytest.mark.parametrize("with_accepting", [False, True])
+def test_gauss_seidel_value_iteration(mdp_and_dfa, with_accepting):
+    """Gauss-Seidel value iteration converges to the values of value_iteration."""
+    mdp, dfa = mdp_and_dfa
+    accepting = dfa.accepting_states if with_accepting else None
+    expected = value_iteration(mdp, tol=TOL)
+    actual = gauss_seidel_value_iteration(mdp, tol=TOL, accepting=accepting)
+    assert actual.iterations <= expected.iterations
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-8)
+
+
+def test_prioritized_sweeping(mdp_and_dfa):
+    """Prioritized sweeping converges to the values of value_iteration."""
+    mdp, _dfa = mdp_and_dfa
+    expected = value_iteration(mdp, tol=TOL)
+    actual = prioritized_sweeping(mdp, tol=TOL)
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-8)
+
+
+def test_prioritized_sweeping_max_backups(mdp_and_dfa):
+    """Prioritized sweeping stops after max_backups backups."""
+    mdp, _dfa = mdp_and_dfa
+    actual = prioritized_sweeping(mdp, tol=TOL, max_backups=mdp.nb_states + 3)
+    assert actual.backups == mdp.nb_states + 3
+
+
+@pytest.mark.parametrize("method", sorted(SOLVERS))
+def test_solve(composition, target, method):
+    """Every method solves the MDP, and gauss_seidel can use the accepting states."""
+    expected = value_iteration(ArrayMDP.from_mdp(composition), tol=TOL)
+    actual = solve(composition, method, accepting=target.accepting_states, tol=TOL)
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-8)
@@ -0,0 +1,58 @@
+"""Tests for the backward induction over the strongly connected components."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.backward_induction import (
+    backward_induction,
+    strongly_connected_components,
+)
+from stochastic_service_composition.solvers import value_iteration
+
+COMPOSITIONS = ["composition", "failing_composition"]
+
+
+def reachability(mdp: ArrayMDP) -> np.ndarray:
+    """Compute the reflexive-transitive closure of the transition graph."""
+    reachable = np.eye(mdp.nb_states, dtype=bool)
+    reachable[mdp.sa_states[mdp.transition_sas], mdp.next_states] = True
+    for middle in range(mdp.nb_states):
+        reachable |= reachable[:, middle : middle + 1] & reachable[middle : middle + 1, :]
+    return reachable
+
+
+@pytest.mark.parametrize("composition_name", COMPOSITIONS)
+def test_strongly_connected_components(request, composition_name):
+    """Two states are in the same component iff they reach each other."""
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    component, nb_components = strongly_connected_components(mdp)
+    reachable = reachability(mdp)
+    assert set(component.tolist()) == set(range(nb_components))
+    same_component = component[:, None] == component[None, :]
+    np.testing.assert_array_equal(same_component, reachable & reachable.T)
+    # reverse topological order: a component only reaches smaller numbers
+    sources, targets = np.nonzero(reachable)
+    assert np.all(component[targets] <= component[sources])
+
+
+@pytest.mark.parametrize("composition_name", COMPOSITIONS)
+def test_backward_induction(request, composition_name):
+    """Backward induction gives the values and the policy of value_iteration."""
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    expected = value_iteration(mdp, tol=1e-12)
+    actual = backward_induction(mdp, tol=1e-12)
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-9)
+    q_values = mdp.q_values(expected.values)
+    np.testing.assert_allclose(q_values[actual.policy], q_values[expected.policy], atol=1e-9)
+    _, nb_components = strongly_connected_components(mdp)
+    assert actual.nb_components == nb_components
+
+
+def test_backward_induction_acyclic(failing_composition):
+    """On an acyclic composition, the values are exact without any iteration."""
+    mdp = ArrayMDP.from_mdp(failing_composition)
+    actual = backward_induction(mdp)
+    assert actual.is_acyclic
+    assert actual.backups == mdp.nb_states
+    expected = value_iteration(mdp, tol=1e-14)
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-12)
@@ -0,0 +1,20 @@
+"""Tests for the layer-synchronous expansion of the composition MDP."""
+import pytest
+
+from stochastic_service_composition.batched_composition import comp_mdp_batched
+from stochastic_service_composition.composition_mdp import comp_mdp
+from tests.helpers import GAMMA, assert_same_mdp
+
+
+@pytest.mark.parametrize(
+    "dfa_name, services_name",
+    [("target", "community"), ("sequential_target", "failing_community")],
+)
+def test_comp_mdp_batched(request, dfa_name, services_name):
+    """The batched expansion gives the composition computed by comp_mdp."""
+    dfa = request.getfixturevalue(dfa_name)
+    services = request.getfixturevalue(services_name)
+    actual = comp_mdp_batched(dfa, services, GAMMA)
+    expected = comp_mdp(dfa, services, GAMMA)
+    assert_same_mdp(actual, expected)
+    assert actual.initial_state == expected.initial_state
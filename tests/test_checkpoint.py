@@ -0,0 +1,64 @@
+"""Tests for the checkpoint and resume of compositions and value iteration."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.checkpoint import Checkpoint
+from stochastic_service_composition.composition_mdp import comp_mdp
+from stochastic_service_composition.progress import ProgressMonitor
+from stochastic_service_composition.solvers import value_iteration
+from tests.helpers import GAMMA, assert_same_mdp
+
+NB_UPDATES = 5
+
+
+def stop_after(stage, nb_updates):
+    """Build a monitor that reports every update, and stops a stage after some updates."""
+    updates = []
+
+    def callback(report):
+        updates.append(report.stage)
+        return updates.count(stage) < nb_updates
+
+    return ProgressMonitor(callback, interval=0.0)
+
+
+def test_value_iteration_resume(composition, tmp_path):
+    """A stopped value iteration resumes from its checkpoint, to the same result."""
+    mdp = ArrayMDP.from_mdp(composition)
+    expected = value_iteration(mdp)
+    checkpoint = Checkpoint(str(tmp_path / "vi.pkl"), interval=3600.0)
+    monitor = stop_after("value_iteration", NB_UPDATES)
+    stopped = value_iteration(mdp, checkpoint=checkpoint, monitor=monitor)
+    assert monitor.stopped
+    assert stopped.iterations == NB_UPDATES - 1
+    # saved on stop, although the interval has not elapsed
+    assert checkpoint.exists
+    resumed = value_iteration(mdp, checkpoint=checkpoint)
+    assert resumed.iterations == expected.iterations
+    np.testing.assert_allclose(resumed.values, expected.values)
+    np.testing.assert_array_equal(resumed.policy, expected.policy)
+
+
+def test_value_iteration_other_inputs(composition, tmp_path):
+    """A checkpoint is not resumed with another discount factor."""
+    mdp = ArrayMDP.from_mdp(composition)
+    checkpoint = Checkpoint(str(tmp_path / "vi.pkl"))
+    value_iteration(mdp, checkpoint=checkpoint)
+    with pytest.raises(AssertionError):
+        value_iteration(mdp, GAMMA / 2, checkpoint=checkpoint)
+
+
+def test_comp_mdp_resume(target, community, composition, tmp_path):
+    """A stopped composition resumes from its checkpoint, to the same MDP."""
+    checkpoint = Checkpoint(str(tmp_path / "comp_mdp.pkl"), interval=3600.0)
+    monitor = stop_after("comp_mdp", NB_UPDATES)
+    assert comp_mdp(target, community, GAMMA, checkpoint, monitor) is None
+    assert monitor.stopped
+    resumed = comp_mdp(target, community, GAMMA, checkpoint)
+    assert_same_mdp(resumed, composition)
+    assert resumed.initial_state == composition.initial_state
+    # a completed composition is loaded back as it is
+    assert_same_mdp(comp_mdp(target, community, GAMMA, checkpoint), composition)
+    checkpoint.clear()
+    assert not checkpoint.exists
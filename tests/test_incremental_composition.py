@@ -0,0 +1,60 @@
+"""Tests for the incremental update of the composition MDP."""
+import pytest
+
+from stochastic_service_composition.composition_mdp import comp_mdp
+from stochastic_service_composition.incremental_composition import (
+    add_service,
+    remove_service,
+    replace_service,
+)
+from tests.helpers import (
+    CHECK,
+    GAMMA,
+    PAINT,
+    assert_same_mdp,
+    breakable_service,
+    one_state_service,
+)
+
+
+@pytest.fixture
+def services(community):
+    """Build a community with a single painter."""
+    return community[:3]
+
+
+def test_add_service(target, services):
+    """Adding a service gives the composition of the new community."""
+    new_service = breakable_service(PAINT, 0.5, -2.0)
+    mdp = comp_mdp(target, services, GAMMA)
+    actual = add_service(mdp, target, services, new_service)
+    assert_same_mdp(actual, comp_mdp(target, services + [new_service], GAMMA))
+
+
+@pytest.mark.parametrize("service_id", [1, 3])
+def test_remove_service(target, services, service_id):
+    """Removing a service gives the composition of the remaining services."""
+    # comp_mdp needs a service for every symbol: only one of the painters is removed
+    services = services + [breakable_service(PAINT, 0.5, -2.0)]
+    mdp = comp_mdp(target, services, GAMMA)
+    actual = remove_service(mdp, target, services, service_id)
+    remaining = [s for i, s in enumerate(services) if i != service_id]
+    assert_same_mdp(actual, comp_mdp(target, remaining, GAMMA))
+
+
+@pytest.mark.parametrize(
+    "new_service",
+    [
+        # same structure, different probabilities and rewards
+        breakable_service(PAINT, 0.3, -3.0),
+        # different structure
+        one_state_service([PAINT, CHECK], -2.0),
+    ],
+)
+def test_replace_service(target, services, new_service):
+    """Replacing a service gives the composition of the updated community."""
+    mdp = comp_mdp(target, services, GAMMA)
+    actual = replace_service(mdp, target, services, 1, new_service)
+    updated = list(services)
+    updated[1] = new_service
+    assert_same_mdp(actual, comp_mdp(target, updated, GAMMA))
@@ -0,0 +1,77 @@
+"""Tests for interval value iteration."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.interval_iteration import interval_value_iteration
+from stochastic_service_composition.solvers import value_iteration
+
+COMPOSITIONS = ["composition", "failing_composition"]
+
+
+def optimal_values(mdp: ArrayMDP) -> np.ndarray:
+    """Compute the optimal values with the reference solver, to machine precision."""
+    return value_iteration(mdp, tol=1e-13).values
+
+
+@pytest.mark.parametrize("composition_name", COMPOSITIONS)
+@pytest.mark.parametrize("tol", [1e-2, 1e-6])
+def test_interval_value_iteration_bounds(request, composition_name, tol):
+    """The bounds contain the optimal values, and their gap is below tol."""
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    result = interval_value_iteration(mdp, tol=tol, stop_on_optimal_policy=False)
+    expected = optimal_values(mdp)
+    assert result.gap < tol
+    assert np.all(result.lower <= expected + 1e-10)
+    assert np.all(expected <= result.upper + 1e-10)
+    assert result.error_bound == pytest.approx(result.gap / 2.0)
+
+
+@pytest.mark.parametrize(
+    "composition_name, certified",
+    [
+        # the two repaired painters tie, and the bounds can never separate them
+        ("composition", False),
+        ("failing_composition", True),
+    ],
+)
+def test_interval_value_iteration_policy(request, composition_name, certified):
+    """The policy is optimal: it chooses an action of maximum Q-value."""
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    result = interval_value_iteration(mdp, tol=1e-12)
+    assert result.policy_certified == certified
+    expected = optimal_values(mdp)
+    q_values = mdp.q_values(expected)
+    for s in range(mdp.nb_states):
+        start, end = mdp.state_action_ptr[s], mdp.state_action_ptr[s + 1]
+        if start == end:
+            continue
+        assert q_values[result.policy[s]] == pytest.approx(q_values[start:end].max(), abs=1e-8)
+
+
+@pytest.mark.parametrize("compaction_threshold", [0.0, 0.1, 1.0])
+def test_interval_value_iteration_action_elimination(composition, compaction_threshold):
+    """Eliminating the suboptimal actions keeps the bounds sound and the policy optimal."""
+    # in the failing composition, every state has a single action
+    mdp = ArrayMDP.from_mdp(composition)
+    expected = interval_value_iteration(mdp, tol=1e-10, stop_on_optimal_policy=False)
+    actual = interval_value_iteration(
+        mdp,
+        tol=1e-10,
+        stop_on_optimal_policy=False,
+        eliminate_actions=True,
+        compaction_threshold=compaction_threshold,
+    )
+    assert actual.nb_eliminated_actions > 0
+    # with a threshold of 1, the MDP is never compacted
+    assert actual.q_backups <= expected.q_backups
+    assert actual.q_backups < expected.q_backups or compaction_threshold == 1.0
+    optimal = optimal_values(mdp)
+    assert np.all(actual.lower <= optimal + 1e-10)
+    assert np.all(optimal <= actual.upper + 1e-10)
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-9)
+    q_values = mdp.q_values(optimal)
+    for s in range(mdp.nb_states):
+        start, end = mdp.state_action_ptr[s], mdp.state_action_ptr[s + 1]
+        if start < end:
+            assert q_values[actual.policy[s]] == pytest.approx(q_values[start:end].max())
@@ -0,0 +1,32 @@
+"""Tests for the matrix-free value iteration on the composition."""
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.kronecker import kronecker_value_iteration
+from stochastic_service_composition.solvers import value_iteration
+from tests.helpers import GAMMA
+
+
+@pytest.mark.parametrize(
+    "dfa_name, services_name, composition_name",
+    [
+        ("target", "community", "composition"),
+        ("sequential_target", "failing_community", "failing_composition"),
+    ],
+)
+def test_kronecker_value_iteration(request, dfa_name, services_name, composition_name):
+    """On the reachable states, the values are the ones of value_iteration on comp_mdp."""
+    dfa = request.getfixturevalue(dfa_name)
+    services = request.getfixturevalue(services_name)
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    expected = value_iteration(mdp, GAMMA, tol=1e-10)
+    actual = kronecker_value_iteration(dfa, services, GAMMA, tol=1e-10)
+    q_values = mdp.q_values(expected.values, GAMMA)
+    for state, value in expected.value_function().items():
+        assert actual.value(state) == pytest.approx(value, abs=1e-8)
+        index = mdp.state_index[state]
+        expected_q_values = {
+            mdp.actions[mdp.sa_actions[k]]: q_values[k]
+            for k in range(mdp.state_action_ptr[index], mdp.state_action_ptr[index + 1])
+        }
+        assert actual.q_values(state) == pytest.approx(expected_q_values, abs=1e-8)
@@ -0,0 +1,54 @@
+"""Tests for the vectorized rollouts and the MCTS planner."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.mcts import MCTSPlanner, VectorizedRollouts
+from stochastic_service_composition.rtdp import LazyCompositionMDP
+from stochastic_service_composition.solvers import value_iteration
+from tests.helpers import GAMMA
+
+DEPTH = 10
+SIMULATIONS = 500
+
+
+@pytest.fixture
+def lazy(target, community):
+    """Build the looping composition lazily."""
+    return LazyCompositionMDP(target, community, GAMMA)
+
+
+def random_policy_values(mdp: ArrayMDP, depth: int) -> np.ndarray:
+    """Compute the expected return of the uniformly random policy over some steps."""
+    values = np.zeros(mdp.nb_states)
+    counts = np.diff(mdp.state_action_ptr)
+    for _ in range(depth):
+        q_values = mdp.q_values(values)
+        totals = np.bincount(mdp.sa_states, weights=q_values, minlength=mdp.nb_states)
+        values = np.where(counts > 0, totals / np.maximum(counts, 1), 0.0)
+    return values
+
+
+def test_vectorized_rollouts(composition, lazy):
+    """The mean return of the rollouts is the return of the random policy."""
+    mdp = ArrayMDP.from_mdp(composition)
+    expected = random_policy_values(mdp, DEPTH)[mdp.state_index[composition.initial_state]]
+    returns = VectorizedRollouts(lazy, seed=0).run(composition.initial_state, 20000, DEPTH)
+    assert returns.shape == (20000,)
+    standard_error = returns.std() / np.sqrt(len(returns))
+    assert abs(returns.mean() - expected) < 4 * standard_error
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_mcts_planner(composition, lazy, seed):
+    """With enough simulations, the planner picks the optimal painter."""
+    mdp = ArrayMDP.from_mdp(composition)
+    optimal = mdp.policy_actions(value_iteration(mdp, tol=1e-12).policy)
+    state = (("re", "av", "re", "av"), 1)
+    result = MCTSPlanner(lazy, seed=seed).plan(state, simulations=SIMULATIONS)
+    assert result.simulations == SIMULATIONS
+    assert result.action == optimal[state]
+    assert set(result.action_values) == set(composition.transitions[state])
+    # the first simulation only expands the root
+    visits = sum(visits for _mean, visits in result.action_values.values())
+    assert visits == SIMULATIONS - 1
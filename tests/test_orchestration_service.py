@@ -0,0 +1,134 @@
+"""Tests for the event-driven orchestration service."""
+import asyncio
+import json
+
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.composition_mdp import COMPOSITION_MDP_UNDEFINED_ACTION
+from stochastic_service_composition.orchestration_service import (
+    ACTION_TOPIC,
+    DROP_NEWEST,
+    DROP_OLDEST,
+    LatencyHistogram,
+    LocalBroker,
+    OrchestrationService,
+    ServiceEvent,
+    publish_actions,
+    topic_matches,
+)
+from stochastic_service_composition.policy_runtime import PolicyRuntime
+from stochastic_service_composition.solvers import value_iteration
+
+
+@pytest.mark.parametrize(
+    "topic_filter, topic, expected",
+    [
+        ("services/+/state", "services/1/state", True),
+        ("services/+/state", "services/1/other", False),
+        ("services/+/state", "services/1/state/more", False),
+        ("services/#", "services/1/state", True),
+        ("services/1/state", "services/1/state", True),
+        ("services/1/state", "services/2/state", False),
+    ],
+)
+def test_topic_matches(topic_filter, topic, expected):
+    """The MQTT wildcards match one level ('+') or all the remaining ones ('#')."""
+    assert topic_matches(topic_filter, topic) == expected
+
+
+def test_latency_histogram():
+    """The percentiles are the upper bounds of their buckets, capped by the maximum."""
+    histogram = LatencyHistogram(min_latency=1e-3, max_latency=1.0, buckets_per_decade=1)
+    for latency in [0.005] * 9 + [0.5]:
+        histogram.record(latency)
+    assert histogram.count == 10
+    assert histogram.mean == pytest.approx(0.0545)
+    assert histogram.percentile(50) == pytest.approx(0.01)
+    assert histogram.percentile(100) == pytest.approx(0.5)
+
+
+def most_likely_run(composition, policy):
+    """Follow the policy on the composition, always moving to the most likely next state."""
+    actions = []
+    state = composition.initial_state
+    while state in policy and policy[state] != COMPOSITION_MDP_UNDEFINED_ACTION:
+        action = policy[state]
+        actions.append(action)
+        next_states = composition.transitions[state][action]
+        state = max(next_states, key=next_states.get)
+    return actions, state
+
+
+def test_orchestration_service(failing_composition, sequential_target, failing_community):
+    """The service emits the actions of the policy as the services report their states."""
+    mdp = ArrayMDP.from_mdp(failing_composition)
+    result = value_iteration(mdp)
+    policy = mdp.policy_actions(result.policy)
+    runtime = PolicyRuntime.from_result(result, failing_community)
+    expected_actions, (expected_system_state, expected_dfa_state) = most_likely_run(
+        failing_composition, policy
+    )
+
+    async def orchestrate():
+        broker = LocalBroker()
+        published = broker.subscribe(ACTION_TOPIC)
+        initial_system_state, _ = failing_composition.initial_state
+        service = OrchestrationService(
+            runtime, sequential_target, initial_system_state, emit=publish_actions(broker)
+        )
+        running = asyncio.ensure_future(service.run())
+        consuming = asyncio.ensure_future(service.consume(broker))
+        system_state = list(initial_system_state)
+        actions = []
+        for _ in expected_actions:
+            _topic, payload = await asyncio.wait_for(published.get(), timeout=5.0)
+            message = json.loads(payload)
+            action = (message["symbol"], message["service_id"])
+            actions.append(action)
+            # the service moves to its most likely next state
+            service_id = action[1]
+            transitions = failing_community[service_id].transition_function
+            next_states, _reward = transitions[system_state[service_id]][action[0]]
+            system_state[service_id] = max(next_states, key=next_states.get)
+            await broker.publish_event(ServiceEvent(service_id, system_state[service_id]))
+        # wait for the last event to be processed, then stop
+        while service.pending_service is not None:
+            await asyncio.sleep(0.001)
+        await service.stop()
+        await asyncio.wait_for(running, timeout=5.0)
+        consuming.cancel()
+        return actions, service
+
+    actions, service = asyncio.run(orchestrate())
+    assert actions == expected_actions
+    assert tuple(service.system_state) == expected_system_state
+    assert service.dfa_state == expected_dfa_state
+    assert service.actions_emitted == len(expected_actions)
+    assert service.latency.count == len(expected_actions) - 1
+
+
+@pytest.mark.parametrize("overflow, kept", [(DROP_OLDEST, [1, 2]), (DROP_NEWEST, [0, 1])])
+def test_submit_nowait_overflow(
+    failing_composition, failing_community, sequential_target, overflow, kept
+):
+    """A full queue merges the events of the same service, then drops one."""
+    mdp = ArrayMDP.from_mdp(failing_composition)
+    runtime = PolicyRuntime.from_result(value_iteration(mdp), failing_community)
+    initial_system_state, _ = failing_composition.initial_state
+
+    async def submit():
+        service = OrchestrationService(
+            runtime, sequential_target, initial_system_state, queue_size=2, overflow=overflow
+        )
+        for service_id, state in [(0, "re"), (1, "do"), (1, "av"), (2, "re")]:
+            service.submit_nowait(ServiceEvent(service_id, state))
+        return service, [service.events.get_nowait() for _ in range(service.events.qsize())]
+
+    service, queued = asyncio.run(submit())
+    assert service.events_received == 4
+    assert service.events_coalesced == 1
+    assert service.events_dropped == 1
+    assert [event.service_id for event in queued] == kept
+    # the merged event of service 1 keeps its latest state
+    assert [event.state for event in queued if event.service_id == 1] == ["av"]
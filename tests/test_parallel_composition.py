@@ -0,0 +1,22 @@
+"""Tests for the multi-process composition."""
+import pytest
+
+from stochastic_service_composition.composition_mdp import comp_mdp
+from stochastic_service_composition.parallel_composition import comp_mdp_parallel
+from tests.helpers import GAMMA, assert_same_mdp
+
+
+@pytest.mark.parametrize("nb_workers", [1, 3])
+@pytest.mark.parametrize(
+    "dfa_name, services_name",
+    [("target", "community"), ("sequential_target", "failing_community")],
+)
+def test_comp_mdp_parallel(request, dfa_name, services_name, nb_workers):
+    """The workers compute the composition computed by comp_mdp."""
+    dfa = request.getfixturevalue(dfa_name)
+    services = request.getfixturevalue(services_name)
+    # tiny batches, so that states are forwarded among the workers many times
+    actual = comp_mdp_parallel(dfa, services, GAMMA, nb_workers=nb_workers, batch_size=2)
+    expected = comp_mdp(dfa, services, GAMMA)
+    assert_same_mdp(actual, expected)
+    assert actual.initial_state == expected.initial_state
@@ -0,0 +1,51 @@
+"""Tests for the shared-memory multi-core value iteration."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.parallel_solver import (
+    parallel_value_iteration,
+    split_in_blocks,
+)
+from stochastic_service_composition.solvers import value_iteration
+
+
+@pytest.mark.parametrize("nb_blocks", [1, 4, 100])
+def test_split_in_blocks(composition, nb_blocks):
+    """The blocks are contiguous and cover all the states."""
+    mdp = ArrayMDP.from_mdp(composition)
+    blocks = split_in_blocks(mdp, nb_blocks)
+    assert blocks[0][0] == 0
+    assert blocks[-1][1] == mdp.nb_states
+    assert all(end == next_start for (_, end), (next_start, _) in zip(blocks, blocks[1:]))
+    assert len(blocks) <= nb_blocks
+
+
+@pytest.mark.parametrize("nb_workers", [1, 2])
+def test_parallel_value_iteration(composition, nb_workers):
+    """The workers perform the same sweeps as value_iteration."""
+    mdp = ArrayMDP.from_mdp(composition)
+    expected = value_iteration(mdp, tol=1e-8)
+    actual = parallel_value_iteration(mdp, tol=1e-8, nb_workers=nb_workers)
+    assert actual.iterations == expected.iterations
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-12)
+    np.testing.assert_array_equal(actual.policy, expected.policy)
+
+
+@pytest.mark.parametrize("max_iterations", [3, 30])
+def test_parallel_value_iteration_initial_policy(composition, max_iterations):
+    """The evaluation sweeps of the initial policy count towards max_iterations."""
+    mdp = ArrayMDP.from_mdp(composition)
+    initial_policy = mdp.policy_actions(value_iteration(mdp, max_iterations=2).policy)
+    expected = value_iteration(
+        mdp, tol=1e-8, max_iterations=max_iterations, initial_policy=initial_policy
+    )
+    actual = parallel_value_iteration(
+        mdp,
+        tol=1e-8,
+        max_iterations=max_iterations,
+        nb_workers=2,
+        initial_policy=initial_policy,
+    )
+    assert actual.iterations == expected.iterations <= max_iterations
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-12)
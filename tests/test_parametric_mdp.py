@@ -0,0 +1,83 @@
+"""Tests for the in-place parameter updates of a composition MDP."""
+import numpy as np
+import pytest
+from mdp_dp_rl.processes.mdp import MDP
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.composition_mdp import comp_mdp
+from stochastic_service_composition.parametric_mdp import ParametricMDP
+from stochastic_service_composition.solvers import value_iteration
+from tests.helpers import GAMMA, PAINT, assert_same_mdp, breakable_service
+
+# the painter that is updated, and its update
+SERVICE_ID = 1
+NEW_SERVICE = breakable_service(PAINT, 0.4, -3.0)
+
+
+@pytest.fixture
+def parametric(composition, community):
+    """Link the composition to the parameters of the community."""
+    return ParametricMDP.from_mdp(composition, community)
+
+
+@pytest.fixture
+def updated(target, community):
+    """Compose the target with the updated community, from scratch."""
+    services = list(community)
+    services[SERVICE_ID] = NEW_SERVICE
+    return comp_mdp(target, services, GAMMA)
+
+
+def test_set_reward(parametric, target, community):
+    """Changing the reward of an action gives the composition with the new reward."""
+    parametric.set_reward(SERVICE_ID, "av", PAINT, -3.0)
+    services = list(community)
+    services[SERVICE_ID] = breakable_service(PAINT, 0.1, -3.0)
+    expected = comp_mdp(target, services, GAMMA)
+    assert_same_mdp(MDP(parametric.mdp.to_dynamics(), GAMMA), expected)
+
+
+def test_set_probabilities(parametric, target, community):
+    """Changing the distribution of an action gives the composition with the new one."""
+    parametric.set_probabilities(SERVICE_ID, "av", PAINT, {"do": 0.6, "br": 0.4})
+    services = list(community)
+    services[SERVICE_ID] = breakable_service(PAINT, 0.4, -1.0)
+    expected = comp_mdp(target, services, GAMMA)
+    assert_same_mdp(MDP(parametric.mdp.to_dynamics(), GAMMA), expected)
+
+
+def test_set_service(parametric, updated):
+    """Changing all the parameters of a service gives the recomposed MDP."""
+    parametric.set_service(SERVICE_ID, NEW_SERVICE)
+    assert_same_mdp(MDP(parametric.mdp.to_dynamics(), GAMMA), updated)
+
+
+def test_solve_after_update(parametric, updated):
+    """A warm-started solve after an update gives the values of the recomposed MDP."""
+    parametric.solve(tol=1e-10)
+    parametric.set_service(SERVICE_ID, NEW_SERVICE)
+    actual = parametric.solve(tol=1e-10)
+    expected_mdp = ArrayMDP.from_mdp(updated)
+    expected = value_iteration(expected_mdp, tol=1e-10)
+    actual_values = actual.mdp.value_function(actual.values)
+    for state, value in expected_mdp.value_function(expected.values).items():
+        assert actual_values[state] == pytest.approx(value, abs=1e-8)
+
+
+def test_solve_scenarios(parametric, updated):
+    """Solving the current and the updated parameters at once gives both solutions."""
+    old_rewards = parametric.reward_values.copy()
+    old_probabilities = parametric.probability_values.copy()
+    current = parametric.solve(tol=1e-10, warm_start=False)
+    parametric.set_service(SERVICE_ID, NEW_SERVICE)
+    reward_values = np.stack([old_rewards, parametric.reward_values], axis=1)
+    probability_values = np.stack([old_probabilities, parametric.probability_values], axis=1)
+    results = parametric.solve_scenarios(
+        reward_values=reward_values, probability_values=probability_values, tol=1e-10
+    )
+    expected = value_iteration(ArrayMDP.from_mdp(updated), tol=1e-10)
+    np.testing.assert_allclose(results[0].values, current.values, atol=1e-8)
+    expected_values = expected.mdp.value_function(expected.values)
+    actual_values = parametric.mdp.value_function(results[1].values)
+    for state, value in expected_values.items():
+        assert actual_values[state] == pytest.approx(value, abs=1e-8)
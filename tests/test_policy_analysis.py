@@ -0,0 +1,61 @@
+"""Tests for the exact analysis of a policy, against fixed-point iterations."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import NO_ACTION, ArrayMDP
+from stochastic_service_composition.asynchronous_solvers import accepting_states
+from stochastic_service_composition.composition_mdp import comp_mdp
+from stochastic_service_composition.policy_analysis import (
+    analyse_composition_policy,
+    myopic_policy,
+    policy_chain,
+)
+from stochastic_service_composition.solvers import value_iteration
+from tests.helpers import GAMMA
+
+NB_ITERATIONS = 2000
+
+
+def iterate_analysis(mdp: ArrayMDP, policy: np.ndarray, targets: np.ndarray):
+    """Compute the reachability probability and the expected cost by fixed-point iteration."""
+    chain = policy_chain(mdp, policy).toarray()
+    has_action = policy != NO_ACTION
+    state_costs = np.where(has_action, -mdp.sa_rewards[np.maximum(policy, 0)], 0.0)
+    probability = targets.astype(np.float64)
+    cost = np.zeros(mdp.nb_states)
+    for _ in range(NB_ITERATIONS):
+        probability = np.where(targets, 1.0, chain @ probability)
+        cost = np.where(targets, 0.0, state_costs + chain @ cost)
+    return probability, cost
+
+
+@pytest.fixture(params=["failing_community", "community"])
+def solved(request, sequential_target):
+    """Solve the acyclic target with a community that can, or cannot, fail."""
+    services = request.getfixturevalue(request.param)
+    mdp = ArrayMDP.from_mdp(comp_mdp(sequential_target, services, GAMMA))
+    return mdp, value_iteration(mdp).policy
+
+
+def test_policy_chain(solved):
+    """The rows of the states with an action are distributions, the others are empty."""
+    mdp, policy = solved
+    row_sums = np.asarray(policy_chain(mdp, policy).sum(axis=1)).ravel()
+    np.testing.assert_allclose(row_sums, np.where(policy != NO_ACTION, 1.0, 0.0))
+
+
+@pytest.mark.parametrize("use_myopic_policy", [False, True])
+def test_analyse_composition_policy(solved, sequential_target, use_myopic_policy):
+    """The linear solves give the fixed points of the probability and cost equations."""
+    mdp, policy = solved
+    if use_myopic_policy:
+        policy = myopic_policy(mdp)
+    analysis = analyse_composition_policy(mdp, policy, sequential_target.accepting_states)
+    targets = np.zeros(mdp.nb_states, dtype=bool)
+    for state in accepting_states(mdp, sequential_target.accepting_states):
+        targets[mdp.state_index[state]] = True
+    probability, cost = iterate_analysis(mdp, policy, targets)
+    np.testing.assert_allclose(analysis.reach_probability, probability, atol=1e-9)
+    almost_sure = np.isfinite(analysis.expected_cost)
+    np.testing.assert_array_equal(almost_sure, probability >= 1.0 - 1e-9)
+    np.testing.assert_allclose(analysis.expected_cost[almost_sure], cost[almost_sure])
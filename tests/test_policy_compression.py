@@ -0,0 +1,55 @@
+"""Tests for the compression of a policy into a decision tree."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import NO_ACTION, ArrayMDP
+from stochastic_service_composition.policy_compression import CompressedPolicy
+from stochastic_service_composition.policy_runtime import _is_composition_state
+from stochastic_service_composition.solvers import value_iteration
+
+COMPOSITIONS = [
+    ("composition", "community"),
+    ("failing_composition", "failing_community"),
+]
+
+
+@pytest.fixture(params=COMPOSITIONS, ids=[names[0] for names in COMPOSITIONS])
+def compressed(request):
+    """Compress the policy of a composition, and get the policy too."""
+    composition_name, services_name = request.param
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    policy = mdp.policy_actions(value_iteration(mdp).policy)
+    policy = {state: a for state, a in policy.items() if _is_composition_state(state)}
+    services = request.getfixturevalue(services_name)
+    return CompressedPolicy.from_policy(policy, services), policy
+
+
+def assert_reproduces(tree, policy):
+    """The tree gives the action of the policy in every state, one by one or in batch."""
+    for (system_state, dfa_state), action in policy.items():
+        assert tree.action(system_state, dfa_state) == action
+    features = np.array([tree.features(*state) for state in policy])
+    action_ids = tree.action_ids(features)
+    assert NO_ACTION not in action_ids
+    assert [tree.actions[i] for i in action_ids] == list(policy.values())
+    assert [tree.action_id(row) for row in features.tolist()] == action_ids.tolist()
+
+
+def test_compressed_policy(compressed):
+    """The tree is exact, and smaller than the policy."""
+    tree, policy = compressed
+    assert_reproduces(tree, policy)
+    assert tree.nb_leaves <= len(policy)
+    assert tree.depth <= tree.encoder.nb_services + 1
+
+
+def test_serialization(compressed, tmp_path):
+    """A saved tree is loaded back unchanged."""
+    tree, policy = compressed
+    path = str(tmp_path / "policy.npz")
+    tree.save(path)
+    loaded = CompressedPolicy.load(path)
+    assert loaded.actions == tree.actions
+    for name in ("node_feature", "node_action", "child_ptr", "children"):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(tree, name))
+    assert_reproduces(loaded, policy)
@@ -0,0 +1,38 @@
+"""Tests for the array-backed policy runtime."""
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.composition_mdp import COMPOSITION_MDP_SINK_STATE
+from stochastic_service_composition.policy_runtime import PolicyRuntime
+from stochastic_service_composition.solvers import value_iteration
+
+COMPOSITIONS = [
+    ("composition", "community"),
+    ("failing_composition", "failing_community"),
+]
+
+
+@pytest.fixture(params=COMPOSITIONS, ids=[names[0] for names in COMPOSITIONS])
+def solved(request):
+    """Solve a composition, and get its community."""
+    composition_name, services_name = request.param
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    return value_iteration(mdp), request.getfixturevalue(services_name)
+
+
+@pytest.mark.parametrize("dense_limit", [0, 10 ** 6])
+def test_policy_runtime(solved, dense_limit):
+    """The runtime answers the action of the policy in every composition state."""
+    result, services = solved
+    runtime = PolicyRuntime.from_result(result, services, dense_limit=dense_limit)
+    assert runtime.dense == (dense_limit > 0)
+    policy = result.mdp.policy_actions(result.policy)
+    states = [state for state in result.mdp.states if state != COMPOSITION_MDP_SINK_STATE]
+    # the states without actions (the dead-ends) have no action in the runtime too
+    assert runtime.nb_states == len([state for state in states if state in policy])
+    for system_state, dfa_state in states:
+        assert runtime.action(system_state, dfa_state) == policy.get((system_state, dfa_state))
+    actions = runtime.actions_many(
+        [system_state for system_state, _ in states], [dfa_state for _, dfa_state in states]
+    )
+    assert actions == [policy.get(state) for state in states]
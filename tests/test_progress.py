@@ -0,0 +1,45 @@
+"""Tests for the progress reporting and the cancellation of compositions and solves."""
+import numpy as np
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.composition_mdp import COMPOSITION_MDP_SINK_STATE, comp_mdp
+from stochastic_service_composition.progress import ProgressMonitor
+from stochastic_service_composition.services import build_system_service
+from stochastic_service_composition.solvers import value_iteration
+from tests.helpers import GAMMA, assert_same_mdp
+
+
+def test_reports(sequential_target, failing_community, failing_composition):
+    """Every stage is reported, and its last report gives its final figures."""
+    reports = []
+    monitor = ProgressMonitor(reports.append, interval=0.0)
+    mdp = comp_mdp(sequential_target, failing_community, GAMMA, monitor=monitor)
+    assert_same_mdp(mdp, failing_composition)
+    assert not monitor.stopped
+    stages = [report.stage for report in reports]
+    assert stages[0] == "system_service"
+    assert stages.index("comp_mdp") == stages.count("system_service")
+    final = {report.stage: report for report in reports}
+    nb_system_states = len(build_system_service(*failing_community).states)
+    assert final["system_service"].states == nb_system_states
+    assert final["comp_mdp"].states == len(mdp.all_states - {COMPOSITION_MDP_SINK_STATE})
+    assert final["comp_mdp"].frontier == 0
+    assert monitor.last_report is final["comp_mdp"]
+
+
+def test_time_budget(sequential_target, failing_community):
+    """An exhausted time budget stops the composition."""
+    monitor = ProgressMonitor(time_budget=0.0)
+    assert comp_mdp(sequential_target, failing_community, GAMMA, monitor=monitor) is None
+    assert "time budget" in monitor.stop_reason
+
+
+def test_cancel(failing_composition):
+    """A cancelled solve returns its current, unconverged, result."""
+    mdp = ArrayMDP.from_mdp(failing_composition)
+    monitor = ProgressMonitor()
+    monitor.cancel()
+    result = value_iteration(mdp, monitor=monitor)
+    assert result.iterations == 0
+    assert result.residual == np.inf
+    assert monitor.stop_reason == "cancelled"
@@ -0,0 +1,72 @@
+"""Tests for the trace generation and the replay benchmark."""
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.policy_runtime import PolicyRuntime
+from stochastic_service_composition.replay_benchmark import (
+    RESET,
+    DictPolicy,
+    generate_trace,
+    load_trace,
+    replay,
+    save_trace,
+)
+from stochastic_service_composition.solvers import value_iteration
+
+NB_EVENTS = 200
+
+
+@pytest.fixture
+def policy(failing_composition):
+    """Solve the failing composition, and get the action of every state."""
+    mdp = ArrayMDP.from_mdp(failing_composition)
+    return mdp.policy_actions(value_iteration(mdp).policy)
+
+
+def test_dict_policy(policy):
+    """A dictionary of action distributions is reduced to the most likely actions."""
+    distributions = {
+        state: {action: 0.8, "other": 0.2} for state, action in policy.items()
+    }
+    assert DictPolicy(distributions).policy == DictPolicy(policy).policy == policy
+
+
+def test_generate_trace(policy, failing_composition, sequential_target, failing_community):
+    """The trace visits the states of the composition, and restarts when the target is over."""
+    trace = generate_trace(
+        DictPolicy(policy), failing_community, sequential_target, NB_EVENTS, seed=0
+    )
+    assert len(trace) == NB_EVENTS
+    assert any(event.service_id == RESET for event in trace)
+    for event in trace:
+        assert (event.system_state, event.dfa_state) in failing_composition.transitions
+        if event.service_id != RESET:
+            assert event.system_state[event.service_id] == event.state
+
+
+def test_save_and_load_trace(policy, sequential_target, failing_community, tmp_path):
+    """A saved trace is loaded back unchanged."""
+    trace = generate_trace(
+        DictPolicy(policy), failing_community, sequential_target, NB_EVENTS, seed=0
+    )
+    path = str(tmp_path / "trace.jsonl")
+    save_trace(trace, path)
+    loaded = load_trace(path)
+    assert [event.to_json() for event in loaded] == [event.to_json() for event in trace]
+    assert all(isinstance(event.system_state, tuple) for event in loaded)
+
+
+def test_replay(policy, sequential_target, failing_community):
+    """The runtime and the dictionary agree on the trace, which is fully replayed."""
+    trace = generate_trace(
+        DictPolicy(policy), failing_community, sequential_target, NB_EVENTS, seed=0
+    )
+    runtime = PolicyRuntime.from_policy(policy, failing_community)
+    for event in trace:
+        assert runtime.action(event.system_state, event.dfa_state) == policy.get(
+            (event.system_state, event.dfa_state)
+        )
+    report = replay(runtime, trace, rate=1e5)
+    assert len(report.latencies) == NB_EVENTS
+    assert report.policy_bytes == runtime.nbytes
+    assert report.summary()["decisions"] == NB_EVENTS
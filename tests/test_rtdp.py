@@ -0,0 +1,69 @@
+"""Tests for the lazy composition and the bounded RTDP planner."""
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.rtdp import LazyCompositionMDP, RTDPPlanner
+from stochastic_service_composition.solvers import value_iteration
+from tests.helpers import GAMMA
+
+COMPOSITIONS = [
+    ("composition", "target", "community"),
+    ("failing_composition", "sequential_target", "failing_community"),
+]
+
+
+@pytest.fixture(params=COMPOSITIONS, ids=[names[0] for names in COMPOSITIONS])
+def problem(request):
+    """Get a composition, and the same composition built lazily."""
+    composition_name, dfa_name, services_name = request.param
+    lazy = LazyCompositionMDP(
+        request.getfixturevalue(dfa_name), request.getfixturevalue(services_name), GAMMA
+    )
+    return request.getfixturevalue(composition_name), lazy
+
+
+def optimal_value(composition, state) -> float:
+    """Compute the optimal value of a state with the reference solver."""
+    mdp = ArrayMDP.from_mdp(composition)
+    return float(value_iteration(mdp, tol=1e-12).values[mdp.state_index[state]])
+
+
+def test_lazy_composition(problem):
+    """The lazy transitions are the transitions of comp_mdp."""
+    composition, lazy = problem
+    assert lazy.initial_state == composition.initial_state
+    for state in composition.all_states:
+        actual = {
+            action: (dict(zip(next_states, probs)), reward)
+            for action, reward, next_states, probs in lazy.transitions(state)
+        }
+        expected = {
+            action: (next_states, composition.rewards[state][action])
+            for action, next_states in composition.transitions[state].items()
+        }
+        assert actual == expected
+    assert lazy.nb_expanded_states == len(composition.all_states)
+
+
+def test_rtdp_planner(problem):
+    """The bounds of the initial state meet at its optimal value."""
+    composition, lazy = problem
+    planner = RTDPPlanner(lazy, epsilon=1e-6, seed=0)
+    result = planner.plan(max_trials=10000)
+    expected = optimal_value(composition, composition.initial_state)
+    assert result.gap < 1e-6
+    assert result.lower <= expected + 1e-9
+    assert expected <= result.upper + 1e-9
+    assert result.action is not None
+
+
+@pytest.mark.parametrize("max_trials", [0, 1, 2])
+def test_rtdp_planner_anytime(problem, max_trials):
+    """The bounds are sound after any number of trials."""
+    composition, lazy = problem
+    planner = RTDPPlanner(lazy, seed=0)
+    result = planner.plan(max_trials=max_trials)
+    expected = optimal_value(composition, composition.initial_state)
+    assert result.trials == max_trials
+    assert result.lower <= expected + 1e-9
+    assert expected <= result.upper + 1e-9
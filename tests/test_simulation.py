@@ -0,0 +1,79 @@
+"""Tests for the vectorized Monte Carlo simulator, against the exact policy analysis."""
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.composition_mdp import COMPOSITION_MDP_SINK_STATE, comp_mdp
+from stochastic_service_composition.policy_analysis import analyse_composition_policy
+from stochastic_service_composition.simulation import (
+    Simulator,
+    proportion_confidence_interval,
+)
+from stochastic_service_composition.solvers import value_iteration
+from tests.helpers import GAMMA
+
+NB_EPISODES = 20000
+
+
+def solve(composition):
+    """Solve a composition, as an ArrayMDP."""
+    mdp = ArrayMDP.from_mdp(composition)
+    return mdp, value_iteration(mdp).policy
+
+
+def test_completion_probability(failing_composition, sequential_target):
+    """The completion probability is the exact probability of reaching an accepting state."""
+    mdp, policy = solve(failing_composition)
+    analysis = analyse_composition_policy(mdp, policy, sequential_target.accepting_states)
+    probability, _cost = analysis.at()
+    assert 0.0 < probability < 1.0
+    result = Simulator(mdp, accepting=sequential_target.accepting_states).run(
+        policy, NB_EPISODES, seed=0
+    )
+    lower, upper = result.summary(level=0.99)["completion_probability_ci"]
+    # the episodes stuck in a dead-end (the painter is broken for good) are not completed
+    assert lower <= probability <= upper
+
+
+def test_cost_and_makespan(sequential_target, community):
+    """The mean cost of the completed episodes is the exact expected cost."""
+    mdp, policy = solve(comp_mdp(sequential_target, community, GAMMA))
+    analysis = analyse_composition_policy(mdp, policy, sequential_target.accepting_states)
+    probability, expected_cost = analysis.at()
+    assert probability == pytest.approx(1.0)
+    result = Simulator(mdp, accepting=sequential_target.accepting_states).run(
+        policy, NB_EPISODES, seed=0
+    )
+    assert result.completion_probability == 1.0
+    lower, upper = result.summary(level=0.99)["cost_ci"]
+    assert lower <= expected_cost <= upper
+    # retrieve, paint twice and check, at least
+    assert result.makespans.min() >= 4
+
+
+def test_sink_step_not_counted(failing_composition, sequential_target):
+    """The 'undefined' step towards the sink state is neither a step nor a cost."""
+    mdp, policy = solve(failing_composition)
+    to_accepting = Simulator(mdp, accepting=sequential_target.accepting_states).run(
+        policy, 1000, seed=0
+    )
+    to_sink = Simulator(mdp, goal_states=[COMPOSITION_MDP_SINK_STATE]).run(
+        policy, 1000, seed=0
+    )
+    np.testing.assert_array_equal(to_sink.completed, to_accepting.completed)
+    np.testing.assert_array_equal(to_sink.steps, to_accepting.steps)
+    np.testing.assert_allclose(to_sink.total_costs, to_accepting.total_costs)
+
+
+def test_goal_states_required(failing_composition):
+    """The goal states must be given, either directly or through the accepting DFA states."""
+    mdp = ArrayMDP.from_mdp(failing_composition)
+    with pytest.raises(AssertionError):
+        Simulator(mdp)
+
+
+@pytest.mark.parametrize("successes, trials", [(0, 10), (5, 10), (10, 10), (900, 1000)])
+def test_proportion_confidence_interval(successes, trials):
+    """The Wilson interval contains the empirical proportion, within [0, 1]."""
+    lower, upper = proportion_confidence_interval(successes, trials)
+    assert 0.0 <= lower <= successes / trials <= upper <= 1.0
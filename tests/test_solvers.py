@@ -0,0 +1,57 @@
+"""Tests for the vectorized value iteration solvers."""
+import copy
+
+import numpy as np
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.solvers import batched_value_iteration, value_iteration
+
+GAMMAS = [0.5, 0.9, 0.99]
+
+
+def assert_same_result(actual, expected):
+    """Check that two solver results perform the same sweeps."""
+    assert actual.iterations == expected.iterations
+    np.testing.assert_allclose(actual.values, expected.values, atol=1e-12)
+    np.testing.assert_array_equal(actual.policy, expected.policy)
+
+
+@pytest.mark.parametrize("composition_name", ["composition", "failing_composition"])
+def test_batched_value_iteration_gammas(request, composition_name):
+    """Every discount factor gives the same result as a separate run."""
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    results = batched_value_iteration(mdp, gammas=GAMMAS, tol=1e-8)
+    assert len(results) == len(GAMMAS)
+    for gamma, actual in zip(GAMMAS, results):
+        assert actual.gamma == gamma
+        assert_same_result(actual, value_iteration(mdp, gamma=gamma, tol=1e-8))
+
+
+def test_batched_value_iteration_parameters(composition):
+    """Every reward and probability scenario gives the same result as a separate run."""
+    mdp = ArrayMDP.from_mdp(composition)
+    # the second scenario doubles the costs and makes every transition deterministic
+    scaled = copy.deepcopy(mdp)
+    scaled.sa_rewards = 2.0 * mdp.sa_rewards
+    first_transitions = mdp.transition_ptr[:-1]
+    scaled.probs = np.zeros_like(mdp.probs)
+    scaled.probs[first_transitions] = 1.0
+    results = batched_value_iteration(
+        mdp,
+        sa_rewards=np.stack([mdp.sa_rewards, scaled.sa_rewards], axis=1),
+        probs=np.stack([mdp.probs, scaled.probs], axis=1),
+        tol=1e-8,
+    )
+    assert_same_result(results[0], value_iteration(mdp, tol=1e-8))
+    assert_same_result(results[1], value_iteration(scaled, tol=1e-8))
+
+
+def test_batched_value_iteration_max_iterations(composition):
+    """The scenarios that do not converge stop after max_iterations sweeps."""
+    mdp = ArrayMDP.from_mdp(composition)
+    results = batched_value_iteration(mdp, gammas=GAMMAS, tol=1e-8, max_iterations=20)
+    for gamma, actual in zip(GAMMAS, results):
+        expected = value_iteration(mdp, gamma=gamma, tol=1e-8, max_iterations=20)
+        assert actual.iterations <= 20
+        assert_same_result(actual, expected)
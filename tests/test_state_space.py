@@ -0,0 +1,66 @@
+"""Tests for the estimation of the size of a composition and the admission control."""
+import pytest
+
+from stochastic_service_composition.batched_composition import comp_mdp_batched
+from stochastic_service_composition.state_space import (
+    COMP_MDP,
+    EXPLICIT,
+    LAZY,
+    CompositionBudget,
+    admit,
+    estimate_state_space,
+)
+from tests.helpers import GAMMA
+
+
+def count_composition(dfa, services):
+    """Count the states, the state-action pairs and the transitions of the composition."""
+    mdp = comp_mdp_batched(dfa, services, GAMMA)
+    transitions = mdp.transitions.values()
+    return (
+        len(mdp.all_states),
+        sum(len(actions) for actions in transitions),
+        sum(len(next_states) for actions in transitions for next_states in actions.values()),
+    )
+
+
+def test_exact_estimate(sequential_target, community):
+    """When the BFS completes, the estimate is the size of the composition."""
+    estimate = estimate_state_space(sequential_target, community)
+    assert estimate.exact
+    assert (
+        estimate.nb_composition_states,
+        estimate.nb_state_actions,
+        estimate.nb_transitions,
+    ) == count_composition(sequential_target, community)
+
+
+def test_saturated_estimate(sequential_target, community):
+    """When the random walks reach every state, the estimate is the observed count."""
+    nb_states, _nb_state_actions, _nb_transitions = count_composition(
+        sequential_target, community
+    )
+    estimate = estimate_state_space(sequential_target, community, sample_limit=2, seed=0)
+    assert not estimate.exact
+    # the painters are correlated (the target paints twice), so the bound is loose
+    assert estimate.nb_composition_states_bound > nb_states
+    assert estimate.nb_composition_states == nb_states
+
+
+def test_admit(sequential_target, community):
+    """The first strategy within the budget is admitted; the lazy composition always fits."""
+    estimate = estimate_state_space(sequential_target, community)
+    budget = CompositionBudget(max_bytes=estimate.explicit_bytes() * 1.5)
+    decision = admit(estimate, budget, [COMP_MDP, EXPLICIT])
+    assert decision.strategy == EXPLICIT
+    assert list(decision.violations) == [COMP_MDP]
+    decision = admit(estimate, CompositionBudget(max_states=1), [COMP_MDP, EXPLICIT])
+    assert not decision.admitted
+    assert admit(estimate, CompositionBudget(max_states=1), [EXPLICIT, LAZY]).strategy == LAZY
+
+
+@pytest.mark.parametrize("use_bound", [False, True])
+def test_bound(sequential_target, community, use_bound):
+    """The upper bound is never below the estimate."""
+    estimate = estimate_state_space(sequential_target, community, sample_limit=2, seed=0)
+    assert estimate.states(use_bound) <= estimate.nb_composition_states_bound
@@ -0,0 +1,84 @@
+"""Tests for the decision diagrams and the symbolic composition engine."""
+import itertools
+
+import pytest
+
+from stochastic_service_composition.array_mdp import ArrayMDP
+from stochastic_service_composition.decision_diagrams import ADDManager
+from stochastic_service_composition.solvers import value_iteration
+from stochastic_service_composition.symbolic_composition import symbolic_value_iteration
+from tests.helpers import GAMMA
+
+NB_VARS = 4
+
+
+def assignments():
+    """Enumerate all the assignments to the variables."""
+    for bits in itertools.product([False, True], repeat=NB_VARS):
+        yield dict(enumerate(bits))
+
+
+@pytest.fixture
+def manager():
+    """Build a manager over a few variables."""
+    return ADDManager(NB_VARS)
+
+
+def test_multiply_sum_abstract(manager):
+    """The fused operation is the sum of the renamed product, times a constant."""
+    # f(x0, x1, x2, x3) and g(x0, x2), read on (x1, x3) through the renaming
+    f = manager.from_function([0, 1, 2, 3], lambda bits: 1.0 + bits[0] + 2 * bits[1] * bits[3])
+    g = manager.from_function([0, 2], lambda bits: 3.0 * bits[0] + bits[1])
+    mapping = {0: 1, 2: 3}
+    expected = manager.sum_abstract(manager.apply("*", f, manager.rename(g, mapping)), [1, 3])
+    actual = manager.multiply_sum_abstract(f, g, [1, 3], mapping, scale=0.5)
+    for assignment in assignments():
+        assert manager.evaluate(actual, assignment) == pytest.approx(
+            0.5 * manager.evaluate(expected, assignment)
+        )
+
+
+def test_multiply_sum_abstract_missing_variables(manager):
+    """The variables that neither diagram depends on are summed out as well."""
+    f = manager.from_function([0], lambda bits: 2.0 if bits[0] else 1.0)
+    actual = manager.multiply_sum_abstract(f, manager.constant(1.0), [1, 2])
+    assert manager.evaluate(actual, {0: False}) == 4.0
+    assert manager.evaluate(actual, {0: True}) == 8.0
+
+
+def test_max_distance(manager):
+    """The distance is the maximum absolute difference over all the assignments."""
+    f = manager.from_function([0, 3], lambda bits: bits[0] - 2.0 * bits[1])
+    g = manager.from_function([1, 3], lambda bits: 0.5 * bits[0] + bits[1])
+    expected = max(
+        abs(manager.evaluate(f, assignment) - manager.evaluate(g, assignment))
+        for assignment in assignments()
+    )
+    assert manager.max_distance(f, g) == expected
+    assert manager.max_distance(f, f) == 0.0
+
+
+@pytest.mark.parametrize(
+    "dfa_name, services_name, composition_name",
+    [
+        ("target", "community", "composition"),
+        ("sequential_target", "failing_community", "failing_composition"),
+    ],
+)
+def test_symbolic_value_iteration(request, dfa_name, services_name, composition_name):
+    """The values, Q-values and sweeps are the ones of value_iteration on comp_mdp."""
+    dfa = request.getfixturevalue(dfa_name)
+    services = request.getfixturevalue(services_name)
+    mdp = ArrayMDP.from_mdp(request.getfixturevalue(composition_name))
+    expected = value_iteration(mdp, GAMMA, tol=1e-8)
+    actual = symbolic_value_iteration(dfa, services, GAMMA, tol=1e-8)
+    assert actual.iterations == expected.iterations
+    q_values = mdp.q_values(expected.values, GAMMA)
+    for state, value in expected.value_function().items():
+        assert actual.value(state) == pytest.approx(value, abs=1e-9)
+        index = mdp.state_index[state]
+        expected_q_values = {
+            mdp.actions[mdp.sa_actions[k]]: q_values[k]
+            for k in range(mdp.state_action_ptr[index], mdp.state_action_ptr[index + 1])
+        }
+        assert actual.q_values(state) == pytest.approx(expected_q_values, abs=1e-9)